@@ -0,0 +1,91 @@
+/**
+ * 内部API - 測定データ一括upsert
+ * 連携サービス専用、OAuth2 CC認証
+ * レコード単位の結果を返す（一部失敗を許容）
+ */
+import { NextRequest, NextResponse } from 'next/server'
+import { verifyOAuth2Token } from '@/lib/auth/oauth2'
+import { resolveOrderIds } from '@/lib/customers/resolver'
+import { validate, upsertMeasurementSchema } from '@/lib/validation/schemas'
+import { structuredLog } from '@/lib/audit/logger'
+import { bulkUpsert, MAX_BULK_RECORDS } from '@/lib/supabase/bulkUpsert'
+
+export async function POST(request: NextRequest) {
+  try {
+    // OAuth2 CC認証チェック
+    const authHeader = request.headers.get('authorization')
+    if (!authHeader?.startsWith('Bearer ')) {
+      return NextResponse.json(
+        { error: 'Unauthorized' },
+        { status: 401, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    const token = authHeader.substring(7)
+    const isValid = await verifyOAuth2Token(token)
+
+    if (!isValid) {
+      return NextResponse.json(
+        { error: 'Invalid token' },
+        { status: 401, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    const body = await request.json()
+    const records: any[] = body?.records
+
+    if (!Array.isArray(records) || records.length === 0 || records.length > MAX_BULK_RECORDS) {
+      return NextResponse.json(
+        { error: `records must be a non-empty array (max ${MAX_BULK_RECORDS})` },
+        { status: 400, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    // external_order_id からorder_idを一括解決（order_source_system単位）
+    const orderIdsBySource = new Map<string, Map<string, string>>()
+    const sources = Array.from(
+      new Set(records.filter((r) => r?.external_order_id && r?.order_source_system).map((r) => r.order_source_system))
+    )
+    for (const source of sources) {
+      const externalOrderIds = records
+        .filter((r) => r?.order_source_system === source)
+        .map((r) => r.external_order_id)
+      orderIdsBySource.set(source, await resolveOrderIds(externalOrderIds, source))
+    }
+
+    const results = await bulkUpsert(records, {
+      table: 'measurements',
+      idField: 'external_measurement_id',
+      entity: 'measurement',
+      validateRecord: (record, customerId) => {
+        let orderId = record.order_id || undefined
+        if (record.external_order_id && record.order_source_system) {
+          orderId = orderIdsBySource.get(record.order_source_system)?.get(record.external_order_id)
+        }
+        return validate(upsertMeasurementSchema, {
+          ...record,
+          customer_id: customerId,
+          order_id: orderId,
+        })
+      },
+    })
+
+    const failed = results.filter((r) => r.status === 'failed').length
+
+    structuredLog('info', 'Bulk measurement upsert completed', {
+      total: records.length,
+      succeeded: records.length - failed,
+      failed,
+    })
+
+    return NextResponse.json(
+      { results, succeeded: records.length - failed, failed },
+      { status: 200, headers: { 'Cache-Control': 'no-store' } }
+    )
+  } catch (error) {
+    return NextResponse.json(
+      { error: 'Internal server error' },
+      { status: 500, headers: { 'Cache-Control': 'no-store' } }
+    )
+  }
+}
@@ -8,6 +8,8 @@ import { verifyOAuth2Token } from '@/lib/auth/oauth2'
 import { ensureCustomerId, resolveOrderId } from '@/lib/customers/resolver'
 import { validate, upsertMeasurementSchema } from '@/lib/validation/schemas'
 import { structuredLog } from '@/lib/audit/logger'
+import { AppError } from '@/lib/errors/handler'
+import { isPermanentDbError } from '@/lib/supabase/errors'
 
 export async function POST(request: NextRequest) {
   try {
@@ -72,9 +74,11 @@ export async function POST(request: NextRequest) {
       .select()
 
     if (error) {
+      // 制約違反・データ不正は422（再実行不要）、それ以外のDBエラーは503（再実行対象）
+      const permanent = isPermanentDbError(error)
       return NextResponse.json(
-        { error: error.message },
-        { status: 400, headers: { 'Cache-Control': 'no-store' } }
+        { error: error.message, permanent },
+        { status: permanent ? 422 : 503, headers: { 'Cache-Control': 'no-store' } }
       )
     }
 
@@ -85,6 +89,13 @@ export async function POST(request: NextRequest) {
       headers: { 'Cache-Control': 'no-store' }
     })
   } catch (error) {
+    // 顧客未登録（NotFoundError）等はそのステータスで返す
+    if (error instanceof AppError) {
+      return NextResponse.json(
+        { error: error.message },
+        { status: error.statusCode, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
     return NextResponse.json(
       { error: 'Internal server error' },
       { status: 500, headers: { 'Cache-Control': 'no-store' } }
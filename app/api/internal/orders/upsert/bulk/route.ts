@@ -0,0 +1,69 @@
+/**
+ * 内部API - 発注データ一括upsert
+ * 連携サービス専用、OAuth2 CC認証
+ * レコード単位の結果を返す（一部失敗を許容）
+ */
+import { NextRequest, NextResponse } from 'next/server'
+import { verifyOAuth2Token } from '@/lib/auth/oauth2'
+import { validate, upsertOrderSchema } from '@/lib/validation/schemas'
+import { structuredLog } from '@/lib/audit/logger'
+import { bulkUpsert, MAX_BULK_RECORDS } from '@/lib/supabase/bulkUpsert'
+
+export async function POST(request: NextRequest) {
+  try {
+    // OAuth2 CC認証チェック
+    const authHeader = request.headers.get('authorization')
+    if (!authHeader?.startsWith('Bearer ')) {
+      return NextResponse.json(
+        { error: 'Unauthorized' },
+        { status: 401, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    const token = authHeader.substring(7)
+    const isValid = await verifyOAuth2Token(token)
+
+    if (!isValid) {
+      return NextResponse.json(
+        { error: 'Invalid token' },
+        { status: 401, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    const body = await request.json()
+    const records: any[] = body?.records
+
+    if (!Array.isArray(records) || records.length === 0 || records.length > MAX_BULK_RECORDS) {
+      return NextResponse.json(
+        { error: `records must be a non-empty array (max ${MAX_BULK_RECORDS})` },
+        { status: 400, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
+    const results = await bulkUpsert(records, {
+      table: 'orders',
+      idField: 'external_order_id',
+      entity: 'order',
+      validateRecord: (record, customerId) =>
+        validate(upsertOrderSchema, { ...record, customer_id: customerId }),
+    })
+
+    const failed = results.filter((r) => r.status === 'failed').length
+
+    structuredLog('info', 'Bulk order upsert completed', {
+      total: records.length,
+      succeeded: records.length - failed,
+      failed,
+    })
+
+    return NextResponse.json(
+      { results, succeeded: records.length - failed, failed },
+      { status: 200, headers: { 'Cache-Control': 'no-store' } }
+    )
+  } catch (error) {
+    return NextResponse.json(
+      { error: 'Internal server error' },
+      { status: 500, headers: { 'Cache-Control': 'no-store' } }
+    )
+  }
+}
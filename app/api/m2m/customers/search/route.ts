@@ -79,6 +79,19 @@ export async function GET(request: NextRequest) {
     const limit = Math.min(parseInt(searchParams.get('limit') || '50'), 100)
     const fieldsParam = searchParams.get('fields')
 
+    // codesパラメータ（カンマ区切り、完全一致の一括解決用、最大100件）
+    const codesParam = searchParams.get('codes')
+    const codes = codesParam
+      ? Array.from(new Set(codesParam.split(',').map(c => c.trim()).filter(Boolean)))
+      : []
+
+    if (codes.length > 100) {
+      return NextResponse.json(
+        { error: 'Too many codes (max 100)' },
+        { status: 400, headers: { 'Cache-Control': 'no-store' } }
+      )
+    }
+
     // デフォルトフィールド（PIIを含まない）
     const defaultFields = 'id, name, code, created_at'
     
@@ -124,7 +137,9 @@ export async function GET(request: NextRequest) {
       .is('deleted_at', null)
       .limit(limit)
 
-    if (q) {
+    if (codes.length > 0) {
+      query = query.in('code', codes).limit(codes.length)
+    } else if (q) {
       query = query.textSearch('search_vector', q)
     }
 
@@ -161,6 +176,7 @@ export async function GET(request: NextRequest) {
       ip: clientIP,
       resultCount: data.length,
       query: q,
+      codeCount: codes.length,
       hasUserContext: !!userContext
     })
 
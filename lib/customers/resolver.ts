@@ -69,3 +69,84 @@ export async function resolveOrderId(
   return data?.id || null
 }
 
+
+/**
+ * 顧客コード（またはID）を一括解決（一括upsert用）
+ * 
+ * @param codesOrIds 顧客コードまたはIDの一覧（重複可）
+ * @returns コード/ID → 顧客IDのマップ（見つからないものは含まない）
+ */
+export async function resolveCustomerIdsByCodes(
+  codesOrIds: string[]
+): Promise<Map<string, string>> {
+  const uuidRegex = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i
+  const resolved = new Map<string, string>()
+  const codes: string[] = []
+
+  for (const value of Array.from(new Set(codesOrIds.filter(Boolean)))) {
+    if (uuidRegex.test(value)) {
+      resolved.set(value, value)
+    } else {
+      codes.push(value)
+    }
+  }
+
+  if (codes.length === 0) {
+    return resolved
+  }
+
+  const supabase = createServerClient()
+
+  const { data, error } = await supabase
+    .from('customers')
+    .select('id, code')
+    .in('code', codes)
+    .is('deleted_at', null)
+
+  if (error) {
+    throw error
+  }
+
+  for (const row of data || []) {
+    resolved.set(row.code, row.id)
+  }
+
+  return resolved
+}
+
+/**
+ * 外部発注IDから発注IDを一括解決
+ * 
+ * @param externalOrderIds 外部発注IDの一覧
+ * @param sourceSystem ソースシステム識別子
+ * @returns 外部発注ID → 発注IDのマップ
+ */
+export async function resolveOrderIds(
+  externalOrderIds: string[],
+  sourceSystem: string
+): Promise<Map<string, string>> {
+  const resolved = new Map<string, string>()
+  const ids = Array.from(new Set(externalOrderIds.filter(Boolean)))
+
+  if (ids.length === 0) {
+    return resolved
+  }
+
+  const supabase = createServerClient()
+
+  const { data, error } = await supabase
+    .from('orders')
+    .select('id, external_order_id')
+    .in('external_order_id', ids)
+    .eq('source_system', sourceSystem)
+
+  if (error) {
+    throw error
+  }
+
+  for (const row of data || []) {
+    resolved.set(row.external_order_id, row.id)
+  }
+
+  return resolved
+}
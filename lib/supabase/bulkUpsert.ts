@@ -0,0 +1,176 @@
+/**
+ * 内部API 一括upsertの共通処理
+ * 顧客解決→検証→同一キーの後勝ち→一括upsert（失敗時は分割して失敗レコードを特定）
+ */
+import { createServerClient } from '@/lib/supabase/server'
+import { isPermanentDbError } from '@/lib/supabase/errors'
+import { resolveCustomerIdsByCodes } from '@/lib/customers/resolver'
+import { validate } from '@/lib/validation/schemas'
+import { structuredLog } from '@/lib/audit/logger'
+
+// 1リクエストあたりの最大レコード数
+export const MAX_BULK_RECORDS = 500
+
+// 分割再実行を含む1リクエストあたりのupsertクエリ数の上限（超過分は一時的な失敗として返す）
+const MAX_UPSERT_QUERIES = 32
+
+export type BulkUpsertResult<K extends string> = {
+  index: number
+  status: 'upserted' | 'failed'
+  id?: string
+  error?: string
+  // 再実行しても結果が変わらない失敗か（顧客なし・検証エラー・制約違反）
+  permanent?: boolean
+} & Partial<Record<K, string>>
+
+export interface BulkUpsertOptions<K extends string> {
+  // upsert先テーブル
+  table: string
+  // 外部ID列（source_system と組で一意）
+  idField: K
+  // ログ用の種別名（'order' | 'measurement'）
+  entity: string
+  // 解決済みの顧客IDでレコードを検証
+  validateRecord: (record: any, customerId: string) => ReturnType<typeof validate>
+}
+
+interface BulkEntry {
+  index: number
+  row: any
+}
+
+/**
+ * レコードを一括upsertし、入力順のレコード単位の結果を返す（一部失敗を許容）
+ *
+ * 一括upsertが制約違反等で失敗した場合は二分割して再実行し、失敗レコードを特定する
+ * 接続断・タイムアウト等の一時的な失敗は分割せず、対象レコードを一時的な失敗として返す
+ *
+ * @param records 入力レコード（customer_code または customer_id を含む）
+ * @param options テーブル・外部ID列・検証
+ * @returns レコード単位の結果（入力順）
+ */
+export async function bulkUpsert<K extends string>(
+  records: any[],
+  options: BulkUpsertOptions<K>
+): Promise<BulkUpsertResult<K>[]> {
+  const { table, idField, entity, validateRecord } = options
+  const keyOf = (row: any) => `${row.source_system}:${row[idField]}`
+
+  const results: BulkUpsertResult<K>[] = new Array(records.length)
+  const setResult = (
+    index: number,
+    externalId: string | undefined,
+    result: Omit<BulkUpsertResult<K>, 'index' | K>
+  ) => {
+    results[index] = { index, [idField]: externalId, ...result } as BulkUpsertResult<K>
+  }
+
+  // customer_code/customer_id を一括解決
+  const customerIds = await resolveCustomerIdsByCodes(
+    records.map((r) => r?.customer_id || r?.customer_code)
+  )
+
+  // 同一キーは後勝ち（1回のupsertで同じ行を2度更新できないため）
+  const rowsByKey = new Map<string, BulkEntry>()
+  // 入力index → 検証済みキー（後勝ちで上書きされたレコードの結果参照に使う）
+  const keyByIndex = new Map<number, string>()
+
+  records.forEach((record, index) => {
+    const codeOrId = record?.customer_id || record?.customer_code
+    const customerId = customerIds.get(codeOrId)
+    if (!customerId) {
+      setResult(index, record?.[idField], {
+        status: 'failed',
+        error: `Customer not found with code: ${codeOrId}`,
+        permanent: true,
+      })
+      return
+    }
+
+    const validation = validateRecord(record, customerId)
+    if (!validation.success) {
+      setResult(index, record?.[idField], {
+        status: 'failed',
+        error: validation.errors.errors.map((e) => `${e.path.join('.')}: ${e.message}`).join('; '),
+        permanent: true,
+      })
+      return
+    }
+
+    const key = keyOf(validation.data)
+    rowsByKey.set(key, { index, row: validation.data })
+    keyByIndex.set(index, key)
+  })
+
+  const supabase = createServerClient()
+  let queriesLeft = MAX_UPSERT_QUERIES
+
+  const settle = async (batch: BulkEntry[]): Promise<void> => {
+    if (queriesLeft <= 0) {
+      for (const entry of batch) {
+        setResult(entry.index, entry.row[idField], {
+          status: 'failed',
+          error: 'Not upserted: retry limit for this request reached',
+          permanent: false,
+        })
+      }
+      return
+    }
+    queriesLeft -= 1
+
+    const { data, error } = await supabase
+      .from(table)
+      .upsert(batch.map((e) => e.row), {
+        onConflict: `${idField},source_system`,
+        ignoreDuplicates: false,
+      })
+      .select(`id, ${idField}, source_system`)
+
+    if (!error) {
+      const idByKey = new Map<string, string>((data || []).map((row: any) => [keyOf(row), row.id]))
+      for (const entry of batch) {
+        setResult(entry.index, entry.row[idField], {
+          status: 'upserted',
+          id: idByKey.get(keyOf(entry.row)),
+        })
+      }
+      return
+    }
+
+    const permanent = isPermanentDbError(error)
+    if (batch.length === 1 || !permanent) {
+      for (const entry of batch) {
+        setResult(entry.index, entry.row[idField], {
+          status: 'failed',
+          error: error.message,
+          permanent,
+        })
+      }
+      return
+    }
+
+    // 失敗レコードを含む側だけがさらに分割される
+    structuredLog('warn', `Bulk ${entity} upsert failed, retrying in halves`, {
+      error: error.message,
+      count: batch.length,
+    })
+    const middle = Math.ceil(batch.length / 2)
+    await settle(batch.slice(0, middle))
+    await settle(batch.slice(middle))
+  }
+
+  const entries = Array.from(rowsByKey.values())
+  if (entries.length > 0) {
+    await settle(entries)
+  }
+
+  // 後勝ちで上書きされたレコード
+  for (const [index, key] of Array.from(keyByIndex.entries())) {
+    const winner = rowsByKey.get(key)
+    if (winner && winner.index !== index) {
+      results[index] = { ...results[winner.index], index }
+    }
+  }
+
+  return results
+}
@@ -0,0 +1,14 @@
+/**
+ * Supabase（PostgREST）エラーの分類
+ * 連携サービスが再実行すべき失敗かを判定する
+ */
+
+/**
+ * 再実行しても結果が変わらないDBエラーか
+ * 22xxx（データ例外: 型・範囲）と 23xxx（整合性制約違反）のみ恒久的とし、
+ * 接続断・タイムアウト・ロック競合などは一時的とみなす
+ */
+export function isPermanentDbError(error: { code?: string } | null | undefined): boolean {
+  const code = error?.code ?? ''
+  return code.startsWith('22') || code.startsWith('23')
+}
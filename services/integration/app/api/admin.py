@@ -0,0 +1,71 @@
+"""
+管理エンドポイント
+遅延リクエスト標本の参照・プロファイル設定の実行時変更、同期デッドレターの参照
+"""
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+
+from ..core.config import get_settings
+from ..core.timing import PROFILERS, slow_request_sampler
+from ..services.checkpoint_store import checkpoint_store
+
+router = APIRouter()
+settings = get_settings()
+
+
+class TimingConfig(BaseModel):
+    """遅延リクエスト標本化の設定変更（未指定の項目は変更しない）"""
+    slow_threshold_seconds: Optional[float] = Field(None, gt=0)
+    profile_sample_rate: Optional[float] = Field(None, ge=0, le=1)
+    profiler: Optional[str] = Field(None, description=" | ".join(PROFILERS))
+    clear_samples: bool = False
+
+
+def _authorize(token: Optional[str]):
+    """管理トークン検証（未設定時は管理エンドポイント自体を無効化）"""
+    if not settings.admin_api_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, settings.admin_api_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/timing")
+async def get_timing(x_admin_token: Optional[str] = Header(None)):
+    """現在の設定と遅延リクエスト標本（新しい順）"""
+    _authorize(x_admin_token)
+    return {**slow_request_sampler.stats(), "recent": slow_request_sampler.samples()}
+
+
+@router.post("/timing")
+async def configure_timing(config: TimingConfig, x_admin_token: Optional[str] = Header(None)):
+    """
+    標本化・プロファイル設定の変更
+    
+    例: {"profile_sample_rate": 0.1, "profiler": "cprofile", "slow_threshold_seconds": 0.5}
+    """
+    _authorize(x_admin_token)
+    try:
+        slow_request_sampler.configure(
+            slow_threshold=config.slow_threshold_seconds,
+            profile_sample_rate=config.profile_sample_rate,
+            profiler=config.profiler,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if config.clear_samples:
+        slow_request_sampler.clear()
+    return slow_request_sampler.stats()
+
+
+@router.get("/sync/dead-letters")
+async def get_sync_dead_letters(
+    source: Optional[str] = Query(None, description="ExternalOrdering | ExternalMeasurement"),
+    limit: int = Query(100, ge=1, le=1000),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """補助Pull同期で恒久的に失敗したレコード（最終失敗の新しい順）"""
+    _authorize(x_admin_token)
+    return {"dead_letters": await checkpoint_store.dead_letters(source, limit)}
@@ -3,15 +3,306 @@
 Webhook欠損時の補完用（手動/定期実行）
 """
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
 import structlog
 
-from ..core.oauth2 import oauth2_client
+from ..core.config import get_settings
+from ..core.retry import PermanentFailure, is_permanent_failure
+from ..core.timing import stage
+from ..services.checkpoint_store import checkpoint_store
 from ..services.external_api import external_api_client
 from ..services.customer_api import customer_api_client
+from ..services.resolver import resolve_customer_ids
 
 router = APIRouter()
 logger = structlog.get_logger()
+settings = get_settings()
+
+
+def _build_order_data(
+    order: Dict[str, Any], customer_ids: Dict[str, str]
+) -> Dict[str, Any]:
+    """外部発注データ→内部upsertデータ変換"""
+    customer_id = customer_ids.get(order.get("customer_code"))
+    if not customer_id:
+        raise PermanentFailure(
+            f"Customer not found with code: {order.get('customer_code')}"
+        )
+    if not order.get("external_order_id"):
+        raise PermanentFailure("external_order_id is required")
+    
+    return {
+        "customer_id": customer_id,
+        "external_order_id": order["external_order_id"],
+        "source_system": "ExternalOrdering",
+        "title": order.get("title"),
+        "status": order.get("status"),
+        "ordered_at": order.get("ordered_at"),
+    }
+
+
+def _build_measurement_data(
+    measurement: Dict[str, Any], customer_ids: Dict[str, str]
+) -> Dict[str, Any]:
+    """外部測定データ→内部upsertデータ変換"""
+    customer_id = customer_ids.get(measurement.get("customer_code"))
+    if not customer_id:
+        raise PermanentFailure(
+            f"Customer not found with code: {measurement.get('customer_code')}"
+        )
+    if not measurement.get("external_measurement_id"):
+        raise PermanentFailure("external_measurement_id is required")
+    
+    external_order_id = measurement.get("external_order_id")
+    return {
+        "customer_id": customer_id,
+        "external_order_id": external_order_id,  # 内部APIで解決
+        "order_source_system": "ExternalOrdering" if external_order_id else None,
+        "external_measurement_id": measurement["external_measurement_id"],
+        "source_system": "ExternalMeasurement",
+        "summary": measurement.get("summary"),
+        "measured_at": measurement.get("measured_at"),
+    }
+
+
+async def _run_upserts(
+    items: List[Dict[str, Any]],
+    upsert_one: Callable[[Dict[str, Any]], Awaitable[Any]],
+    id_field: str,
+    failure_event: str,
+    concurrency: int,
+) -> tuple[int, int, List[Dict[str, Any]]]:
+    """
+    ページ内のupsertを同時実行数を制限して並列実行
+
+    Returns:
+        (processed, failed, errors)  errorsは入力順（permanent: 再実行しても変わらない失敗か）
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                await upsert_one(item)
+                return None
+            except Exception as e:
+                logger.error(
+                    failure_event,
+                    **{id_field: item.get(id_field)},
+                    error=str(e),
+                )
+                return {
+                    id_field: item.get(id_field),
+                    "error": str(e),
+                    "permanent": is_permanent_failure(e),
+                }
+
+    results = await asyncio.gather(*(run(item) for item in items))
+    errors = [r for r in results if r is not None]
+    return len(items) - len(errors), len(errors), errors
+
+
+async def _run_bulk_upserts(
+    items: List[Dict[str, Any]],
+    build: Callable[[Dict[str, Any]], Dict[str, Any]],
+    upsert_bulk: Callable[..., Awaitable[List[Dict[str, Any]]]],
+    id_field: str,
+    failure_event: str,
+    concurrency: int,
+) -> tuple[int, int, List[Dict[str, Any]]]:
+    """
+    ページを一括upsert APIで反映（変換失敗分は送信せずエラー扱い）
+
+    Returns:
+        (processed, failed, errors)  errorsは入力順（permanent: 再実行しても変わらない失敗か）
+    """
+    errors_by_index: Dict[int, Dict[str, Any]] = {}
+    records: List[Dict[str, Any]] = []
+    record_indexes: List[int] = []
+
+    for index, item in enumerate(items):
+        try:
+            records.append(build(item))
+            record_indexes.append(index)
+        except Exception as e:
+            errors_by_index[index] = {
+                id_field: item.get(id_field),
+                "error": str(e),
+                "permanent": is_permanent_failure(e),
+            }
+
+    if records:
+        results = await upsert_bulk(records, concurrency=concurrency)
+        for result in results:
+            if result.get("status") != "upserted":
+                index = record_indexes[result["index"]]
+                errors_by_index[index] = {
+                    id_field: items[index].get(id_field),
+                    "error": result.get("error"),
+                    "permanent": result.get("permanent", False),
+                }
+
+    errors = [errors_by_index[i] for i in sorted(errors_by_index)]
+    for error in errors:
+        logger.error(failure_event, **error)
+    return len(items) - len(errors), len(errors), errors
+
+
+def _page_errors(errors: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """単一ページ同期の応答用エラー（permanent はチェックポイント判定用のため含めない）"""
+    if not errors:
+        return None
+    return [{k: v for k, v in error.items() if k != "permanent"} for error in errors]
+
+
+async def _sync_orders_page(
+    orders: List[Dict[str, Any]], concurrency: int, bulk: bool
+) -> tuple[int, int, List[Dict[str, Any]]]:
+    """発注データ1ページ分を反映"""
+    # ページ内の顧客コードを一括解決
+    with stage("resolve"):
+        customer_ids = await resolve_customer_ids(
+            order.get("customer_code") for order in orders
+        )
+    
+    # 顧客管理API経由でupsert（同時実行数制限付き）
+    with stage("upsert"):
+        if bulk:
+            return await _run_bulk_upserts(
+                orders,
+                lambda order: _build_order_data(order, customer_ids),
+                customer_api_client.upsert_orders_bulk,
+                id_field="external_order_id",
+                failure_event="order_sync_failed",
+                concurrency=concurrency,
+            )
+        return await _run_upserts(
+            orders,
+            lambda order: customer_api_client.upsert_order(
+                _build_order_data(order, customer_ids)
+            ),
+            id_field="external_order_id",
+            failure_event="order_sync_failed",
+            concurrency=concurrency,
+        )
+
+
+async def _sync_measurements_page(
+    measurements: List[Dict[str, Any]], concurrency: int, bulk: bool
+) -> tuple[int, int, List[Dict[str, Any]]]:
+    """測定データ1ページ分を反映"""
+    # ページ内の顧客コードを一括解決
+    with stage("resolve"):
+        customer_ids = await resolve_customer_ids(
+            measurement.get("customer_code") for measurement in measurements
+        )
+    
+    # 顧客管理API経由でupsert（同時実行数制限付き）
+    with stage("upsert"):
+        if bulk:
+            return await _run_bulk_upserts(
+                measurements,
+                lambda measurement: _build_measurement_data(measurement, customer_ids),
+                customer_api_client.upsert_measurements_bulk,
+                id_field="external_measurement_id",
+                failure_event="measurement_sync_failed",
+                concurrency=concurrency,
+            )
+        return await _run_upserts(
+            measurements,
+            lambda measurement: customer_api_client.upsert_measurement(
+                _build_measurement_data(measurement, customer_ids)
+            ),
+            id_field="external_measurement_id",
+            failure_event="measurement_sync_failed",
+            concurrency=concurrency,
+        )
+
+
+async def _sync_all_pages(
+    pages: AsyncGenerator[Tuple[int, List[Dict[str, Any]]], None],
+    sync_page: Callable[[List[Dict[str, Any]]], Awaitable[tuple[int, int, List[Dict[str, Any]]]]],
+    event: str,
+    id_field: str,
+    source: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    updated_since のウィンドウ全体を最終ページまで同期
+    保持するのは処理中ページと先読みページのみ（エラー詳細は上限件数まで）
+    source指定時は一時的な失敗のないページまでチェックポイントを進める
+    （恒久的な失敗はデッドレターへ記録して先へ進み、一時的な失敗のあるページで止める）
+    """
+    committing = source is not None
+    processed = 0
+    failed = 0
+    pages_synced = 0
+    errors: List[Dict[str, Any]] = []
+    max_errors = settings.SYNC_MAX_REPORTED_ERRORS
+
+    # 途中で例外になってもページ取得（先読み中のリクエスト）を確実に閉じる
+    async with aclosing(pages):
+        async for page, items in pages:
+            page_processed, page_failed, page_errors = await sync_page(items)
+            processed += page_processed
+            failed += page_failed
+            pages_synced += 1
+            errors.extend(page_errors[:max_errors - len(errors)])
+        
+            retryable = sum(1 for error in page_errors if not error.get("permanent"))
+            if committing and retryable == 0:
+                if page_errors:
+                    items_by_id = {item.get(id_field): item for item in items}
+                    await checkpoint_store.record_dead_letters(
+                        source,
+                        page,
+                        [
+                            {
+                                "item_id": error[id_field],
+                                "error": error["error"],
+                                "payload": items_by_id.get(error[id_field]),
+                            }
+                            for error in page_errors
+                        ],
+                    )
+                max_updated_at = max(
+                    (item["updated_at"] for item in items if item.get("updated_at")),
+                    default=None,
+                )
+                await checkpoint_store.commit_page(source, page, max_updated_at)
+            elif committing:
+                # 一時的な失敗のあるページ以降は進めない（次回はこのページから再実行）
+                committing = False
+                logger.warning(
+                    "sync_checkpoint_held", source=source, page=page, retryable=retryable
+                )
+        
+            logger.info(
+                event,
+                processed=page_processed,
+                failed=page_failed,
+                page=page,
+            )
+
+    logger.info(
+        f"{event}_all_pages",
+        processed=processed,
+        failed=failed,
+        pages=pages_synced,
+    )
+
+    if committing:
+        await checkpoint_store.complete_window(source)
+
+    return {
+        "status": "completed",
+        "processed": processed,
+        "failed": failed,
+        "pages": pages_synced,
+        "errors": errors if errors else None,
+        "errors_truncated": failed > len(errors),
+    }
 
 
 @router.post("/orders")
@@ -21,14 +312,43 @@ async def sync_orders(
     ),
     page: int = Query(1, ge=1, description="ページ番号"),
     page_size: int = Query(100, ge=1, le=500, description="ページサイズ"),
+    concurrency: Optional[int] = Query(
+        None, ge=1, le=64, description="upsert同時実行数（未指定時は設定値）"
+    ),
+    bulk: bool = Query(False, description="一括upsert APIを使用"),
+    all_pages: bool = Query(
+        False,
+        description="pageから最終ページまで連続で同期（次ページ先読み）。"
+        "updated_since省略時はチェックポイントから再開",
+    ),
 ):
     """
     発注データの補助Pull同期
     Webhook欠損時の補完用
     """
     try:
-        # OAuth2トークン取得（認証チェック）
-        token = await oauth2_client.get_token()
+        concurrency = concurrency or settings.SYNC_UPSERT_CONCURRENCY
+        
+        if all_pages:
+            source = None
+            if updated_since is None:
+                # チェックポイント（前回の到達点）から再開
+                window = await checkpoint_store.begin_window("ExternalOrdering")
+                updated_since = window["updated_since"]
+                page = window["start_page"]
+                source = "ExternalOrdering"
+            
+            return await _sync_all_pages(
+                external_api_client.iter_order_pages(
+                    updated_since=updated_since,
+                    page_size=page_size,
+                    start_page=page,
+                ),
+                lambda items: _sync_orders_page(items, concurrency, bulk),
+                event="orders_synced",
+                id_field="external_order_id",
+                source=source,
+            )
         
         # 外部APIから差分取得
         orders = await external_api_client.fetch_orders(
@@ -37,50 +357,21 @@ async def sync_orders(
             page_size=page_size,
         )
         
-        # 顧客管理API経由でupsert
-        processed = 0
-        failed = 0
-        errors = []
-        
-        for order in orders:
-            try:
-                # TODO: customer_code → customer_id 変換
-                order_data = {
-                    "customer_id": "TODO",
-                    "external_order_id": order["external_order_id"],
-                    "source_system": "ExternalOrdering",
-                    "title": order.get("title"),
-                    "status": order.get("status"),
-                    "ordered_at": order.get("ordered_at"),
-                }
-                
-                await customer_api_client.upsert_order(order_data)
-                processed += 1
-                
-            except Exception as e:
-                failed += 1
-                errors.append({
-                    "external_order_id": order.get("external_order_id"),
-                    "error": str(e),
-                })
-                logger.error(
-                    "order_sync_failed",
-                    external_order_id=order.get("external_order_id"),
-                    error=str(e),
-                )
+        processed, failed, errors = await _sync_orders_page(orders, concurrency, bulk)
         
         logger.info(
             "orders_synced",
             processed=processed,
             failed=failed,
             page=page,
+            concurrency=concurrency,
         )
         
         return {
             "status": "completed",
             "processed": processed,
             "failed": failed,
-            "errors": errors if errors else None,
+            "errors": _page_errors(errors),
         }
         
     except Exception as e:
@@ -95,14 +386,43 @@ async def sync_measurements(
     ),
     page: int = Query(1, ge=1, description="ページ番号"),
     page_size: int = Query(100, ge=1, le=500, description="ページサイズ"),
+    concurrency: Optional[int] = Query(
+        None, ge=1, le=64, description="upsert同時実行数（未指定時は設定値）"
+    ),
+    bulk: bool = Query(False, description="一括upsert APIを使用"),
+    all_pages: bool = Query(
+        False,
+        description="pageから最終ページまで連続で同期（次ページ先読み）。"
+        "updated_since省略時はチェックポイントから再開",
+    ),
 ):
     """
     測定データの補助Pull同期
     Webhook欠損時の補完用
     """
     try:
-        # OAuth2トークン取得（認証チェック）
-        token = await oauth2_client.get_token()
+        concurrency = concurrency or settings.SYNC_UPSERT_CONCURRENCY
+        
+        if all_pages:
+            source = None
+            if updated_since is None:
+                # チェックポイント（前回の到達点）から再開
+                window = await checkpoint_store.begin_window("ExternalMeasurement")
+                updated_since = window["updated_since"]
+                page = window["start_page"]
+                source = "ExternalMeasurement"
+            
+            return await _sync_all_pages(
+                external_api_client.iter_measurement_pages(
+                    updated_since=updated_since,
+                    page_size=page_size,
+                    start_page=page,
+                ),
+                lambda items: _sync_measurements_page(items, concurrency, bulk),
+                event="measurements_synced",
+                id_field="external_measurement_id",
+                source=source,
+            )
         
         # 外部APIから差分取得
         measurements = await external_api_client.fetch_measurements(
@@ -111,54 +431,23 @@ async def sync_measurements(
             page_size=page_size,
         )
         
-        # 顧客管理API経由でupsert
-        processed = 0
-        failed = 0
-        errors = []
-        
-        for measurement in measurements:
-            try:
-                # TODO: customer_code → customer_id 変換
-                # TODO: external_order_id → order_id 変換
-                measurement_data = {
-                    "customer_id": "TODO",
-                    "order_id": None,
-                    "external_measurement_id": measurement["external_measurement_id"],
-                    "source_system": "ExternalMeasurement",
-                    "summary": measurement.get("summary"),
-                    "measured_at": measurement.get("measured_at"),
-                }
-                
-                await customer_api_client.upsert_measurement(measurement_data)
-                processed += 1
-                
-            except Exception as e:
-                failed += 1
-                errors.append({
-                    "external_measurement_id": measurement.get("external_measurement_id"),
-                    "error": str(e),
-                })
-                logger.error(
-                    "measurement_sync_failed",
-                    external_measurement_id=measurement.get("external_measurement_id"),
-                    error=str(e),
-                )
+        processed, failed, errors = await _sync_measurements_page(measurements, concurrency, bulk)
         
         logger.info(
             "measurements_synced",
             processed=processed,
             failed=failed,
             page=page,
+            concurrency=concurrency,
         )
         
         return {
             "status": "completed",
             "processed": processed,
             "failed": failed,
-            "errors": errors if errors else None,
+            "errors": _page_errors(errors),
         }
         
     except Exception as e:
         logger.error("measurements_sync_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
-
@@ -2,24 +2,44 @@
 Webhook受信エンドポイント
 Webhook-first、署名検証、冪等性担保
 """
+import asyncio
+from datetime import datetime
+from functools import partial
+
 from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
 import structlog
 
 from ..core.config import get_settings
 from ..core.hmac_validator import HMACValidator
-from ..core.idempotency import idempotency_store
+from ..core.idempotency import (
+    RESERVE_DONE,
+    RESERVE_IN_PROGRESS,
+    RESERVE_NEW,
+    idempotency_store,
+)
+from ..core.metrics import webhook_stage_seconds
+from ..core.timing import stage
+from ..core.request_body import decode_json, decode_model, read_body_limited, split_ndjson
+from ..core.retry import deadline, is_permanent_failure
 from ..services.customer_api import customer_api_client
-from ..services.resolver import ensure_customer_id
+from ..services.resolver import ensure_customer_id, resolve_customer_ids
 from ..services.job_tracker import job_tracker
+from ..services.keyed_dispatcher import SUPERSEDED, keyed_dispatcher
+from ..services.webhook_queue import QueueFullError, webhook_worker_pool
 
 router = APIRouter()
 logger = structlog.get_logger()
 settings = get_settings()
 
 # HMAC検証インスタンス
-hmac_validator = HMACValidator(settings.webhook_secret)
+hmac_validator = HMACValidator(
+    settings.webhook_secret,
+    previous_secrets=settings.webhook_previous_secrets,
+    offload_threshold_bytes=settings.HMAC_OFFLOAD_THRESHOLD_BYTES,
+)
 
 
 class OrderWebhookPayload(BaseModel):
@@ -29,6 +49,7 @@ class OrderWebhookPayload(BaseModel):
     title: str | None = None
     status: str | None = None
     ordered_at: str | None = None
+    updated_at: str | None = Field(None, description="更新日時（同一発注の後勝ち判定）")
     metadata: Dict[str, Any] | None = None
 
 
@@ -39,9 +60,383 @@ class MeasurementWebhookPayload(BaseModel):
     external_order_id: str | None = None
     summary: Dict[str, Any] | None = None
     measured_at: str | None = None
+    updated_at: str | None = Field(None, description="更新日時（同一測定の後勝ち判定）")
     metadata: Dict[str, Any] | None = None
 
 
+class BatchWebhookEvent(BaseModel):
+    """バッチWebhookの1イベント"""
+    event_id: str = Field(..., description="イベントID")
+    event_type: Literal["orders.updated", "measurements.updated"]
+    data: Dict[str, Any] = Field(..., description="単体Webhookと同じペイロード")
+
+
+# event_type → (ペイロードモデル, ジョブ種別)
+_BATCH_EVENT_TYPES = {
+    "orders.updated": (OrderWebhookPayload, "webhook_order"),
+    "measurements.updated": (MeasurementWebhookPayload, "webhook_measurement"),
+}
+
+
+def _event_version(updated_at: Optional[str], timestamp: Optional[str] = None) -> Optional[float]:
+    """
+    後勝ち判定用のversion（epoch秒）
+    ペイロードの updated_at を優先し、なければ署名タイムスタンプ（送信時刻）を使う
+    """
+    if updated_at:
+        try:
+            return datetime.fromisoformat(updated_at).timestamp()
+        except ValueError:
+            pass
+    if timestamp:
+        try:
+            return float(timestamp)
+        except ValueError:
+            pass
+    return None
+
+
+def _in_progress_error(event_type: str, event_id: str) -> HTTPException:
+    """
+    処理中イベントの再送（409＋Retry-After）
+    処理が失敗すると冪等キーが解放されるため、確定前の再送は重複扱いせず後で再送させる
+    """
+    logger.info("webhook_in_progress", event_type=event_type, event_id=event_id)
+    return HTTPException(
+        status_code=409,
+        detail="Event is being processed",
+        headers={"Retry-After": str(settings.WEBHOOK_IN_PROGRESS_RETRY_AFTER_SECONDS)},
+    )
+
+
+def _dispatch_key(event_type: str, payload: Any) -> Tuple[str, str]:
+    """キー単位ディスパッチのキー（単体Webhook・バッチ共通）"""
+    if event_type == "orders.updated":
+        return ("ExternalOrdering", payload.external_order_id)
+    return ("ExternalMeasurement", payload.external_measurement_id)
+
+
+def _idempotency_unavailable_error() -> HTTPException:
+    """冪等ストアに到達できない（送信元に後で再送させる）"""
+    return HTTPException(
+        status_code=503,
+        detail="Idempotency store unavailable",
+        headers={"Retry-After": "5"},
+    )
+
+
+async def _reserve(event_id: str) -> str:
+    """
+    冪等キーの確保
+    
+    Raises:
+        HTTPException: 冪等ストアに到達できない（503）
+    """
+    try:
+        return await idempotency_store.reserve(event_id)
+    except Exception as e:
+        logger.error("idempotency_reserve_failed", event_id=event_id, error=str(e))
+        raise _idempotency_unavailable_error()
+
+
+async def _confirm_reservation(event_type: str, event_id: str) -> Optional[Dict[str, Any]]:
+    """
+    冪等キー確保の確定待ち（前段フィルタで即時受付した場合、他ワーカーが先に確保していれば処理しない）
+    
+    Returns:
+        処理済みなら重複応答、処理してよければ None
+    
+    Raises:
+        HTTPException: 他ワーカーが処理中（409）、冪等ストアに確保できない（503）
+    """
+    try:
+        reservation = await idempotency_store.confirm(event_id)
+    except Exception as e:
+        logger.error("idempotency_confirm_failed", event_id=event_id, error=str(e))
+        raise _idempotency_unavailable_error()
+    if reservation == RESERVE_IN_PROGRESS:
+        raise _in_progress_error(event_type, event_id)
+    if reservation == RESERVE_DONE:
+        logger.info("webhook_duplicate", event_type=event_type, event_id=event_id)
+        return {"status": "duplicate", "event_id": event_id}
+    return None
+
+
+def _order_record(payload: OrderWebhookPayload, customer_id: str) -> Dict[str, Any]:
+    """発注ペイロード→内部upsertデータ変換"""
+    return {
+        "customer_id": customer_id,
+        "external_order_id": payload.external_order_id,
+        "source_system": "ExternalOrdering",
+        "title": payload.title,
+        "status": payload.status,
+        "ordered_at": payload.ordered_at,
+    }
+
+
+def _measurement_record(
+    payload: MeasurementWebhookPayload, customer_id: str
+) -> Dict[str, Any]:
+    """測定ペイロード→内部upsertデータ変換"""
+    return {
+        "customer_id": customer_id,
+        "external_order_id": payload.external_order_id,  # 内部APIで解決
+        "order_source_system": "ExternalOrdering" if payload.external_order_id else None,
+        "external_measurement_id": payload.external_measurement_id,
+        "source_system": "ExternalMeasurement",
+        "summary": payload.summary,
+        "measured_at": payload.measured_at,
+    }
+
+
+async def _record_failure(
+    job_id: str,
+    event_id: str,
+    error: Exception,
+    attempts: Optional[int],
+):
+    """
+    反映失敗の記録
+    キューから取得したジョブの一時的な失敗は、上限回数までバックオフ後の再実行に回す
+    （冪等キーは受付時に確定済みのため、送信元の再送には頼らない）
+    """
+    if (
+        attempts is not None
+        and attempts < settings.JOB_MAX_ATTEMPTS
+        and not is_permanent_failure(error)
+    ):
+        delay = await job_tracker.retry_job(job_id, attempts, str(error))
+        logger.warning(
+            "webhook_processing_retry_scheduled",
+            event_id=event_id,
+            job_id=job_id,
+            attempts=attempts,
+            retry_in=round(delay, 2),
+            error=str(error),
+        )
+        return
+    
+    await job_tracker.update_job_status(job_id, "failed", str(error))
+    logger.error(
+        "webhook_processing_failed",
+        event_id=event_id,
+        job_id=job_id,
+        attempts=attempts,
+        error=str(error),
+    )
+
+
+async def process_order_event(
+    payload: OrderWebhookPayload,
+    event_id: str,
+    job_id: Optional[str] = None,
+    version: Optional[float] = None,
+    attempts: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    発注イベント反映（ジョブ記録→顧客ID解決→upsert）
+    同一発注への反映はキー単位で直列化し、より新しい更新があれば実行しない（superseded）
+    
+    Args:
+        attempts: ワーカーがキューから取得したジョブの実行回数（一時的な失敗は再実行に回す）
+    
+    Raises:
+        Exception: 反映失敗（ジョブはfailed、または再実行待ちのqueuedで記録済み）
+    """
+    # Integration job 作成（非同期モードはワーカーがリース取得済み）
+    if job_id is None:
+        job_id = await job_tracker.create_job(
+            job_type="webhook_order",
+            payload=payload.model_dump(),
+            event_id=event_id,
+            version=version,
+            status="running",
+        )
+    
+    try:
+        # customer_codeからcustomer_idを解決
+        with stage("resolve", webhook_stage_seconds):
+            customer_id = await ensure_customer_id(payload.customer_code)
+        
+        record = _order_record(payload, customer_id)
+        with stage("upsert", webhook_stage_seconds):
+            result = await keyed_dispatcher.submit(
+                _dispatch_key("orders.updated", payload),
+                version if version is not None else _event_version(payload.updated_at),
+                lambda: customer_api_client.upsert_order(record),
+            )
+        
+        # ジョブをsucceededに更新
+        await job_tracker.update_job_status(job_id, "succeeded")
+        
+        if result is SUPERSEDED:
+            return {"status": "superseded", "event_id": event_id, "job_id": job_id}
+        
+        logger.info(
+            "webhook_processed",
+            event_type="orders.updated",
+            event_id=event_id,
+            job_id=job_id,
+            external_order_id=payload.external_order_id,
+        )
+        
+        return {"status": "processed", "event_id": event_id, "job_id": job_id, "result": result}
+        
+    except Exception as e:
+        await _record_failure(job_id, event_id, e, attempts)
+        raise
+
+
+async def process_measurement_event(
+    payload: MeasurementWebhookPayload,
+    event_id: str,
+    job_id: Optional[str] = None,
+    version: Optional[float] = None,
+    attempts: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    測定イベント反映（ジョブ記録→顧客ID解決→upsert）
+    同一測定への反映はキー単位で直列化し、より新しい更新があれば実行しない（superseded）
+    
+    Args:
+        attempts: ワーカーがキューから取得したジョブの実行回数（一時的な失敗は再実行に回す）
+    
+    Raises:
+        Exception: 反映失敗（ジョブはfailed、または再実行待ちのqueuedで記録済み）
+    """
+    # Integration job 作成（非同期モードはワーカーがリース取得済み）
+    if job_id is None:
+        job_id = await job_tracker.create_job(
+            job_type="webhook_measurement",
+            payload=payload.model_dump(),
+            event_id=event_id,
+            version=version,
+            status="running",
+        )
+    
+    try:
+        # customer_codeからcustomer_idを解決
+        with stage("resolve", webhook_stage_seconds):
+            customer_id = await ensure_customer_id(payload.customer_code)
+        
+        record = _measurement_record(payload, customer_id)
+        with stage("upsert", webhook_stage_seconds):
+            result = await keyed_dispatcher.submit(
+                _dispatch_key("measurements.updated", payload),
+                version if version is not None else _event_version(payload.updated_at),
+                lambda: customer_api_client.upsert_measurement(record),
+            )
+        
+        # ジョブをsucceededに更新
+        await job_tracker.update_job_status(job_id, "succeeded")
+        
+        if result is SUPERSEDED:
+            return {"status": "superseded", "event_id": event_id, "job_id": job_id}
+        
+        logger.info(
+            "webhook_processed",
+            event_type="measurements.updated",
+            event_id=event_id,
+            job_id=job_id,
+            external_measurement_id=payload.external_measurement_id,
+        )
+        
+        return {"status": "processed", "event_id": event_id, "job_id": job_id, "result": result}
+        
+    except Exception as e:
+        await _record_failure(job_id, event_id, e, attempts)
+        raise
+
+
+async def _enqueue(
+    event_type: str,
+    event_id: str,
+    job_type: str,
+    payload: BaseModel,
+    version: Optional[float],
+) -> JSONResponse:
+    """
+    非同期モード: ジョブを永続キューへ登録してから202を返す（反映はワーカーがリース取得して実行）
+    受付時点で冪等キーを確定し、一時的な失敗はジョブを上限回数まで再実行する（JOB_MAX_ATTEMPTS）
+    バックログ上限超過・停止中は冪等キーを解放して503（送信元の再送を受け付けるため）
+    """
+    try:
+        webhook_worker_pool.admit(context={"event_type": event_type, "event_id": event_id})
+    except QueueFullError as e:
+        await idempotency_store.release(event_id)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "5"},
+        )
+    
+    try:
+        job_id = await job_tracker.create_job(
+            job_type=job_type,
+            payload=payload.model_dump(),
+            event_id=event_id,
+            version=version,
+        )
+    except Exception as e:
+        await idempotency_store.release(event_id)
+        raise HTTPException(status_code=500, detail=f"Job registration failed: {str(e)}")
+    
+    await idempotency_store.commit(event_id)
+    webhook_worker_pool.wakeup()
+    return JSONResponse(
+        status_code=202,
+        content={"status": "accepted", "event_id": event_id, "job_id": job_id},
+    )
+
+
+# ワーカープールが取得するジョブ種別
+WEBHOOK_JOB_TYPES = ["webhook_order", "webhook_measurement"]
+
+
+async def claim_webhook_jobs(limit: int) -> List[Tuple[Callable[[], Awaitable[Any]], Dict[str, Any]]]:
+    """
+    queuedのWebhookジョブをリース付きで取得し、ワーカーで実行する処理に変換
+    （他プロセスが受け付けた分・リース切れで回収された分も含む）
+    
+    Args:
+        limit: 最大取得件数
+    """
+    jobs = await job_tracker.claim_jobs(WEBHOOK_JOB_TYPES, limit)
+    items = []
+    for job in jobs:
+        context = {"event_id": job["event_id"], "job_id": job["id"], "attempts": job["attempts"]}
+        try:
+            if job["job_type"] == "webhook_order":
+                payload = OrderWebhookPayload(**job["payload"])
+                process = process_order_event
+            else:
+                payload = MeasurementWebhookPayload(**job["payload"])
+                process = process_measurement_event
+        except Exception as e:
+            await job_tracker.update_job_status(job["id"], "failed", f"Invalid payload: {e}")
+            logger.error("webhook_job_invalid", error=str(e), **context)
+            continue
+        items.append(
+            (
+                partial(
+                    process,
+                    payload,
+                    job["event_id"],
+                    job["id"],
+                    job["version"],
+                    job["attempts"],
+                ),
+                context,
+            )
+        )
+    return items
+
+
+async def count_webhook_backlog() -> int:
+    """未処理（queued）のWebhookジョブ数"""
+    return await job_tracker.count_queued(WEBHOOK_JOB_TYPES)
+
+
 @router.post("/orders.updated")
 async def webhook_orders_updated(
     request: Request,
@@ -53,13 +448,14 @@ async def webhook_orders_updated(
     発注データ更新Webhook
     署名検証→冪等チェック→顧客管理API経由で反映
     """
-    # 1. ボディ取得
-    body_bytes = await request.body()
+    # 1. ボディ取得（サイズ上限付き）
+    body_bytes = await read_body_limited(request, settings.WEBHOOK_MAX_BODY_BYTES)
     
     # 2. HMAC署名検証
-    is_valid, error_msg = hmac_validator.verify_signature(
-        x_timestamp, body_bytes, x_signature
-    )
+    with stage("hmac", webhook_stage_seconds):
+        is_valid, error_msg = await hmac_validator.averify_signature(
+            x_timestamp, body_bytes, x_signature
+        )
     if not is_valid:
         logger.warning(
             "webhook_signature_invalid",
@@ -68,8 +464,12 @@ async def webhook_orders_updated(
         )
         raise HTTPException(status_code=401, detail=f"Invalid signature: {error_msg}")
     
-    # 3. 冪等性チェック
-    if not idempotency_store.check_and_set(x_event_id):
+    # 3. 冪等性チェック（処理中として確保、処理中の再送は409・処理済みは重複として200）
+    with stage("idempotency", webhook_stage_seconds):
+        reservation = await _reserve(x_event_id)
+    if reservation == RESERVE_IN_PROGRESS:
+        raise _in_progress_error("orders.updated", x_event_id)
+    if reservation == RESERVE_DONE:
         logger.info(
             "webhook_duplicate",
             event_type="orders.updated",
@@ -77,11 +477,12 @@ async def webhook_orders_updated(
         )
         return {"status": "duplicate", "event_id": x_event_id}
     
-    # 4. ペイロード解析
+    # 4. ペイロード解析（検証済みの生バイト列を1回だけデコード）
     try:
-        body = await request.json()
-        payload = OrderWebhookPayload(**body)
+        payload = decode_model(OrderWebhookPayload, body_bytes, settings.WEBHOOK_JSON_ORJSON)
+        version = _event_version(payload.updated_at, x_timestamp)
     except Exception as e:
+        await idempotency_store.release(x_event_id)
         logger.error(
             "webhook_payload_invalid",
             event_id=x_event_id,
@@ -89,55 +490,25 @@ async def webhook_orders_updated(
         )
         raise HTTPException(status_code=400, detail=f"Invalid payload: {str(e)}")
     
-    # 5. Integration job 作成
-    job_id = await job_tracker.create_job(
-        job_type="webhook_order",
-        payload=payload.model_dump(),
-        event_id=x_event_id,
-    )
+    # 5. 確保の確定（他ワーカーが先に受け付けた重複は処理しない）
+    with stage("idempotency", webhook_stage_seconds):
+        duplicate = await _confirm_reservation("orders.updated", x_event_id)
+    if duplicate is not None:
+        return duplicate
     
-    # 6. 顧客管理API経由でorders反映
+    # 6. 非同期モードはジョブ登録のみで202応答
+    if settings.WEBHOOK_ASYNC_PROCESSING:
+        return await _enqueue("orders.updated", x_event_id, "webhook_order", payload, version)
+    
+    # 7. 顧客管理API経由で反映（成功で確定、失敗は解放して再送を受け付ける）
     try:
-        # ジョブをrunningに更新
-        await job_tracker.update_job_status(job_id, "running")
-        
-        # customer_codeからcustomer_idを解決
-        customer_id = await ensure_customer_id(payload.customer_code)
-        
-        order_data = {
-            "customer_id": customer_id,
-            "external_order_id": payload.external_order_id,
-            "source_system": "ExternalOrdering",
-            "title": payload.title,
-            "status": payload.status,
-            "ordered_at": payload.ordered_at,
-        }
-        
-        result = await customer_api_client.upsert_order(order_data)
-        
-        # ジョブをsucceededに更新
-        await job_tracker.update_job_status(job_id, "succeeded")
-        
-        logger.info(
-            "webhook_processed",
-            event_type="orders.updated",
-            event_id=x_event_id,
-            job_id=job_id,
-            external_order_id=payload.external_order_id,
-        )
-        
-        return {"status": "processed", "event_id": x_event_id, "job_id": job_id, "result": result}
-        
+        with deadline(settings.WEBHOOK_DEADLINE_SECONDS):
+            result = await process_order_event(payload, x_event_id, version=version)
     except Exception as e:
-        # ジョブをfailedに更新
-        await job_tracker.update_job_status(job_id, "failed", str(e))
-        logger.error(
-            "webhook_processing_failed",
-            event_id=x_event_id,
-            job_id=job_id,
-            error=str(e),
-        )
+        await idempotency_store.release(x_event_id)
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+    await idempotency_store.commit(x_event_id)
+    return result
 
 
 @router.post("/measurements.updated")
@@ -151,13 +522,14 @@ async def webhook_measurements_updated(
     測定データ更新Webhook
     署名検証→冪等チェック→顧客管理API経由で反映
     """
-    # 1. ボディ取得
-    body_bytes = await request.body()
+    # 1. ボディ取得（サイズ上限付き）
+    body_bytes = await read_body_limited(request, settings.WEBHOOK_MAX_BODY_BYTES)
     
     # 2. HMAC署名検証
-    is_valid, error_msg = hmac_validator.verify_signature(
-        x_timestamp, body_bytes, x_signature
-    )
+    with stage("hmac", webhook_stage_seconds):
+        is_valid, error_msg = await hmac_validator.averify_signature(
+            x_timestamp, body_bytes, x_signature
+        )
     if not is_valid:
         logger.warning(
             "webhook_signature_invalid",
@@ -166,8 +538,12 @@ async def webhook_measurements_updated(
         )
         raise HTTPException(status_code=401, detail=f"Invalid signature: {error_msg}")
     
-    # 3. 冪等性チェック
-    if not idempotency_store.check_and_set(x_event_id):
+    # 3. 冪等性チェック（処理中として確保、処理中の再送は409・処理済みは重複として200）
+    with stage("idempotency", webhook_stage_seconds):
+        reservation = await _reserve(x_event_id)
+    if reservation == RESERVE_IN_PROGRESS:
+        raise _in_progress_error("measurements.updated", x_event_id)
+    if reservation == RESERVE_DONE:
         logger.info(
             "webhook_duplicate",
             event_type="measurements.updated",
@@ -175,11 +551,12 @@ async def webhook_measurements_updated(
         )
         return {"status": "duplicate", "event_id": x_event_id}
     
-    # 4. ペイロード解析
+    # 4. ペイロード解析（検証済みの生バイト列を1回だけデコード）
     try:
-        body = await request.json()
-        payload = MeasurementWebhookPayload(**body)
+        payload = decode_model(MeasurementWebhookPayload, body_bytes, settings.WEBHOOK_JSON_ORJSON)
+        version = _event_version(payload.updated_at, x_timestamp)
     except Exception as e:
+        await idempotency_store.release(x_event_id)
         logger.error(
             "webhook_payload_invalid",
             event_id=x_event_id,
@@ -187,55 +564,315 @@ async def webhook_measurements_updated(
         )
         raise HTTPException(status_code=400, detail=f"Invalid payload: {str(e)}")
     
-    # 5. Integration job 作成
-    job_id = await job_tracker.create_job(
-        job_type="webhook_measurement",
-        payload=payload.model_dump(),
-        event_id=x_event_id,
-    )
+    # 5. 確保の確定（他ワーカーが先に受け付けた重複は処理しない）
+    with stage("idempotency", webhook_stage_seconds):
+        duplicate = await _confirm_reservation("measurements.updated", x_event_id)
+    if duplicate is not None:
+        return duplicate
+    
+    # 6. 非同期モードはジョブ登録のみで202応答
+    if settings.WEBHOOK_ASYNC_PROCESSING:
+        return await _enqueue("measurements.updated", x_event_id, "webhook_measurement", payload, version)
     
-    # 6. 顧客管理API経由でmeasurements反映
+    # 7. 顧客管理API経由で反映（成功で確定、失敗は解放して再送を受け付ける）
     try:
-        # ジョブをrunningに更新
-        await job_tracker.update_job_status(job_id, "running")
-        
-        # customer_codeからcustomer_idを解決
-        customer_id = await ensure_customer_id(payload.customer_code)
-        
-        measurement_data = {
-            "customer_id": customer_id,
-            "external_order_id": payload.external_order_id,  # 内部APIで解決
-            "order_source_system": "ExternalOrdering" if payload.external_order_id else None,
-            "external_measurement_id": payload.external_measurement_id,
-            "source_system": "ExternalMeasurement",
-            "summary": payload.summary,
-            "measured_at": payload.measured_at,
-        }
-        
-        result = await customer_api_client.upsert_measurement(measurement_data)
-        
-        # ジョブをsucceededに更新
-        await job_tracker.update_job_status(job_id, "succeeded")
-        
-        logger.info(
-            "webhook_processed",
-            event_type="measurements.updated",
-            event_id=x_event_id,
-            job_id=job_id,
-            external_measurement_id=payload.external_measurement_id,
+        with deadline(settings.WEBHOOK_DEADLINE_SECONDS):
+            result = await process_measurement_event(payload, x_event_id, version=version)
+    except Exception as e:
+        await idempotency_store.release(x_event_id)
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+    await idempotency_store.commit(x_event_id)
+    return result
+
+
+def _parse_batch(raw: bytes, content_type: str) -> List[Any]:
+    """
+    バッチボディ解析（JSON配列 または NDJSON）
+    
+    Returns:
+        イベントごとの値（NDJSONで解析できなかった行は例外オブジェクト）
+    
+    Raises:
+        ValueError: ボディ全体が不正
+    """
+    use_orjson = settings.WEBHOOK_JSON_ORJSON
+    if "ndjson" in content_type or not raw.lstrip().startswith(b"["):
+        items: List[Any] = []
+        for line in split_ndjson(raw):
+            try:
+                items.append(decode_json(line, use_orjson))
+            except ValueError as e:
+                items.append(e)
+        return items
+    
+    items = decode_json(raw, use_orjson)
+    if not isinstance(items, list):
+        raise ValueError("Batch body must be a JSON array or NDJSON")
+    return items
+
+
+async def _process_batch(
+    events: List[Tuple[int, BatchWebhookEvent, BaseModel]],
+    results: List[Optional[Dict[str, Any]]],
+    timestamp: str,
+):
+    """
+    バッチ内の新規イベントを反映（顧客コード一括解決→種別ごとに一括upsert）
+    結果は results[index] に設定し、成功は冪等キー確定・失敗は解放する
+    
+    後勝ち: バッチ内の同一キーは最新versionの1件のみ反映し、一括upsertはキー単位ディスパッチで
+    同一キーの個別Webhookと直列化する（実行中・反映済みより古い更新は superseded）
+    """
+    versions = {
+        index: _event_version(payload.updated_at, timestamp) for index, _, payload in events
+    }
+    events_by_index = {event[0]: event for event in events}
+    try:
+        created = await job_tracker.create_jobs(
+            [
+                (
+                    _BATCH_EVENT_TYPES[event.event_type][1],
+                    payload.model_dump(),
+                    event.event_id,
+                    versions[index],
+                )
+                for index, event, payload in events
+            ],
+            status="running",
         )
-        
-        return {"status": "processed", "event_id": x_event_id, "job_id": job_id, "result": result}
-        
+    except Exception:
+        await asyncio.gather(
+            *(idempotency_store.release(event.event_id) for _, event, _ in events)
+        )
+        raise
+    job_ids = {index: job_id for (index, _, _), job_id in zip(events, created)}
+    
+    # バッチ内の同一キーは最新versionの1件のみ反映（versionなしは到着順で後勝ち）
+    latest: Dict[Tuple[str, str], int] = {}
+    superseded: set[int] = set()
+    for index, event, payload in events:
+        key = _dispatch_key(event.event_type, payload)
+        version = versions[index]
+        current = latest.get(key)
+        if current is not None:
+            current_version = versions[current]
+            if version is not None and current_version is not None and version < current_version:
+                superseded.add(index)
+                continue
+            superseded.add(current)
+        latest[key] = index
+    
+    errors: Dict[int, str] = {}
+    try:
+        with stage("resolve", webhook_stage_seconds):
+            customer_ids = await resolve_customer_ids(
+                {payload.customer_code for _, _, payload in events}
+            )
     except Exception as e:
-        # ジョブをfailedに更新
-        await job_tracker.update_job_status(job_id, "failed", str(e))
-        logger.error(
-            "webhook_processing_failed",
-            event_id=x_event_id,
-            job_id=job_id,
-            error=str(e),
+        customer_ids = {}
+        errors = {index: f"Customer resolution failed: {e}" for index, _, _ in events}
+    
+    # キー → (index, event_type, record)
+    records: Dict[Tuple[str, str], Tuple[int, str, Dict[str, Any]]] = {}
+    for key, index in latest.items():
+        if index in errors:
+            continue
+        _, event, payload = events_by_index[index]
+        customer_id = customer_ids.get(payload.customer_code)
+        if not customer_id:
+            errors[index] = f"Customer not found with code: {payload.customer_code}"
+        elif event.event_type == "orders.updated":
+            records[key] = (index, event.event_type, _order_record(payload, customer_id))
+        else:
+            records[key] = (index, event.event_type, _measurement_record(payload, customer_id))
+    
+    async def upsert(
+        entries: List[Tuple[int, Dict[str, Any]]],
+        upsert_bulk: Callable[..., Awaitable[List[Dict[str, Any]]]],
+    ):
+        if not entries:
+            return
+        bulk_results = await upsert_bulk(
+            [record for _, record in entries],
+            concurrency=settings.WEBHOOK_BATCH_UPSERT_CONCURRENCY,
         )
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+        for result in bulk_results:
+            if result.get("status") != "upserted":
+                errors[entries[result["index"]][0]] = result.get("error") or "Upsert failed"
+    
+    async def upsert_keys(keys: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        # 種別ごとに (index, record) を集約して一括upsert
+        orders: List[Tuple[int, Dict[str, Any]]] = []
+        measurements: List[Tuple[int, Dict[str, Any]]] = []
+        for key in keys:
+            index, event_type, record = records[key]
+            if event_type == "orders.updated":
+                orders.append((index, record))
+            else:
+                measurements.append((index, record))
+        await asyncio.gather(
+            upsert(orders, customer_api_client.upsert_orders_bulk),
+            upsert(measurements, customer_api_client.upsert_measurements_bulk),
+        )
+        return [key for key in keys if records[key][0] not in errors]
+    
+    # 同一キーの個別Webhookと直列化し、実行中・反映済みより古い更新は superseded
+    with stage("upsert", webhook_stage_seconds):
+        _, stale = await keyed_dispatcher.submit_bulk(
+            {key: versions[index] for key, (index, _, _) in records.items()},
+            upsert_keys,
+        )
+    superseded.update(records[key][0] for key in stale)
+    
+    finalize = []
+    for index, event, _ in events:
+        job_id = job_ids[index]
+        result = {
+            "index": index,
+            "event_id": event.event_id,
+            "event_type": event.event_type,
+            "job_id": job_id,
+        }
+        error = errors.get(index)
+        if index in superseded:
+            results[index] = {**result, "status": "superseded"}
+            finalize.append(job_tracker.update_job_status(job_id, "succeeded"))
+            finalize.append(idempotency_store.commit(event.event_id))
+        elif error is None:
+            results[index] = {**result, "status": "processed"}
+            finalize.append(job_tracker.update_job_status(job_id, "succeeded"))
+            finalize.append(idempotency_store.commit(event.event_id))
+        else:
+            results[index] = {**result, "status": "failed", "error": error}
+            finalize.append(job_tracker.update_job_status(job_id, "failed", error))
+            finalize.append(idempotency_store.release(event.event_id))
+            logger.error(
+                "webhook_processing_failed",
+                event_id=event.event_id,
+                job_id=job_id,
+                error=error,
+            )
+    await asyncio.gather(*finalize)
 
 
+@router.post("/batch")
+async def webhook_batch(
+    request: Request,
+    x_signature: str = Header(...),
+    x_timestamp: str = Header(...),
+):
+    """
+    バッチWebhook（JSON配列 または NDJSON、全体で1署名）
+    イベント単位で冪等チェック→顧客コード一括解決→一括upsertし、イベント単位の結果を返す
+    
+    各イベント: {"event_id": ..., "event_type": "orders.updated" | "measurements.updated", "data": {...}}
+    """
+    # 1. ボディ取得（サイズ上限付き）
+    body_bytes = await read_body_limited(request, settings.WEBHOOK_BATCH_MAX_BODY_BYTES)
+    
+    # 2. HMAC署名検証
+    with stage("hmac", webhook_stage_seconds):
+        is_valid, error_msg = await hmac_validator.averify_signature(
+            x_timestamp, body_bytes, x_signature
+        )
+    if not is_valid:
+        logger.warning("webhook_signature_invalid", event_type="batch", error=error_msg)
+        raise HTTPException(status_code=401, detail=f"Invalid signature: {error_msg}")
+    
+    # 3. ボディ解析
+    try:
+        items = _parse_batch(body_bytes, request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid payload: {str(e)}")
+    if not items or len(items) > settings.WEBHOOK_BATCH_MAX_EVENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch must contain 1 to {settings.WEBHOOK_BATCH_MAX_EVENTS} events",
+        )
+    
+    # 4. イベント単位の検証（バッチ内の同一イベントIDは先勝ち）
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    candidates: List[Tuple[int, BatchWebhookEvent, BaseModel]] = []
+    seen: set[str] = set()
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            event = BatchWebhookEvent.model_validate(item)
+            model, _ = _BATCH_EVENT_TYPES[event.event_type]
+            payload = model.model_validate(event.data)
+        except Exception as e:
+            event_id = item.get("event_id") if isinstance(item, dict) else None
+            results[index] = {
+                "index": index,
+                "event_id": event_id,
+                "status": "invalid",
+                "error": str(e),
+            }
+            continue
+        if event.event_id in seen:
+            results[index] = {"index": index, "event_id": event.event_id, "status": "duplicate"}
+            continue
+        seen.add(event.event_id)
+        candidates.append((index, event, payload))
+    
+    # 5. 冪等性チェック（処理中として確保→確保の確定。他ワーカーが先に受け付けた重複は処理しない）
+    async def reserve(event_id: str) -> Optional[str]:
+        try:
+            reservation = await idempotency_store.reserve(event_id)
+        except Exception as e:
+            logger.error("idempotency_reserve_failed", event_id=event_id, error=str(e))
+            return None
+        if reservation != RESERVE_NEW:
+            return reservation
+        try:
+            return await idempotency_store.confirm(event_id)
+        except Exception as e:
+            logger.error("idempotency_confirm_failed", event_id=event_id, error=str(e))
+            return None
+    
+    with stage("idempotency", webhook_stage_seconds):
+        reserved = await asyncio.gather(
+            *(reserve(event.event_id) for _, event, _ in candidates)
+        )
+    events = []
+    for candidate, reservation in zip(candidates, reserved):
+        index, event, _ = candidate
+        if reservation == RESERVE_NEW:
+            events.append(candidate)
+        elif reservation is None:
+            results[index] = {
+                "index": index,
+                "event_id": event.event_id,
+                "status": "failed",
+                "error": "Idempotency store unavailable",
+            }
+        elif reservation == RESERVE_IN_PROGRESS:
+            # 確定前のため重複扱いしない（送信元は retry_after 秒後に再送）
+            results[index] = {
+                "index": index,
+                "event_id": event.event_id,
+                "status": "in_progress",
+                "retry_after": settings.WEBHOOK_IN_PROGRESS_RETRY_AFTER_SECONDS,
+            }
+        else:
+            results[index] = {"index": index, "event_id": event.event_id, "status": "duplicate"}
+    
+    # 6. 顧客管理API経由で一括反映
+    if events:
+        with deadline(settings.WEBHOOK_DEADLINE_SECONDS):
+            await _process_batch(events, results, x_timestamp)
+    
+    counts = {
+        "processed": 0,
+        "superseded": 0,
+        "duplicate": 0,
+        "in_progress": 0,
+        "invalid": 0,
+        "failed": 0,
+    }
+    for result in results:
+        counts[result["status"]] += 1
+    logger.info("webhook_batch_processed", events=len(items), **counts)
+    
+    return {"results": results, **counts}
@@ -0,0 +1,138 @@
+"""
+Bloomフィルタ
+冪等性チェックの前段で「確実に未登録」のキーを判定する
+"""
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+
+class BloomFilter:
+    """
+    固定サイズのBloomフィルタ
+
+    キーは一様なハッシュ値（16バイト以上のダイジェスト）を前提とし、
+    前半・後半の64bitからダブルハッシュで k 個のビット位置を求める
+
+    Args:
+        num_bits: ビット数
+        num_hashes: ハッシュ関数の数
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = max(num_hashes, 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def for_memory(cls, memory_bytes: int, fp_rate: float) -> "BloomFilter":
+        """メモリ上限と目標偽陽性率から生成（容量は capacity_for で求まる件数）"""
+        num_bits = memory_bytes * 8
+        capacity = cls.capacity_for(num_bits, fp_rate)
+        num_hashes = round(num_bits / capacity * math.log(2))
+        return cls(num_bits, num_hashes)
+
+    @staticmethod
+    def capacity_for(num_bits: int, fp_rate: float) -> int:
+        """ビット数と偽陽性率から最適な格納件数"""
+        return max(int(num_bits * math.log(2) ** 2 / -math.log(fp_rate)), 1)
+
+    def _positions(self, key: bytes) -> Tuple[int, ...]:
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        m = self.num_bits
+        return tuple((h1 + i * h2) % m for i in range(self.num_hashes))
+
+    def add(self, key: bytes):
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def estimated_fp_rate(self) -> float:
+        """現在の格納件数での推定偽陽性率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class RotatingBloomFilter:
+    """
+    時間バケットで世代交代するBloomフィルタ
+
+    世代ごとに ttl / (generations - 1) 秒を受け持ち、最古の世代を捨てて新しい世代を追加する
+    保持している世代全体で常に ttl 秒以上をカバーするため、TTL内に登録したキーは必ず「含まれる」と判定される
+
+    Args:
+        ttl_seconds: 判定を保証する期間（冪等ストアのTTL）
+        fp_rate: 全世代合計の目標偽陽性率
+        memory_bytes: 全世代合計のメモリ上限
+        generations: 世代数（2以上）
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        fp_rate: float = 0.01,
+        memory_bytes: int = 16 * 1024 * 1024,
+        generations: int = 4,
+    ):
+        self.generations = max(generations, 2)
+        self.bucket_seconds = ttl_seconds / (self.generations - 1)
+        # 判定は全世代のORのため、世代あたりの偽陽性率を按分
+        self.fp_rate_per_generation = fp_rate / self.generations
+        self.memory_bytes_per_generation = max(memory_bytes // self.generations, 1)
+        self._filters: Deque[BloomFilter] = deque()
+        self._current_started = 0.0
+        self.rotations = 0
+        self._rotate(time.monotonic())
+
+    def _new_filter(self) -> BloomFilter:
+        return BloomFilter.for_memory(
+            self.memory_bytes_per_generation, self.fp_rate_per_generation
+        )
+
+    def _rotate(self, now: float):
+        self._filters.append(self._new_filter())
+        if len(self._filters) > self.generations:
+            self._filters.popleft()
+        self._current_started = now
+        self.rotations += 1
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        elapsed = now - self._current_started
+        if elapsed < self.bucket_seconds:
+            return
+        # 長時間アイドルだった場合は経過バケット数ぶん進める
+        steps = min(int(elapsed // self.bucket_seconds), self.generations)
+        for _ in range(steps):
+            self._rotate(now)
+
+    def add(self, key: bytes):
+        self._maybe_rotate()
+        self._filters[-1].add(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        self._maybe_rotate()
+        return any(key in f for f in reversed(self._filters))
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._filters[-1]
+        capacity = BloomFilter.capacity_for(current.num_bits, self.fp_rate_per_generation)
+        return {
+            "generations": len(self._filters),
+            "bucket_seconds": self.bucket_seconds,
+            "memory_bytes": sum(len(f._bits) for f in self._filters),
+            "current_count": current.count,
+            "current_capacity": capacity,
+            "estimated_fp_rate": 1 - math.prod(1 - f.estimated_fp_rate() for f in self._filters),
+            "rotations": self.rotations,
+        }
@@ -0,0 +1,188 @@
+"""
+インプロセスキャッシュ
+LRU + TTL、ネガティブキャッシュ、同一キーの同時ロード集約（single-flight）
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+
+class AsyncTTLCache:
+    """
+    LRU + TTL キャッシュ
+    None（未検出）は negative_ttl_seconds の短い期間だけ保持する
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600.0,
+        negative_ttl_seconds: float = 60.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # 統計カウンタ
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default: Any = _MISSING) -> Any:
+        """キャッシュ参照（期限切れは削除して未ヒット扱い）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        """キャッシュ登録（Noneはネガティブキャッシュ）"""
+        ttl = self.negative_ttl_seconds if value is None else self.ttl_seconds
+        if ttl <= 0:
+            self._entries.pop(key, None)
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        """キャッシュ削除"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """全削除"""
+        self._entries.clear()
+
+    async def get_or_load(
+        self, key: str, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        キャッシュ参照、未ヒット時はloaderで取得して登録
+        同一キーの同時呼び出しは1回のloader実行に集約する
+
+        Args:
+            key: キャッシュキー
+            loader: 値を取得するコルーチン関数
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._load_done(k, t))
+
+        # 呼び出し元のキャンセルで共有ロードを止めない
+        return await asyncio.shield(task)
+
+    async def get_or_load_many(
+        self,
+        keys: Iterable[str],
+        loader: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        複数キーのキャッシュ参照、未ヒット分はloaderで一括取得して登録
+        他の呼び出しがロード中のキーはそれを待ち（get_or_load と共通）、残りのみ1回のloaderで取得する
+
+        Args:
+            keys: キャッシュキー
+            loader: 未ヒットのキー一覧を受け取り、キー→値を返すコルーチン関数（含まれないキーはNone）
+
+        Returns:
+            キー→値（未検出はNone）
+        """
+        values: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Task] = {}
+        to_load: List[str] = []
+        for key in dict.fromkeys(keys):
+            value = self.get(key)
+            if value is not _MISSING:
+                self.hits += 1
+                values[key] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                to_load.append(key)
+
+        if to_load:
+            batch = asyncio.ensure_future(self._load_many(to_load, loader))
+            batch.add_done_callback(lambda t: t.cancelled() or t.exception())
+            for key in to_load:
+                task = asyncio.ensure_future(self._pick(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, k=key: self._load_done(k, t))
+                waiting[key] = task
+
+        if waiting:
+            # 呼び出し元のキャンセルで共有ロードを止めない
+            loaded = await asyncio.shield(asyncio.gather(*waiting.values()))
+            values.update(zip(waiting.keys(), loaded))
+        return values
+
+    async def _load_many(
+        self, keys: List[str], loader: Callable[[List[str]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        found = await loader(keys)
+        for key in keys:
+            self.set(key, found.get(key))
+        return found
+
+    @staticmethod
+    async def _pick(batch: "asyncio.Future[Dict[str, Any]]", key: str) -> Any:
+        return (await batch).get(key)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _load_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待機者が全員キャンセルされた場合の未取得例外警告を抑止
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """統計情報（キャッシュサイズ調整用）"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self._inflight),
+            "hit_rate": (self.hits / lookups) if lookups else None,
+        }
@@ -0,0 +1,221 @@
+"""
+サーキットブレーカ
+宛先エンドポイント単位、直近ウィンドウの失敗率で開閉する
+"""
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List
+from urllib.parse import urlsplit
+
+import httpx
+import structlog
+
+from .config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+
+class CircuitOpenError(Exception):
+    """ブレーカopen中（呼び出しは行わず即時失敗）"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker is open: {name} (retry after {retry_after:.1f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    失敗率ベースのサーキットブレーカ
+
+    - closed: 直近 window_seconds 秒の呼び出しが min_requests 件以上かつ
+      失敗率が failure_rate_threshold 以上で open
+    - open: open_seconds 秒間は呼び出さずに CircuitOpenError
+    - half_open: 同時 half_open_max_probes 件まで試行し、
+      成功が half_open_max_probes 件続けば closed、1件でも失敗すれば open
+    時刻は単調時計（time.monotonic）で扱う
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: int = 60,
+        min_requests: int = 10,
+        failure_rate_threshold: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_max_probes: int = 1,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate_threshold = failure_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_probes = max(half_open_max_probes, 1)
+
+        self.state = "closed"
+        self._opened_at = 0.0
+        # 1秒単位のバケット [秒, 成功数, 失敗数]
+        self._buckets: Deque[List[int]] = deque()
+        self._successes = 0
+        self._failures = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        # メトリクス
+        self.transitions: Dict[str, int] = {}
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        logger.warning(
+            "circuit_breaker_state_changed",
+            breaker=self.name,
+            from_state=self.state,
+            to_state=state,
+            failures=self._failures,
+            requests=self._successes + self._failures,
+        )
+        self.state = state
+        if state == "open":
+            self._opened_at = time.monotonic()
+        elif state == "half_open":
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif state == "closed":
+            self._buckets.clear()
+            self._successes = self._failures = 0
+
+    def _trim(self, now_second: int):
+        while self._buckets and self._buckets[0][0] <= now_second - self.window_seconds:
+            _, ok, ng = self._buckets.popleft()
+            self._successes -= ok
+            self._failures -= ng
+
+    def _add(self, success: bool):
+        now_second = int(time.monotonic())
+        self._trim(now_second)
+        if not self._buckets or self._buckets[-1][0] != now_second:
+            self._buckets.append([now_second, 0, 0])
+        if success:
+            self._buckets[-1][1] += 1
+            self._successes += 1
+        else:
+            self._buckets[-1][2] += 1
+            self._failures += 1
+
+    def before_call(self):
+        """
+        呼び出し可否の判定（half_openでは試行枠を確保）
+
+        Raises:
+            CircuitOpenError: open中、またはhalf_openの試行枠が埋まっている
+        """
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self._transition("half_open")
+        if self._probes_in_flight >= self.half_open_max_probes:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, 0.0)
+        self._probes_in_flight += 1
+
+    def _release_probe(self):
+        if self.state == "half_open" and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def record_success(self):
+        if self.state == "half_open":
+            self._release_probe()
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_max_probes:
+                self._transition("closed")
+            return
+        self._add(True)
+
+    def record_failure(self):
+        if self.state == "half_open":
+            self._release_probe()
+            self._transition("open")
+            return
+        self._add(False)
+        if self.state != "closed":
+            return
+        total = self._successes + self._failures
+        if total >= self.min_requests and self._failures / total >= self.failure_rate_threshold:
+            self._transition("open")
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        判定→送信→結果記録（通信エラー・5xxを失敗とみなす）
+
+        Raises:
+            CircuitOpenError: open中（送信しない）
+        """
+        self.before_call()
+        try:
+            response = await send()
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # キャンセルは結果に数えず試行枠だけ戻す
+            self._release_probe()
+            raise
+        if response.status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(int(time.monotonic()))
+        total = self._successes + self._failures
+        return {
+            "state": self.state,
+            "window_requests": total,
+            "window_failure_rate": self._failures / total if total else 0.0,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+class CircuitBreakerRegistry:
+    """エンドポイント（scheme://host:port/path）単位のブレーカ管理"""
+
+    def __init__(self, **breaker_options: Any):
+        self._options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        """URLのエンドポイントのブレーカ（初回に生成）"""
+        endpoint = self._endpoint(url)
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, **self._options)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        """エンドポイント別の状態・遷移回数"""
+        return {endpoint: breaker.stats() for endpoint, breaker in self._breakers.items()}
+
+
+# シングルトンインスタンス
+circuit_breakers = CircuitBreakerRegistry(
+    window_seconds=settings.CIRCUIT_WINDOW_SECONDS,
+    min_requests=settings.CIRCUIT_MIN_REQUESTS,
+    failure_rate_threshold=settings.CIRCUIT_FAILURE_RATE_THRESHOLD,
+    open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+    half_open_max_probes=settings.CIRCUIT_HALF_OPEN_MAX_PROBES,
+)
@@ -12,6 +12,11 @@ class Settings(BaseSettings):
     # 基本
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_ENABLED: bool = False  # リングバッファ＋書き出しスレッドで出力（I/Oで待たない）
+    LOG_QUEUE_MAX_SIZE: int = 10000  # 満杯時は古い行から破棄
+    # info以下の高頻度イベントの間引き（例: {"request_timing": 0.1}）、毎秒上限（例: {"order_upserted": 50}）
+    LOG_EVENT_SAMPLE_RATES: dict[str, float] = {}
+    LOG_EVENT_RATE_LIMITS: dict[str, float] = {}
     ALLOWED_ORIGINS: list[str] = ["http://localhost:3000"]
     
     # Supabase
@@ -22,6 +27,12 @@ class Settings(BaseSettings):
     oauth2_token_url: str = ""
     oauth2_client_id: str = ""
     oauth2_client_secret: str = ""
+    oauth2_search_scope: str = ""  # 顧客検索（M2M）用スコープ（空はスコープ指定なし）
+    oauth2_upsert_scope: str = ""  # 内部upsert用スコープ
+    OAUTH2_REFRESH_RATIO: float = 0.8  # 有効期間の80%時点で更新
+    OAUTH2_REFRESH_JITTER_RATIO: float = 0.05
+    OAUTH2_EXPIRY_MARGIN_SECONDS: float = 30.0
+    OAUTH2_REFRESH_RETRY_SECONDS: float = 10.0
     
     # 外部API
     external_ordering_api_url: str = ""
@@ -30,6 +41,49 @@ class Settings(BaseSettings):
     
     # Webhook（HMAC署名検証用）
     webhook_secret: str = ""
+    webhook_previous_secrets: list[str] = []  # ローテーション中の旧シークレット
+    HMAC_OFFLOAD_THRESHOLD_BYTES: int = 256 * 1024  # これ以上のボディはスレッドで検証
+    WEBHOOK_MAX_BODY_BYTES: int = 1024 * 1024  # 超過は413（読み込み前に判定）
+    WEBHOOK_JSON_ORJSON: bool = False  # orjsonで解析（未導入時はpydanticのパーサ）
+    WEBHOOK_BATCH_MAX_EVENTS: int = 1000
+    WEBHOOK_BATCH_MAX_BODY_BYTES: int = 16 * 1024 * 1024
+    WEBHOOK_BATCH_UPSERT_CONCURRENCY: int = 4
+    WEBHOOK_DEADLINE_SECONDS: float = 25.0  # 同期処理の期限（再試行はこの範囲で打ち切る）
+    WEBHOOK_IN_PROGRESS_RETRY_AFTER_SECONDS: int = 5  # 処理中イベントの再送に返す409のRetry-After
+    
+    # 冪等性（イベントID）
+    IDEMPOTENCY_BACKEND: str = "memory"  # memory | sqlite | redis
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_RESERVATION_TTL_SECONDS: float = 300.0  # 処理中キーの失効（処理時間の上限より長く）
+    IDEMPOTENCY_MAX_ENTRIES: int = 1_000_000  # memoryのみ
+    IDEMPOTENCY_SQLITE_PATH: str = "var/idempotency.db"
+    IDEMPOTENCY_REDIS_URL: str = "redis://localhost:6379/0"
+    IDEMPOTENCY_REDIS_COMMAND_TIMEOUT_SECONDS: float = 2.0  # 応答が無ければ503で再送させる
+    IDEMPOTENCY_PREFILTER_ENABLED: bool = False  # sqlite / redis の前段にBloomフィルタ
+    IDEMPOTENCY_PREFILTER_FP_RATE: float = 0.01
+    IDEMPOTENCY_PREFILTER_MEMORY_BYTES: int = 16 * 1024 * 1024
+    IDEMPOTENCY_PREFILTER_GENERATIONS: int = 4
+    
+    # Webhook非同期処理（受付→202応答→ワーカーで反映）
+    WEBHOOK_ASYNC_PROCESSING: bool = False
+    WEBHOOK_WORKER_CONCURRENCY: int = 8
+    WEBHOOK_QUEUE_MAX_SIZE: int = 1000  # 未処理ジョブ（queued）の上限、超過時は503
+    WEBHOOK_QUEUE_POLL_INTERVAL_SECONDS: float = 1.0  # ジョブ取得のポーリング間隔（受付時は即時）
+    WEBHOOK_DRAIN_TIMEOUT_SECONDS: float = 30.0
+    
+    # キー単位ディスパッチ（同一レコードの更新を直列化・後勝ち）
+    KEYED_DISPATCHER_CONCURRENCY: int = 32
+    KEYED_DISPATCHER_VERSION_CACHE_SIZE: int = 100_000
+    
+    # Integration jobs（ローカル永続キュー）
+    JOB_QUEUE_DB_PATH: str = "var/integration_jobs.db"
+    JOB_LEASE_SECONDS: float = 300.0
+    JOB_RECOVERY_INTERVAL_SECONDS: float = 30.0  # リース切れジョブをqueuedへ戻す間隔
+    JOB_MAX_ATTEMPTS: int = 5  # 一時的な失敗を再実行する上限（超過でfailed）
+    JOB_RETRY_BASE_DELAY_SECONDS: float = 5.0
+    JOB_RETRY_MAX_DELAY_SECONDS: float = 600.0
+    JOB_TRACKER_FLUSH_INTERVAL_SECONDS: float = 0.2
+    JOB_TRACKER_FLUSH_BATCH_SIZE: int = 200
     
     # 顧客管理サービス内部API
     customer_api_base_url: str = ""
@@ -37,7 +91,58 @@ class Settings(BaseSettings):
     # 再試行・レート制限
     MAX_RETRY_ATTEMPTS: int = 5
     BACKOFF_MAX_SECONDS: int = 300
-    RATE_LIMIT_PER_MINUTE: int = 100
+    RETRY_BASE_DELAY_SECONDS: float = 0.5
+    RETRY_BUDGET_RATIO: float = 0.2  # リトライは要求数の20%まで
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+    RETRY_BUDGET_MAX_BALANCE: float = 50.0
+    RATE_LIMIT_PER_MINUTE: int = 100  # 外部API（ホスト単位）
+    RATE_LIMIT_BURST: int = 10
+    CUSTOMER_API_RATE_LIMIT_PER_MINUTE: int = 6000  # 顧客管理 内部API upsert
+    CUSTOMER_API_RATE_LIMIT_BURST: int = 100
+    RESOLVER_RATE_LIMIT_PER_MINUTE: int = 100  # M2M顧客検索（サーバ側制限 100req/分）
+    
+    # サーキットブレーカ（エンドポイント単位）
+    CIRCUIT_WINDOW_SECONDS: int = 60
+    CIRCUIT_MIN_REQUESTS: int = 10
+    CIRCUIT_FAILURE_RATE_THRESHOLD: float = 0.5
+    CIRCUIT_OPEN_SECONDS: float = 30.0
+    CIRCUIT_HALF_OPEN_MAX_PROBES: int = 1
+    
+    # HTTP接続プール（ホスト単位）
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 50
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_DEFAULT_TIMEOUT_SECONDS: float = 30.0
+    HTTP2_ENABLED: bool = True
+    
+    # 顧客コード解決キャッシュ
+    RESOLVER_CACHE_MAX_ENTRIES: int = 10000
+    RESOLVER_CACHE_TTL_SECONDS: float = 3600.0
+    RESOLVER_CACHE_NEGATIVE_TTL_SECONDS: float = 60.0
+    RESOLVER_BULK_CHUNK_SIZE: int = 100  # M2M検索APIのcodes上限
+    RESOLVER_BULK_CONCURRENCY: int = 4
+    
+    # 補助Pull同期
+    SYNC_UPSERT_CONCURRENCY: int = 10
+    BULK_UPSERT_BATCH_SIZE: int = 100  # 内部API一括upsertの1リクエスト件数（最大500）
+    SYNC_MAX_REPORTED_ERRORS: int = 100  # 全ページ同期時に返すエラー詳細の上限
+    SYNC_CHECKPOINT_DB_PATH: str = "var/sync_checkpoints.db"
+    
+    # メトリクス（/metrics）
+    METRICS_ENABLED: bool = True
+    METRICS_MULTIPROC_DIR: str = ""  # 複数ワーカー時の集約用ディレクトリ（起動前に空にする）
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    
+    # リクエスト処理時間計測（Server-Timing・遅延リクエストの標本化）
+    TIMING_ENABLED: bool = True
+    TIMING_SERVER_TIMING_HEADER: bool = True
+    TIMING_SLOW_REQUEST_SECONDS: float = 1.0
+    TIMING_SLOW_SAMPLES_MAX: int = 50
+    TIMING_PROFILE_SAMPLE_RATE: float = 0.0  # 0はプロファイルしない（/admin/timingで実行時に変更可）
+    TIMING_PROFILER: str = "cprofile"  # cprofile | pyinstrument（要インストール）
+    
+    # 管理エンドポイント（X-Admin-Token、空は無効）
+    admin_api_token: str = ""
     
     class Config:
         env_file = ".env"
@@ -2,23 +2,69 @@
 HMAC署名検証
 Webhook受信時の署名検証
 """
+import asyncio
 import hmac
 import hashlib
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Optional, Sequence
 
 
 class HMACValidator:
-    def __init__(self, secret: str):
+    """
+    署名 = HMAC-SHA256(secret, f"{timestamp}.{body}")
+
+    - ボディは文字列化せず、timestamp / b"." / memoryview(body) を順にハッシュへ投入する
+    - 鍵ごとのHMAC初期状態を事前計算し、検証時は copy() して使う
+    - ローテーション中は現行の鍵から順に照合し、一致しなかった場合のみ旧鍵で再計算する
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        previous_secrets: Sequence[str] = (),
+        offload_threshold_bytes: int = 256 * 1024,
+    ):
         self.secret = secret.encode()
+        self._keys = [
+            hmac.new(s.encode(), digestmod=hashlib.sha256)
+            for s in [secret, *previous_secrets]
+            if s
+        ] or [hmac.new(self.secret, digestmod=hashlib.sha256)]
+        self.offload_threshold_bytes = offload_threshold_bytes
+        self.previous_secret_matches = 0
+
+    @staticmethod
+    def _digest(base: "hmac.HMAC", timestamp: str, body: bytes) -> str:
+        h = base.copy()
+        h.update(timestamp.encode())
+        h.update(b".")
+        h.update(memoryview(body))
+        return h.hexdigest()
 
     def generate_signature(self, timestamp: str, body: bytes) -> str:
-        """HMAC-SHA256署名生成"""
-        message = f"{timestamp}.{body.decode()}"
-        signature = hmac.new(
-            self.secret, message.encode(), hashlib.sha256
-        ).hexdigest()
-        return signature
+        """HMAC-SHA256署名生成（現行の鍵）"""
+        return self._digest(self._keys[0], timestamp, body)
+
+    def _match(self, timestamp: str, body: bytes, received_signature: str) -> bool:
+        received = received_signature.encode()
+        for i, base in enumerate(self._keys):
+            if hmac.compare_digest(self._digest(base, timestamp, body).encode(), received):
+                if i:
+                    self.previous_secret_matches += 1
+                return True
+        return False
+
+    @staticmethod
+    def _check_timestamp(timestamp: str, max_age_seconds: int) -> Optional[str]:
+        # タイムスタンプ検証（リプレイ攻撃防止）
+        try:
+            ts = int(timestamp)
+            now = int(datetime.now(timezone.utc).timestamp())
+            if abs(now - ts) > max_age_seconds:
+                return f"Timestamp too old or in future: {abs(now - ts)}s"
+        except ValueError:
+            return "Invalid timestamp format"
+        return None
 
     def verify_signature(
         self,
@@ -33,19 +79,38 @@ class HMACValidator:
         Returns:
             (is_valid, error_message)
         """
-        # タイムスタンプ検証（リプレイ攻撃防止）
-        try:
-            ts = int(timestamp)
-            now = int(datetime.now(timezone.utc).timestamp())
-            if abs(now - ts) > max_age_seconds:
-                return False, f"Timestamp too old or in future: {abs(now - ts)}s"
-        except ValueError:
-            return False, "Invalid timestamp format"
+        error = self._check_timestamp(timestamp, max_age_seconds)
+        if error:
+            return False, error
 
         # 署名検証
-        expected_signature = self.generate_signature(timestamp, body)
-        if not hmac.compare_digest(expected_signature, received_signature):
+        if not self._match(timestamp, body, received_signature):
             return False, "Signature mismatch"
 
         return True, None
 
+    async def averify_signature(
+        self,
+        timestamp: str,
+        body: bytes,
+        received_signature: str,
+        max_age_seconds: int = 300,
+    ) -> tuple[bool, Optional[str]]:
+        """
+        HMAC署名検証（大きなボディはスレッドで計算しイベントループを塞がない）
+
+        Returns:
+            (is_valid, error_message)
+        """
+        if len(body) < self.offload_threshold_bytes:
+            return self.verify_signature(timestamp, body, received_signature, max_age_seconds)
+
+        error = self._check_timestamp(timestamp, max_age_seconds)
+        if error:
+            return False, error
+
+        # hashlibは大きな入力の計算中GILを解放する
+        if not await asyncio.to_thread(self._match, timestamp, body, received_signature):
+            return False, "Signature mismatch"
+
+        return True, None
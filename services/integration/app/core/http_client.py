@@ -0,0 +1,121 @@
+"""
+共有HTTPクライアントプール
+外部/内部API呼び出し用のKeep-Alive接続をホスト単位で再利用
+"""
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import structlog
+
+from .config import get_settings
+from .metrics import outbound_request_seconds
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+
+def _http2_available() -> bool:
+    """h2パッケージが利用可能か（httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """応答ヘッダ受信までの時間を宛先ホスト・ステータス別に計測するトランスポート"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            outbound_request_seconds.observe(
+                time.perf_counter() - started, host=request.url.host, status="error"
+            )
+            raise
+        outbound_request_seconds.observe(
+            time.perf_counter() - started, host=request.url.host, status=response.status_code
+        )
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class HTTPClientPool:
+    """
+    ホスト（scheme://host:port）単位の httpx.AsyncClient プール
+    アプリ起動時に開始し、終了時にまとめてクローズする
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._http2: Optional[bool] = None
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _use_http2(self) -> bool:
+        if self._http2 is None:
+            self._http2 = settings.HTTP2_ENABLED and _http2_available()
+            if settings.HTTP2_ENABLED and not self._http2:
+                logger.warning("http2_unavailable", reason="h2 package not installed")
+        return self._http2
+
+    def _create_client(self, origin: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        transport = httpx.AsyncHTTPTransport(limits=limits, http2=self._use_http2())
+        client = httpx.AsyncClient(
+            transport=InstrumentedTransport(transport),
+            timeout=settings.HTTP_DEFAULT_TIMEOUT_SECONDS,
+        )
+        logger.info("http_pool_created", origin=origin, http2=self._use_http2())
+        return client
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """
+        URLの接続先ホスト用クライアントを取得（未作成なら作成）
+
+        Args:
+            url: リクエスト先URL
+        """
+        origin = self._origin(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = self._create_client(origin)
+            self._clients[origin] = client
+        return client
+
+    async def start(self):
+        """起動処理（接続は初回リクエスト時に遅延作成）"""
+        logger.info(
+            "http_pool_started",
+            max_connections_per_host=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_per_host=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+            http2=self._use_http2(),
+        )
+
+    async def close(self):
+        """全クライアントをクローズ"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        logger.info("http_pool_closed", clients=len(clients))
+
+
+# シングルトンインスタンス
+http_client_pool = HTTPClientPool()
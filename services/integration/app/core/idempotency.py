@@ -1,46 +1,685 @@
 """
 冪等性チェック
 イベントIDベースの重複処理防止
+
+二段階方式: reserve（処理中として確保）→ commit（処理済みとして保持）/ release（解放）
+- reserve は新規 / 処理中 / 処理済み の3状態を返す（処理中の再送は後で再送させる）
+- reserve中のキーは短いTTLで失効するため、処理中にプロセスが落ちても再送を受け付けられる
+- 処理に失敗したイベントは release して送信元の再送を受け付ける
+
+バックエンド（IDEMPOTENCY_BACKEND）
+- memory: プロセス内（単一ワーカー向け）
+- sqlite: ローカルファイル共有（同一ホストの複数ワーカー向け）
+- redis: Redisプロトコル（複数レプリカ向け）
+
+共有バックエンドでは任意でBloomフィルタの前段判定を挟み、
+確実に新規のイベントIDはリモート確認を待たずに受け付ける（IDEMPOTENCY_PREFILTER_ENABLED）
 """
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import hashlib
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import structlog
+
+from .bloom import RotatingBloomFilter
+from .config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+_RESERVED = b"reserved"
+_COMMITTED = b"committed"
 
+# 自分の確保（値がトークンと一致）の場合のみ削除する
+_RELEASE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+    "return redis.call('DEL', KEYS[1]) end return 0"
+)
 
-class IdempotencyStore:
+# reserve の判定結果
+RESERVE_NEW = "new"  # 新規（処理すべき）
+RESERVE_IN_PROGRESS = "in_progress"  # 処理中（未確定。失敗して解放される可能性がある）
+RESERVE_DONE = "done"  # 処理済み
+
+
+def _digest(event_id: str) -> bytes:
+    """イベントIDの16バイトハッシュ（キー長を固定）"""
+    return hashlib.blake2b(event_id.encode(), digest_size=16).digest()
+
+
+class IdempotencyBackend:
     """
-    イベントID保存ストア（簡易メモリ実装）
-    本番環境ではRedis等の永続化ストアを推奨
+    冪等ストアのインターフェース
+
+    Args:
+        ttl_seconds: 処理済みキーの保持期間
+        reservation_ttl_seconds: 処理中キーの保持期間（処理時間の上限より長くする）
     """
 
-    def __init__(self, ttl_hours: int = 24):
-        self._store: dict[str, datetime] = {}
-        self.ttl_hours = ttl_hours
+    name = "base"
+
+    def __init__(self, ttl_seconds: float, reservation_ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.reservation_ttl_seconds = reservation_ttl_seconds
 
-    def check_and_set(self, event_id: str) -> bool:
+    async def reserve(self, event_id: str) -> str:
         """
-        イベントIDが既存かチェックし、なければ保存
+        イベントIDを処理中として確保
 
         Returns:
-            True: 新規（処理すべき）
-            False: 重複（スキップすべき）
+            RESERVE_NEW: 新規（確保した。処理すべき）
+            RESERVE_IN_PROGRESS: 処理中（自他ワーカーで確保済み・未確定）
+            RESERVE_DONE: 処理済み
         """
-        # クリーンアップ
-        self._cleanup()
+        raise NotImplementedError
+
+    async def confirm(self, event_id: str) -> str:
+        """
+        reserve が RESERVE_NEW を返したイベントの確保を確定（処理を始める前に呼ぶ）
+        通常は reserve 時点で確定済み。前段フィルタのように確保を後から確定するストアのみ待つ
+
+        Returns:
+            RESERVE_NEW: 自分が確保した（処理してよい）
+            RESERVE_IN_PROGRESS / RESERVE_DONE: 他ワーカーが先に確保していた（処理しない）
+        """
+        return RESERVE_NEW
+
+    async def commit(self, event_id: str):
+        """処理済みとして確定（TTLを処理済み期間に延長）"""
+        raise NotImplementedError
+
+    async def release(self, event_id: str):
+        """確保を解放（失敗・未受付のイベントを再送可能にする）"""
+        raise NotImplementedError
+
+    async def close(self):
+        """接続クローズ"""
+
+    def stats(self) -> Dict[str, Any]:
+        """統計情報"""
+        return {"backend": self.name}
+
+
+class MemoryIdempotencyStore(IdempotencyBackend):
+    """
+    プロセス内ストア
+
+    - キーはイベントIDの16バイトハッシュ（BLAKE2b）
+    - 挿入順＝概ね期限順のため、先頭から期限切れ分だけ削除する（償却O(1)）
+      reserve中の短いTTLのキーは前方の期限を待って回収されるが、参照時に期限を判定する
+    - 上限件数を超えた場合は最も古いエントリから追い出す
+    """
 
-        if event_id in self._store:
-            return False
+    name = "memory"
 
-        self._store[event_id] = datetime.now()
-        return True
+    def __init__(
+        self,
+        ttl_seconds: float = 86400.0,
+        reservation_ttl_seconds: float = 300.0,
+        max_entries: int = 1_000_000,
+        expire_batch: int = 1000,
+    ):
+        super().__init__(ttl_seconds, reservation_ttl_seconds)
+        # key -> (期限, 処理済みか)
+        self._store: "OrderedDict[bytes, Tuple[float, bool]]" = OrderedDict()
+        self.max_entries = max_entries
+        self.expire_batch = expire_batch
+        self.evictions = 0
 
-    def _cleanup(self):
-        """期限切れエントリ削除"""
-        cutoff = datetime.now() - timedelta(hours=self.ttl_hours)
-        expired = [k for k, v in self._store.items() if v < cutoff]
-        for key in expired:
+    def __len__(self) -> int:
+        return len(self._store)
+
+    async def reserve(self, event_id: str) -> str:
+        now = time.monotonic()
+        # クリーンアップ（1回あたりの削除数は上限付き）
+        self._expire(now)
+
+        key = _digest(event_id)
+        entry = self._store.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                return RESERVE_DONE if entry[1] else RESERVE_IN_PROGRESS
+            # 未回収の期限切れエントリ
             del self._store[key]
 
+        self._store[key] = (now + self.reservation_ttl_seconds, False)
+        if len(self._store) > self.max_entries:
+            self._store.popitem(last=False)
+            self.evictions += 1
+        return RESERVE_NEW
+
+    async def commit(self, event_id: str):
+        key = _digest(event_id)
+        self._store[key] = (time.monotonic() + self.ttl_seconds, True)
+        self._store.move_to_end(key)
+
+    async def release(self, event_id: str):
+        # 処理済みキーは消さない（reserve中のもののみ解放）
+        key = _digest(event_id)
+        entry = self._store.get(key)
+        if entry is not None and not entry[1]:
+            del self._store[key]
+
+    def _expire(self, now: float):
+        """期限切れエントリ削除（先頭から期限内のエントリに達するまで）"""
+        store = self._store
+        for _ in range(self.expire_batch):
+            if not store:
+                return
+            key = next(iter(store))
+            if store[key][0] > now:
+                return
+            del store[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "size": len(self._store),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteIdempotencyStore(IdempotencyBackend):
+    """
+    SQLiteファイル共有ストア（同一ホストの複数ワーカー間で重複排除）
+
+    reserve は期限切れ行のみ上書きする upsert 1文で判定するため、
+    ワーカー間で同時に届いた重複も1件だけが確保に成功する（失敗時は既存行の状態を返す）
+    """
+
+    name = "sqlite"
+
+    _SCHEMA = """
+    create table if not exists idempotency_keys (
+      key blob primary key,
+      state text not null,
+      expires_at real not null
+    ) without rowid;
+    create index if not exists idx_idempotency_keys_expires_at
+      on idempotency_keys(expires_at);
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: float = 86400.0,
+        reservation_ttl_seconds: float = 300.0,
+        cleanup_interval: int = 1000,
+        cleanup_batch: int = 1000,
+    ):
+        super().__init__(ttl_seconds, reservation_ttl_seconds)
+        self.db_path = db_path
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch = cleanup_batch
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                timeout=30.0,
+            )
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _reserve(self, key: bytes) -> str:
+        # 複数プロセスで共有するため壁時計で期限を持つ
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                """
+                insert into idempotency_keys (key, state, expires_at)
+                values (?, 'reserved', ?)
+                on conflict(key) do update set
+                  state = excluded.state,
+                  expires_at = excluded.expires_at
+                where idempotency_keys.expires_at <= ?
+                """,
+                (key, now + self.reservation_ttl_seconds, now),
+            )
+            self._writes += 1
+            if self._writes % self.cleanup_interval == 0:
+                conn.execute(
+                    """
+                    delete from idempotency_keys where key in (
+                      select key from idempotency_keys
+                       where expires_at <= ? limit ?
+                    )
+                    """,
+                    (now, self.cleanup_batch),
+                )
+            if cursor.rowcount == 1:
+                return RESERVE_NEW
+            row = conn.execute(
+                "select state from idempotency_keys where key = ?", (key,)
+            ).fetchone()
+        # 判定直後に解放された場合も処理中として扱う（送信元の再送で確保できる）
+        committed = row is not None and row[0] == "committed"
+        return RESERVE_DONE if committed else RESERVE_IN_PROGRESS
+
+    def _commit(self, key: bytes):
+        with self._lock:
+            self._connect().execute(
+                "update idempotency_keys set state = 'committed', expires_at = ? where key = ?",
+                (time.time() + self.ttl_seconds, key),
+            )
+
+    def _release(self, key: bytes):
+        with self._lock:
+            self._connect().execute(
+                "delete from idempotency_keys where key = ? and state = 'reserved'",
+                (key,),
+            )
+
+    async def reserve(self, event_id: str) -> str:
+        return await asyncio.to_thread(self._reserve, _digest(event_id))
+
+    async def commit(self, event_id: str):
+        await asyncio.to_thread(self._commit, _digest(event_id))
+
+    async def release(self, event_id: str):
+        await asyncio.to_thread(self._release, _digest(event_id))
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "db_path": self.db_path}
 
-# シングルトンインスタンス
-idempotency_store = IdempotencyStore()
 
+class RESPError(Exception):
+    """Redisのエラー応答"""
+
+
+class RESPConnection:
+    """
+    最小限のRESPクライアント（単一接続でパイプライン化）
+
+    コマンドは送信順に応答が返るため、待機中のFutureをFIFOで解決する
+    （タイムアウトしたコマンドのFutureはキャンセル済みのまま残り、応答受信時に読み捨てる）
+    """
+
+    def __init__(
+        self, url: str, connect_timeout: float = 5.0, command_timeout: float = 2.0
+    ):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Deque[asyncio.Future] = deque()
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts: List[bytes] = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        assert self._reader is not None
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest
+        if prefix == b"-":
+            return RESPError(rest.decode())
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+    async def _read_loop(self):
+        try:
+            while True:
+                reply = await self._read_reply()
+                future = self._pending.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RESPError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except Exception as e:
+            self._fail_pending(e)
+            self._drop_connection()
+
+    def _fail_pending(self, error: BaseException):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(str(error) or "Redis connection lost"))
+
+    def _drop_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _ensure_connected(self):
+        if self._writer is not None:
+            return
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                timeout=self.connect_timeout,
+            )
+            self._read_task = asyncio.create_task(self._read_loop())
+            try:
+                if self.password:
+                    auth = (self.username, self.password) if self.username else (self.password,)
+                    await self._send_with_timeout("AUTH", *auth)
+                if self.db:
+                    await self._send_with_timeout("SELECT", self.db)
+            except BaseException as e:
+                # 認証前の接続を残さない（次のコマンドで接続し直す）
+                self._read_task.cancel()
+                self._read_task = None
+                self._fail_pending(e)
+                self._drop_connection()
+                raise
+
+    async def _send(self, *args: Any) -> Any:
+        assert self._writer is not None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(self._encode(args))
+        return await future
+
+    async def _send_with_timeout(self, *args: Any) -> Any:
+        try:
+            return await asyncio.wait_for(self._send(*args), timeout=self.command_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Redis command {args[0]} timed out after {self.command_timeout}s"
+            ) from None
+
+    async def execute(self, *args: Any) -> Any:
+        """コマンド実行（応答が command_timeout 内に返らなければ TimeoutError）"""
+        await self._ensure_connected()
+        return await self._send_with_timeout(*args)
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            await asyncio.gather(self._read_task, return_exceptions=True)
+            self._read_task = None
+        self._fail_pending(ConnectionError("Redis connection closed"))
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+
+class RedisIdempotencyStore(IdempotencyBackend):
+    """
+    Redisプロトコルストア（複数レプリカ間で重複排除）
+
+    reserve は SET NX PX の1コマンドで判定する（確保できなければ GET で状態を確認）
+    確保の値には確保ごとのトークンを含め、release はトークンが一致する場合のみ
+    スクリプトで不可分に削除する（失効後に他ワーカーが確保し直したキーを消さない）
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str,
+        ttl_seconds: float = 86400.0,
+        reservation_ttl_seconds: float = 300.0,
+        key_prefix: str = "integration:idempotency:",
+        command_timeout: float = 2.0,
+    ):
+        super().__init__(ttl_seconds, reservation_ttl_seconds)
+        self.key_prefix = key_prefix.encode()
+        self._conn = RESPConnection(url, command_timeout=command_timeout)
+        # このプロセスが確保中のキー → 確保トークン
+        self._tokens: Dict[bytes, bytes] = {}
+
+    def _key(self, event_id: str) -> bytes:
+        return self.key_prefix + _digest(event_id).hex().encode()
+
+    async def reserve(self, event_id: str) -> str:
+        key = self._key(event_id)
+        token = _RESERVED + b":" + secrets.token_hex(16).encode()
+        reply = await self._conn.execute(
+            "SET",
+            key,
+            token,
+            "NX",
+            "PX",
+            int(self.reservation_ttl_seconds * 1000),
+        )
+        if reply == b"OK":
+            self._tokens[key] = token
+            return RESERVE_NEW
+        # 判定直後に解放・失効した場合も処理中として扱う（送信元の再送で確保できる）
+        state = await self._conn.execute("GET", key)
+        return RESERVE_DONE if state == _COMMITTED else RESERVE_IN_PROGRESS
+
+    async def commit(self, event_id: str):
+        key = self._key(event_id)
+        self._tokens.pop(key, None)
+        await self._conn.execute(
+            "SET",
+            key,
+            _COMMITTED,
+            "PX",
+            int(self.ttl_seconds * 1000),
+        )
+
+    async def release(self, event_id: str):
+        # 処理済みキー・他ワーカーの確保は消さない（自分の確保のみ解放）
+        key = self._key(event_id)
+        token = self._tokens.pop(key, None)
+        if token is None:
+            return
+        await self._conn.execute("EVAL", _RELEASE_SCRIPT, 1, key, token)
+
+    async def close(self):
+        await self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "host": self._conn.host,
+            "port": self._conn.port,
+            "pending_commands": len(self._conn._pending),
+            "reservations": len(self._tokens),
+        }
+
+
+class PrefilteredIdempotencyStore(IdempotencyBackend):
+    """
+    Bloomフィルタ前段付きストア
+
+    - フィルタに無いキー（このプロセスでTTL内に未受信）は即座に新規と判定し、
+      バックエンドへの reserve はバックグラウンドで書き込む（ペイロード解析と並行）
+    - フィルタに有る可能性があるキーのみバックエンドへ問い合わせる
+    - 処理開始前の confirm でバックグラウンドreserveの結果を待つ
+      （フィルタはプロセスローカルのため、他ワーカーに先に届いた重複・再起動後の重複はここで検知し処理しない）
+    - commit / release は自分が確保できた場合のみバックエンドへ反映する
+    """
+
+    name = "prefiltered"
+
+    def __init__(self, backend: IdempotencyBackend, bloom: RotatingBloomFilter):
+        super().__init__(backend.ttl_seconds, backend.reservation_ttl_seconds)
+        self.backend = backend
+        self.bloom = bloom
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        self.filter_skips = 0
+        self.remote_checks = 0
+        self.async_conflicts = 0
+        self.async_failures = 0
+
+    async def _reserve_in_background(self, event_id: str) -> str:
+        try:
+            state = await self.backend.reserve(event_id)
+        except Exception as e:
+            self.async_failures += 1
+            logger.warning("idempotency_async_reserve_failed", event_id=event_id, error=str(e))
+            raise
+        if state != RESERVE_NEW:
+            self.async_conflicts += 1
+            logger.info("idempotency_async_conflict", event_id=event_id, state=state)
+        return state
+
+    async def reserve(self, event_id: str) -> str:
+        key = _digest(event_id)
+        if key in self._inflight:
+            return RESERVE_IN_PROGRESS
+        if key not in self.bloom:
+            self.bloom.add(key)
+            self.filter_skips += 1
+            self._inflight[key] = asyncio.create_task(self._reserve_in_background(event_id))
+            return RESERVE_NEW
+        self.remote_checks += 1
+        return await self.backend.reserve(event_id)
+
+    async def _settle(self, key: bytes, keep_if_owned: bool) -> str:
+        """
+        バックグラウンドreserveの結果を待つ（対応するものがなければ確保済み扱い）
+        確保できなかった・失敗した場合は追跡を外す（以降の commit / release は何もしない）
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            return RESERVE_NEW
+        try:
+            state = await asyncio.shield(task)
+        except BaseException:
+            self._inflight.pop(key, None)
+            raise
+        if state != RESERVE_NEW or not keep_if_owned:
+            self._inflight.pop(key, None)
+        return state
+
+    async def confirm(self, event_id: str) -> str:
+        return await self._settle(_digest(event_id), keep_if_owned=True)
+
+    async def commit(self, event_id: str):
+        try:
+            state = await self._settle(_digest(event_id), keep_if_owned=False)
+        except Exception:
+            return
+        # 他ワーカーの確保・確定は上書きしない
+        if state == RESERVE_NEW:
+            await self.backend.commit(event_id)
+
+    async def release(self, event_id: str):
+        # 他ワーカーの確保は解放しない（フィルタからは消せないため再送はリモート確認に回る）
+        try:
+            state = await self._settle(_digest(event_id), keep_if_owned=False)
+        except Exception:
+            return
+        if state == RESERVE_NEW:
+            await self.backend.release(event_id)
+
+    async def close(self):
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.backend.stats(),
+            "prefilter": {
+                **self.bloom.stats(),
+                "filter_skips": self.filter_skips,
+                "remote_checks": self.remote_checks,
+                "inflight": len(self._inflight),
+                "async_conflicts": self.async_conflicts,
+                "async_failures": self.async_failures,
+            },
+        }
+
+
+def _create_backend() -> IdempotencyBackend:
+    backend = settings.IDEMPOTENCY_BACKEND
+    if backend == "memory":
+        return MemoryIdempotencyStore(
+            ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+            reservation_ttl_seconds=settings.IDEMPOTENCY_RESERVATION_TTL_SECONDS,
+            max_entries=settings.IDEMPOTENCY_MAX_ENTRIES,
+        )
+    if backend == "sqlite":
+        return SQLiteIdempotencyStore(
+            settings.IDEMPOTENCY_SQLITE_PATH,
+            ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+            reservation_ttl_seconds=settings.IDEMPOTENCY_RESERVATION_TTL_SECONDS,
+        )
+    if backend == "redis":
+        return RedisIdempotencyStore(
+            settings.IDEMPOTENCY_REDIS_URL,
+            ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+            reservation_ttl_seconds=settings.IDEMPOTENCY_RESERVATION_TTL_SECONDS,
+            command_timeout=settings.IDEMPOTENCY_REDIS_COMMAND_TIMEOUT_SECONDS,
+        )
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
+
+
+def create_idempotency_store() -> IdempotencyBackend:
+    """設定に応じたバックエンドを生成（共有バックエンドは任意でフィルタ前段付き）"""
+    backend = _create_backend()
+    if settings.IDEMPOTENCY_PREFILTER_ENABLED and not isinstance(
+        backend, MemoryIdempotencyStore
+    ):
+        return PrefilteredIdempotencyStore(
+            backend,
+            RotatingBloomFilter(
+                ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+                fp_rate=settings.IDEMPOTENCY_PREFILTER_FP_RATE,
+                memory_bytes=settings.IDEMPOTENCY_PREFILTER_MEMORY_BYTES,
+                generations=settings.IDEMPOTENCY_PREFILTER_GENERATIONS,
+            ),
+        )
+    return backend
+
+
+# シングルトンインスタンス
+idempotency_store = create_idempotency_store()
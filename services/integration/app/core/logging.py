@@ -1,36 +1,259 @@
 """
 構造化ログ設定
 リアルタイム性重視、機微情報のマスキング
+キュー方式（LOG_QUEUE_ENABLED）ではリングバッファへ積み、書き出しはバックグラウンドスレッドで行う
 """
+import atexit
+import json
 import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, TextIO
+
 import structlog
 from app.core.config import get_settings
 
+try:
+    import orjson
+except ImportError:  # 未導入時は標準jsonで出力
+    orjson = None
+
+# サンプリング・レート制限の対象外（常に出力）
+_ALWAYS_EMIT_LEVELS = {"warning", "error", "critical", "exception"}
+
+
+def _json_dumps(event_dict: Dict[str, Any]) -> str:
+    if orjson is not None:
+        # 文字列以外のキーも標準jsonと同様に文字列化する
+        return orjson.dumps(event_dict, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(event_dict, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def render_json(_: Any, __: str, event_dict: Dict[str, Any]) -> str:
+    """JSON出力（orjsonがあれば使用）"""
+    return _json_dumps(event_dict)
+
+
+class EventSampler:
+    """
+    イベント名単位の間引き（info以下のみ、warning以上は常に出力）
+
+    - sample_rates: イベント名 → 出力割合（0〜1）、出力したログに sample_rate を付与
+    - rate_limits: イベント名 → 毎秒の上限件数（超過分は破棄）
+
+    Args:
+        sample_rates: 例 {"order_upserted": 0.1}
+        rate_limits: 例 {"order_upserted": 50}
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float]):
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        # イベント名 → [残トークン, 更新時刻]
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+        # メトリクス
+        self.suppressed: Dict[str, int] = {}
+
+    def _suppress(self, event: str):
+        self.suppressed[event] = self.suppressed.get(event, 0) + 1
+        raise structlog.DropEvent
+
+    def _allow(self, event: str, limit: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = [limit, now]
+                self._buckets[event] = bucket
+            bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                return False
+            bucket[0] -= 1.0
+            return True
+
+    def __call__(self, _: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        if method_name in _ALWAYS_EMIT_LEVELS:
+            return event_dict
+        event = event_dict.get("event")
+        rate = self.sample_rates.get(event)
+        if rate is not None:
+            if random.random() >= rate:
+                self._suppress(event)
+            event_dict["sample_rate"] = rate
+        limit = self.rate_limits.get(event)
+        if limit is not None and not self._allow(event, limit):
+            self._suppress(event)
+        return event_dict
+
+
+class QueuedLogSink:
+    """
+    リングバッファ＋書き出しスレッド
+
+    - 呼び出し側は整形済みの1行をバッファへ積むだけ（I/Oで待たない）
+    - 満杯時は最も古い行を捨てて件数を数える
+    - スレッドはまとめて書き出し、flush する
+    """
+
+    def __init__(self, max_size: int, stream: Optional[TextIO] = None, batch_size: int = 512):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._stream = stream
+        self._buffer: Deque[str] = deque(maxlen=max_size)
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        # メトリクス
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream or sys.stdout
+
+    def put(self, line: str):
+        if len(self._buffer) >= self.max_size:
+            self.dropped += 1
+        self._buffer.append(line)
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _drain(self) -> int:
+        lines = []
+        while self._buffer and len(lines) < self.batch_size:
+            try:
+                lines.append(self._buffer.popleft())
+            except IndexError:
+                break
+        if not lines:
+            return 0
+        try:
+            stream = self.stream
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            self.written += len(lines)
+        except Exception:
+            self.write_errors += 1
+        return len(lines)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._drain():
+                pass
+        while self._drain():
+            pass
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """残りを書き出して停止（停止後に積まれた分も書き出す）"""
+        if self._thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join(timeout)
+            self._thread = None
+        while self._drain():
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._buffer),
+            "max_size": self.max_size,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
+
+
+class QueuedLogger:
+    """structlogの出力先（整形済み文字列をシンクへ積む）"""
+
+    def __init__(self, sink: QueuedLogSink):
+        self._sink = sink
+
+    def msg(self, message: str):
+        self._sink.put(message)
+
+    log = debug = info = warn = warning = msg
+    err = error = critical = exception = failure = fatal = msg
+
+
+class QueuedLoggerFactory:
+    def __init__(self, sink: QueuedLogSink):
+        self._sink = sink
+
+    def __call__(self, *args: Any) -> QueuedLogger:
+        return QueuedLogger(self._sink)
+
+
+_sink: Optional[QueuedLogSink] = None
+_sampler: Optional[EventSampler] = None
+
 
 def setup_logging():
     """ログ設定初期化"""
+    global _sink, _sampler
     settings = get_settings()
 
+    if _sampler is None:
+        _sampler = EventSampler(settings.LOG_EVENT_SAMPLE_RATES, settings.LOG_EVENT_RATE_LIMITS)
+    logger_factory: Callable[..., Any] = structlog.PrintLoggerFactory()
+    if settings.LOG_QUEUE_ENABLED:
+        if _sink is None:
+            _sink = QueuedLogSink(settings.LOG_QUEUE_MAX_SIZE)
+            _sink.start()
+            atexit.register(_sink.stop)
+        logger_factory = QueuedLoggerFactory(_sink)
+
     # structlog設定
     structlog.configure(
         processors=[
             structlog.contextvars.merge_contextvars,
+            _sampler,
             structlog.processors.add_log_level,
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer(),
+            render_json,
         ],
         wrapper_class=structlog.make_filtering_bound_logger(
             logging.getLevelName(settings.LOG_LEVEL)
         ),
         context_class=dict,
-        logger_factory=structlog.PrintLoggerFactory(),
+        logger_factory=logger_factory,
         cache_logger_on_first_use=True,
     )
 
 
+def shutdown_logging(timeout: float = 5.0):
+    """キュー方式の残りを書き出して停止"""
+    if _sink is not None:
+        _sink.stop(timeout)
+
+
+def logging_stats() -> Dict[str, Any]:
+    """キュー滞留・破棄件数とイベント別の間引き件数"""
+    return {
+        "queue": _sink.stats() if _sink is not None else None,
+        "suppressed": dict(_sampler.suppressed) if _sampler is not None else {},
+    }
+
+
 # ログ設定を初期化
 setup_logging()
 
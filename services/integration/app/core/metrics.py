@@ -0,0 +1,402 @@
+"""
+メトリクス（Prometheusテキスト形式）
+インプロセスのカウンタ・ヒストグラムと、取得時に値を読むコレクタ
+複数ワーカー時はプロセスごとのスナップショットファイルを集約する
+"""
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import structlog
+
+from .config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+# レイテンシ用の既定バケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LabelValues = Tuple[str, ...]
+_Collect = Callable[[], Iterable[Tuple[_LabelValues, float]]]
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> _LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """単調増加カウンタ"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[_LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> List[List[Any]]:
+        return [[list(key), value] for key, value in self._values.items()]
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_key", "_started")
+
+    def __init__(self, histogram: "Histogram", key: _LabelValues):
+        self._histogram = histogram
+        self._key = key
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram._observe(self._key, time.perf_counter() - self._started)
+
+
+class Histogram(_Metric):
+    """
+    固定バケットのヒストグラム
+    観測はバケット位置の二分探索と加算のみ（累積は出力時に計算）
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 → [バケット別件数（+Inf含む）, 合計, 件数]
+        self._values: Dict[_LabelValues, List[Any]] = {}
+
+    def _observe(self, key: _LabelValues, value: float):
+        entry = self._values.get(key)
+        if entry is None:
+            entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._values[key] = entry
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def observe(self, value: float, **labels: Any):
+        self._observe(self._key(labels), value)
+
+    def time(self, **labels: Any) -> _Timer:
+        """
+        経過時間を観測するコンテキストマネージャ
+
+        Usage:
+            with webhook_stage_seconds.time(stage="hmac"):
+                ...
+        """
+        return _Timer(self, self._key(labels))
+
+    def snapshot(self) -> List[List[Any]]:
+        return [
+            [list(key), list(counts), total, count]
+            for key, (counts, total, count) in self._values.items()
+        ]
+
+
+class _Collector(_Metric):
+    """取得時に既存の統計から値を読むメトリクス"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type: str,
+        labelnames: Sequence[str],
+        collect: _Collect,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self._collect = collect
+
+    def snapshot(self) -> List[List[Any]]:
+        try:
+            return [[list(map(str, key)), float(value)] for key, value in self._collect()]
+        except Exception as e:
+            logger.warning("metrics_collect_failed", metric=self.name, error=str(e))
+            return []
+
+
+class MetricsRegistry:
+    """
+    メトリクス登録・出力
+
+    - multiproc_dir 未設定: 自プロセスの値をそのまま出力
+    - multiproc_dir 設定時: 各プロセスが flush_interval ごとに metrics_<pid>.json へ書き出し、
+      出力時に全ファイルを集約する（カウンタ・ヒストグラムは終了済みプロセス分も合算、
+      ゲージは稼働中プロセスのみ pid ラベル付きで出力）
+      ディレクトリは起動前に空にしておくこと（前回起動分が合算されるため）
+    """
+
+    def __init__(self, multiproc_dir: str = "", flush_interval: float = 5.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._metrics: Dict[str, _Metric] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(
+        self, name: str, documentation: str, labelnames: Sequence[str], collect: _Collect
+    ):
+        """出力時に collect() の (ラベル値, 値) を読むゲージ"""
+        self._register(_Collector(name, documentation, "gauge", labelnames, collect))
+
+    def counter_callback(
+        self, name: str, documentation: str, labelnames: Sequence[str], collect: _Collect
+    ):
+        """出力時に collect() の累積値を読むカウンタ（既存の統計カウンタの公開用）"""
+        self._register(_Collector(name, documentation, "counter", labelnames, collect))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "metrics": {name: metric.snapshot() for name, metric in self._metrics.items()},
+        }
+
+    # --- 複数プロセス集約 ---
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.multiproc_dir, f"metrics_{pid}.json")
+
+    def _write(self, snapshot: Dict[str, Any]):
+        path = self._path(snapshot["pid"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    async def flush(self):
+        """自プロセスのスナップショットを書き出し"""
+        if self.multiproc_dir:
+            await asyncio.to_thread(self._write, self.snapshot())
+
+    def _read_all(self, own: Dict[str, Any]) -> List[Dict[str, Any]]:
+        snapshots = [own]
+        for filename in os.listdir(self.multiproc_dir):
+            if not (filename.startswith("metrics_") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get("pid") != own["pid"]:
+                snapshots.append(snapshot)
+        return snapshots
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _render(self, snapshots: List[Dict[str, Any]]) -> str:
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            if metric.type == "histogram":
+                self._render_histogram(metric, snapshots, lines)
+            elif metric.type == "gauge" and self.multiproc_dir:
+                labelnames = metric.labelnames + ("pid",)
+                for snapshot in snapshots:
+                    pid = snapshot["pid"]
+                    if pid != os.getpid() and not self._alive(pid):
+                        continue
+                    for key, value in snapshot["metrics"].get(name, []):
+                        labels = _format_labels(labelnames, [*key, str(pid)])
+                        lines.append(f"{name}{labels} {_format_value(value)}")
+            else:
+                totals: Dict[_LabelValues, float] = {}
+                for snapshot in snapshots:
+                    for key, value in snapshot["metrics"].get(name, []):
+                        totals[tuple(key)] = totals.get(tuple(key), 0.0) + value
+                for key, value in totals.items():
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(metric: Histogram, snapshots: List[Dict[str, Any]], lines: List[str]):
+        totals: Dict[_LabelValues, List[Any]] = {}
+        for snapshot in snapshots:
+            for key, counts, total, count in snapshot["metrics"].get(metric.name, []):
+                entry = totals.setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+        labelnames = metric.labelnames + ("le",)
+        for key, (counts, total, count) in totals.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*metric.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                labels = _format_labels(labelnames, [*key, _format_value(bound)])
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, key)
+            lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{metric.name}_count{labels} {count}")
+
+    async def render(self) -> str:
+        """Prometheusテキスト形式で出力（複数プロセス時は全プロセス分を集約）"""
+        own = self.snapshot()
+        if not self.multiproc_dir:
+            return self._render([own])
+        await asyncio.to_thread(self._write, own)
+        snapshots = await asyncio.to_thread(self._read_all, own)
+        return self._render(snapshots)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.warning("metrics_flush_failed", error=str(e))
+
+    async def start(self):
+        """複数プロセス集約時は定期書き出しを開始"""
+        if self.multiproc_dir and self._task is None:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """定期書き出しを停止し最終値を書き出す"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# シングルトンインスタンス
+metrics = MetricsRegistry(
+    multiproc_dir=settings.METRICS_MULTIPROC_DIR,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL_SECONDS,
+)
+
+http_request_seconds = metrics.histogram(
+    "integration_http_request_seconds",
+    "Inbound HTTP request latency",
+    ("method", "route", "status"),
+)
+webhook_stage_seconds = metrics.histogram(
+    "integration_webhook_stage_seconds",
+    "Webhook processing latency by stage",
+    ("stage",),
+)
+outbound_request_seconds = metrics.histogram(
+    "integration_outbound_request_seconds",
+    "Outbound HTTP latency until response headers",
+    ("host", "status"),
+)
+rate_limit_wait_seconds = metrics.histogram(
+    "integration_rate_limit_wait_seconds",
+    "Time spent waiting for a rate limiter token",
+    ("limiter", "origin"),
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+rate_limit_throttled = metrics.counter(
+    "integration_rate_limit_throttled_total",
+    "Responses that slowed a rate limiter down (429 or 503 with Retry-After)",
+    ("limiter", "origin"),
+)
+job_tracker_flush_seconds = metrics.histogram(
+    "integration_job_tracker_flush_seconds",
+    "Job tracker write-behind flush latency",
+)
+
+
+class MetricsMiddleware:
+    """受信リクエストのレイテンシをルート（パステンプレート）別に計測するASGIミドルウェア"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
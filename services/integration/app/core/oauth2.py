@@ -1,46 +1,201 @@
 """
 OAuth2 Client Credentials認証
-内部API呼び出し用トークン取得
+内部API呼び出し用トークン取得（スコープ別キャッシュ、期限前のバックグラウンド更新）
 """
+import asyncio
+import contextvars
+import random
+import time
+from typing import Any, Dict, Optional
+
 import httpx
-from datetime import datetime, timedelta
-from typing import Optional
+import structlog
+
 from .config import settings
+from .http_client import HTTPClientPool, http_client_pool
+from .retry import RetryPolicy, create_retry_policy
 
+logger = structlog.get_logger()
+
+
+class _ScopedToken:
+    """スコープごとのトークン状態"""
+
+    __slots__ = ("token", "expires_at", "refresh_at", "timer")
 
-class OAuth2Client:
     def __init__(self):
-        self._token: Optional[str] = None
-        self._expires_at: Optional[datetime] = None
-
-    async def get_token(self) -> str:
-        """トークン取得（キャッシュ有効時はキャッシュから返す）"""
-        if self._token and self._expires_at and self._expires_at > datetime.now():
-            return self._token
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                settings.oauth2_token_url,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": settings.oauth2_client_id,
-                    "client_secret": settings.oauth2_client_secret,
-                },
-                headers={"Cache-Control": "no-store"},
-                timeout=10.0,
-            )
-            response.raise_for_status()
+        self.token: Optional[str] = None
+        # time.monotonic基準
+        self.expires_at = 0.0
+        self.refresh_at = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class OAuth2Client:
+    """
+    トークンマネージャ
+
+    - スコープごとにトークンをキャッシュ（空文字はスコープ指定なし）
+    - 有効期間の refresh_ratio ± jitter の時点でバックグラウンド更新し、
+      更新中・更新失敗時も有効期限内なら旧トークンを返す
+    - 同一スコープの同時更新は1回のリクエストにまとめる（single-flight）
+    - 有効期限の expiry_margin 秒前からは失効扱いとし、呼び出し元は更新を待つ
+    """
+
+    def __init__(
+        self,
+        http_pool: HTTPClientPool = http_client_pool,
+        retry_policy: Optional[RetryPolicy] = None,
+        refresh_ratio: float = settings.OAUTH2_REFRESH_RATIO,
+        refresh_jitter_ratio: float = settings.OAUTH2_REFRESH_JITTER_RATIO,
+        expiry_margin: float = settings.OAUTH2_EXPIRY_MARGIN_SECONDS,
+        refresh_retry_seconds: float = settings.OAUTH2_REFRESH_RETRY_SECONDS,
+    ):
+        self._http_pool = http_pool
+        self._retry = retry_policy or create_retry_policy("oauth2", max_attempts=3)
+        self.refresh_ratio = refresh_ratio
+        self.refresh_jitter_ratio = refresh_jitter_ratio
+        self.expiry_margin = expiry_margin
+        self.refresh_retry_seconds = refresh_retry_seconds
+        self._tokens: Dict[str, _ScopedToken] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # メトリクス
+        self.fetches = 0
+        self.background_refreshes = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def _state(self, scope: str) -> _ScopedToken:
+        state = self._tokens.get(scope)
+        if state is None:
+            state = _ScopedToken()
+            self._tokens[scope] = state
+        return state
+
+    async def get_token(self, scope: Optional[str] = None) -> str:
+        """
+        トークン取得（有効なキャッシュがあれば待たずに返す）
+
+        Args:
+            scope: 要求スコープ（Noneはスコープ指定なし）
+        """
+        scope = scope or ""
+        state = self._state(scope)
+        now = time.monotonic()
+        if state.token and now < state.expires_at - self.expiry_margin:
+            if now >= state.refresh_at:
+                # タイマーが動いていない場合（イベントループ停止等）の保険
+                self._start_refresh(scope)
+            return state.token
+        return await self._refresh(scope)
+
+    def _start_refresh(self, scope: str) -> asyncio.Task:
+        """更新タスクを開始（実行中ならそれを返す）"""
+        task = self._inflight.get(scope)
+        if task is not None:
+            return task
+        # 呼び出し元の期限（deadline）等を引き継がないよう空のコンテキストで実行
+        task = asyncio.get_running_loop().create_task(
+            self._fetch(scope), context=contextvars.Context()
+        )
+        self._inflight[scope] = task
+        task.add_done_callback(lambda _: self._inflight.pop(scope, None))
+        # 失敗はログ済み（待つ呼び出し元がいない場合の未取得例外警告を抑止）
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _refresh(self, scope: str) -> str:
+        if scope in self._inflight:
+            self.coalesced += 1
+        # 待機側のキャンセルで共有の更新を止めない
+        return await asyncio.shield(self._start_refresh(scope))
+
+    async def _fetch(self, scope: str) -> str:
+        state = self._state(scope)
+        try:
+            response = await self._retry.run(lambda: self._request_token(scope))
             data = response.json()
+        except Exception as e:
+            self.failures += 1
+            logger.warning("oauth2_token_refresh_failed", scope=scope, error=str(e))
+            if state.token and time.monotonic() < state.expires_at:
+                # 旧トークンが有効な間は使い続け、少し後に再試行
+                self._schedule(scope, self.refresh_retry_seconds)
+            raise
 
-            self._token = data["access_token"]
-            # 有効期限の90%で更新
-            self._expires_at = datetime.now() + timedelta(
-                seconds=data["expires_in"] * 0.9
-            )
+        self.fetches += 1
+        now = time.monotonic()
+        expires_in = float(data["expires_in"])
+        jitter = random.uniform(-self.refresh_jitter_ratio, self.refresh_jitter_ratio)
+        state.token = data["access_token"]
+        state.expires_at = now + expires_in
+        state.refresh_at = now + expires_in * min(max(self.refresh_ratio + jitter, 0.0), 1.0)
+        self._schedule(scope, state.refresh_at - now)
+        return state.token
 
-            return self._token
+    def _schedule(self, scope: str, delay: float):
+        """バックグラウンド更新を予約（既存の予約は置き換え）"""
+        state = self._state(scope)
+        if state.timer is not None:
+            state.timer.cancel()
+        state.timer = asyncio.get_running_loop().call_later(
+            max(delay, 0.0), self._background_refresh, scope
+        )
+
+    def _background_refresh(self, scope: str):
+        self._tokens[scope].timer = None
+        self.background_refreshes += 1
+        self._start_refresh(scope)
+
+    async def _request_token(self, scope: str) -> httpx.Response:
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": settings.oauth2_client_id,
+            "client_secret": settings.oauth2_client_secret,
+        }
+        if scope:
+            data["scope"] = scope
+        client = self._http_pool.client_for(settings.oauth2_token_url)
+        response = await client.post(
+            settings.oauth2_token_url,
+            data=data,
+            headers={"Cache-Control": "no-store"},
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        return response
+
+    async def close(self):
+        """予約済み・実行中の更新を停止"""
+        for state in self._tokens.values():
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """スコープ別の残り有効期間と更新回数"""
+        now = time.monotonic()
+        return {
+            "scopes": {
+                scope or "(default)": {
+                    "expires_in_seconds": round(max(state.expires_at - now, 0.0), 1),
+                    "refresh_in_seconds": round(max(state.refresh_at - now, 0.0), 1),
+                    "refreshing": scope in self._inflight,
+                }
+                for scope, state in self._tokens.items()
+                if state.token
+            },
+            "fetches": self.fetches,
+            "background_refreshes": self.background_refreshes,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+        }
 
 
 # シングルトンインスタンス
 oauth2_client = OAuth2Client()
-
@@ -0,0 +1,196 @@
+"""
+送信レート制限
+宛先ホスト単位のトークンバケット（FIFO待機、429/Retry-Afterで自動減速）
+"""
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import structlog
+
+from .metrics import rate_limit_throttled, rate_limit_wait_seconds
+
+logger = structlog.get_logger()
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """Retry-Afterヘッダ（秒数 または HTTP-date）を秒数へ変換"""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    - 待機はasyncio.Lockの取得順（FIFO）で公平に処理する
+    - 429受信時は Retry-After まで全待機者を止め、レートを半減（下限 min_rate_ratio）
+    - 成功ごとに設定レートへ向けて加算的に回復する
+
+    Args:
+        rate_per_minute: 設定レート
+        burst: バケット容量
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        min_rate_ratio: float = 0.1,
+        recovery_ratio: float = 0.05,
+    ):
+        if rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute must be positive: {rate_per_minute}")
+        self.base_rate = rate_per_minute / 60.0
+        self.rate = self.base_rate
+        self.min_rate = self.base_rate * min_rate_ratio
+        self.recovery_step = self.base_rate * recovery_ratio
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+        # メトリクス
+        self.waiting = 0
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    async def acquire(self) -> float:
+        """
+        トークンを1つ取得（なければ補充まで待機）
+
+        Returns:
+            待機秒数
+        """
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._blocked_until:
+                        await asyncio.sleep(self._blocked_until - now)
+                        continue
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def on_throttled(self, retry_after: float):
+        """429受信: Retry-Afterまで停止しレートを半減"""
+        now = time.monotonic()
+        self._refill(now)
+        self.throttled += 1
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        self.rate = max(self.rate / 2, self.min_rate)
+
+    def on_success(self):
+        """成功: 設定レートへ向けて回復"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.rate + self.recovery_step, self.base_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "base_rate_per_minute": round(self.base_rate * 60, 2),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "avg_wait_seconds": self.total_wait_seconds / self.acquired if self.acquired else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+class HostRateLimiter:
+    """
+    宛先ホスト（scheme://host:port）単位のトークンバケット管理
+    呼び出し先の制限単位（外部API / 内部upsert / M2M検索）ごとにインスタンスを分ける
+
+    Args:
+        name: 制限単位の名前（メトリクスのラベル）
+        rate_per_minute: ホストあたりのレート（正の値）
+        burst: バケット容量
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int):
+        if rate_per_minute <= 0:
+            raise ValueError(f"{name}: rate_per_minute must be positive: {rate_per_minute}")
+        self.name = name
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        """URLの宛先ホストのバケット（初回に生成）"""
+        origin = self._origin(url)
+        bucket = self._buckets.get(origin)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_minute, self.burst)
+            self._buckets[origin] = bucket
+        return bucket
+
+    async def acquire(self, url: str) -> float:
+        """送信前にトークンを取得（待機秒数を返す）"""
+        bucket = self.bucket_for(url)
+        waited = await bucket.acquire()
+        rate_limit_wait_seconds.observe(waited, limiter=self.name, origin=self._origin(url))
+        if waited >= 1.0:
+            logger.info("rate_limit_waited", origin=self._origin(url), wait_seconds=round(waited, 3))
+        return waited
+
+    def observe(self, url: str, response: httpx.Response):
+        """応答をレートへ反映（429・Retry-After付き503で減速、成功で回復）"""
+        bucket = self.bucket_for(url)
+        if response.status_code == 429 or (
+            response.status_code == 503 and "Retry-After" in response.headers
+        ):
+            retry_after = parse_retry_after(response.headers.get("Retry-After"), 5.0)
+            bucket.on_throttled(retry_after)
+            rate_limit_throttled.inc(limiter=self.name, origin=self._origin(url))
+            logger.warning(
+                "rate_limited",
+                limiter=self.name,
+                origin=self._origin(url),
+                retry_after=retry_after,
+                rate_per_minute=round(bucket.rate * 60, 2),
+            )
+        elif response.status_code < 400:
+            bucket.on_success()
+
+    def stats(self) -> Dict[str, Any]:
+        """ホスト別の待機メトリクス"""
+        return {origin: bucket.stats() for origin, bucket in self._buckets.items()}
@@ -0,0 +1,78 @@
+"""
+リクエストボディ読み込み・デコード
+サイズ上限付きで読み込み、検証済みの生バイト列を1回だけモデルへデコードする
+"""
+import json
+from typing import Any, List, Type, TypeVar
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # 任意依存（未導入時はpydanticのJSONパーサを使用）
+    orjson = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+async def read_body_limited(request: Request, max_bytes: int) -> bytes:
+    """
+    上限付きでボディを読み込む
+
+    Content-Length が上限を超える場合は読み込まずに、
+    宣言がない/偽っている場合は上限を超えた時点で打ち切る
+
+    Raises:
+        HTTPException: 413（上限超過）/ 400（Content-Length不正）
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request body too large: {declared} > {max_bytes} bytes",
+            )
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request body too large: > {max_bytes} bytes",
+            )
+    return bytes(body)
+
+
+def decode_model(model: Type[ModelT], raw: bytes, use_orjson: bool = False) -> ModelT:
+    """
+    生バイト列をモデルへデコード（JSON解析は1回のみ）
+
+    Args:
+        model: Pydanticモデル
+        raw: 署名検証済みのボディ
+        use_orjson: orjsonで解析してから検証する（導入済みの場合のみ）
+
+    Raises:
+        ValueError: JSON不正・検証エラー（pydantic.ValidationError / orjson.JSONDecodeError）
+    """
+    if use_orjson and orjson is not None:
+        return model.model_validate(orjson.loads(raw))
+    return model.model_validate_json(raw)
+
+
+def decode_json(raw: bytes, use_orjson: bool = False) -> Any:
+    """生バイト列をJSONとして解析"""
+    if use_orjson and orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def split_ndjson(raw: bytes) -> List[bytes]:
+    """NDJSONを行単位に分割（空行は無視）"""
+    return [line for line in raw.split(b"\n") if line.strip()]
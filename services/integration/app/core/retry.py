@@ -0,0 +1,264 @@
+"""
+再試行ポリシー
+decorrelated jitter バックオフ、全体のリトライ予算、呼び出し元の期限（deadline）の伝播
+"""
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+import httpx
+import structlog
+
+from .circuit_breaker import CircuitOpenError
+from .config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+T = TypeVar("T")
+
+# 現在の処理の期限（time.monotonic基準、Noneは期限なし）
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    以降の呼び出しに期限を設定（既存の期限より短い場合のみ）
+
+    Usage:
+        with deadline(25.0):
+            await process(...)
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires_at if current is None else min(current, expires_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """期限までの残り秒数（期限なしはNone）"""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    """再試行対象か（通信エラー・タイムアウト・429・5xx）"""
+    if isinstance(error, (CircuitOpenError, httpx.LocalProtocolError, httpx.UnsupportedProtocol)):
+        # 送信前に確定する失敗（不正なヘッダ・URL等）は再試行しても同じ
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+# 内部APIが入力不備・制約違反を示すステータス（認証系の401/403や408/429は一時的）
+_PERMANENT_STATUSES = frozenset({400, 404, 409, 410, 422})
+
+
+class PermanentFailure(ValueError):
+    """自前の検証で確定した、再実行しても結果が変わらない失敗（入力不備・顧客未登録など）"""
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """
+    時間をおいて再実行しても結果が変わらない失敗か
+    自前の検証による PermanentFailure と、内部APIが入力不備・制約違反として返した 4xx。
+    応答の解析失敗（不完全・不正なJSON）・ブレーカopen・通信エラー・5xxは一時的とみなす
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in _PERMANENT_STATUSES
+    return isinstance(error, PermanentFailure)
+
+
+class RetryBudget:
+    """
+    リトライ予算（プロセス全体）
+
+    要求ごとに ratio 分の残高を積み、リトライ1回で1消費する
+    低トラフィック時も再試行できるよう毎秒 min_per_second 分を補充する（上限 max_balance）
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_balance: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._updated = time.monotonic()
+
+        # メトリクス
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self, amount: float = 0.0):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._balance = min(
+            self.max_balance, self._balance + elapsed * self.min_per_second + amount
+        )
+
+    def record_request(self):
+        self.requests += 1
+        self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self._balance < 1.0:
+            self.exhausted += 1
+            return False
+        self._balance -= 1.0
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "balance": round(self._balance, 2),
+            "requests": self.requests,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+        }
+
+
+class RetryPolicy:
+    """
+    再試行ポリシー
+
+    - 待機は decorrelated jitter: min(max_delay, uniform(base_delay, 前回待機 * 3))
+    - 期限が設定されていれば各試行を残り時間で打ち切り、待機が期限を超える場合は再試行しない
+    - 予算が尽きている場合は再試行しない
+
+    Args:
+        name: ログ・メトリクス用の名前
+        max_attempts: 最大試行回数（初回を含む）
+        budget: 共有リトライ予算
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        budget: "RetryBudget",
+        retryable: Callable[[Exception], bool] = is_retryable,
+    ):
+        self.name = name
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retryable = retryable
+
+        # メトリクス
+        self.retries = 0
+        self.deadline_giveups = 0
+
+    def _next_delay(self, previous: float) -> float:
+        return min(self.max_delay, random.uniform(self.base_delay, previous * 3))
+
+    async def run(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        max_attempts: Optional[int] = None,
+        **log_context: Any,
+    ) -> T:
+        """
+        operationを再試行付きで実行
+
+        Raises:
+            Exception: 再試行対象外のエラー、または再試行を打ち切った時点のエラー
+        """
+        attempts = max_attempts or self.max_attempts
+        self.budget.record_request()
+        delay = self.base_delay
+        attempt = 1
+        while True:
+            try:
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError(f"Deadline exceeded before {self.name} attempt")
+                async with asyncio.timeout(remaining):
+                    return await operation()
+            except Exception as e:
+                if attempt >= attempts or not self.retryable(e):
+                    raise
+
+                delay = self._next_delay(delay)
+                remaining = remaining_time()
+                if remaining is not None and delay >= remaining:
+                    self.deadline_giveups += 1
+                    logger.warning(
+                        "retry_deadline_exceeded",
+                        policy=self.name,
+                        attempt=attempt,
+                        remaining_seconds=round(remaining, 3),
+                        error=str(e),
+                        **log_context,
+                    )
+                    raise
+                if not self.budget.try_spend():
+                    logger.warning(
+                        "retry_budget_exhausted",
+                        policy=self.name,
+                        attempt=attempt,
+                        error=str(e),
+                        **log_context,
+                    )
+                    raise
+
+                self.retries += 1
+                logger.info(
+                    "retry_scheduled",
+                    policy=self.name,
+                    attempt=attempt,
+                    delay_seconds=round(delay, 3),
+                    error=str(e),
+                    **log_context,
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"retries": self.retries, "deadline_giveups": self.deadline_giveups}
+
+
+def create_retry_policy(name: str, max_attempts: Optional[int] = None) -> RetryPolicy:
+    """設定値と共有予算を使うポリシーを生成"""
+    policy = RetryPolicy(
+        name,
+        max_attempts=max_attempts or settings.MAX_RETRY_ATTEMPTS,
+        base_delay=settings.RETRY_BASE_DELAY_SECONDS,
+        max_delay=settings.BACKOFF_MAX_SECONDS,
+        budget=retry_budget,
+    )
+    retry_policies[name] = policy
+    return policy
+
+
+def retry_stats() -> Dict[str, Any]:
+    """予算とポリシー別のメトリクス"""
+    return {
+        "budget": retry_budget.stats(),
+        "policies": {name: policy.stats() for name, policy in retry_policies.items()},
+    }
+
+
+# シングルトンインスタンス
+retry_budget = RetryBudget(
+    ratio=settings.RETRY_BUDGET_RATIO,
+    min_per_second=settings.RETRY_BUDGET_MIN_PER_SECOND,
+    max_balance=settings.RETRY_BUDGET_MAX_BALANCE,
+)
+retry_policies: Dict[str, RetryPolicy] = {}
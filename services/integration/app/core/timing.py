@@ -0,0 +1,339 @@
+"""
+リクエスト単位の処理時間計測
+段階（stage）ごとの所要時間を Server-Timing ヘッダ・構造化ログへ出力し、
+閾値超過リクエストは段階の内訳（任意でプロファイル）を標本として保持する
+"""
+import cProfile
+import io
+import pstats
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import structlog
+
+from .config import get_settings
+from .metrics import Histogram
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class RequestTiming:
+    """
+    1リクエストの段階別計測結果
+
+    - totals: 段階名 → [合計秒, 回数]（並行実行された段階は合算）
+    - spans: 段階の発生順の内訳 (段階名, 開始オフセット秒, 所要秒)、max_spans件まで
+    """
+
+    __slots__ = ("started", "totals", "spans", "dropped_spans", "max_spans")
+
+    def __init__(self, max_spans: int = 256):
+        self.started = time.perf_counter()
+        self.totals: Dict[str, List[float]] = {}
+        self.spans: List[Tuple[str, float, float]] = []
+        self.dropped_spans = 0
+        self.max_spans = max_spans
+
+    def record(self, name: str, started: float, duration: float):
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [duration, 1]
+        else:
+            total[0] += duration
+            total[1] += 1
+        if len(self.spans) < self.max_spans:
+            self.spans.append((name, started - self.started, duration))
+        else:
+            self.dropped_spans += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダ値（ミリ秒）"""
+        entries = [
+            f"{name};dur={total * 1000:.1f}" for name, (total, _) in self.totals.items()
+        ]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def stage_fields(self) -> Dict[str, float]:
+        """ログ用の段階別合計（ミリ秒）"""
+        return {f"{name}_ms": round(total * 1000, 2) for name, (total, _) in self.totals.items()}
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    """処理中リクエストの計測（リクエスト外はNone）"""
+    return _current.get()
+
+
+class _Stage:
+    __slots__ = ("name", "histogram", "timing", "started")
+
+    def __init__(self, name: str, histogram: Optional[Histogram]):
+        self.name = name
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.timing = _current.get()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started
+        if self.timing is not None:
+            self.timing.record(self.name, self.started, duration)
+        if self.histogram is not None:
+            self.histogram.observe(duration, stage=self.name)
+
+
+def stage(name: str, histogram: Optional[Histogram] = None) -> _Stage:
+    """
+    段階の所要時間を計測（リクエスト計測へ記録し、histogram指定時は stage ラベルで観測）
+
+    Usage:
+        with stage("hmac", webhook_stage_seconds):
+            ...
+    """
+    return _Stage(name, histogram)
+
+
+class _Profile:
+    """1リクエスト分のプロファイル取得"""
+
+    def __init__(self, profiler: str, top: int):
+        self.profiler = profiler
+        self.top = top
+        if profiler == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._profile: Any = Profiler(async_mode="enabled")
+            self._profile.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> str:
+        if self.profiler == "pyinstrument":
+            self._profile.stop()
+            return self._profile.output_text()
+        self._profile.disable()
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats("cumulative").print_stats(self.top)
+        return stream.getvalue()
+
+
+class SlowRequestSampler:
+    """
+    閾値超過リクエストの標本保持
+
+    - 全リクエストの段階の内訳をログ出力し、slow_threshold 秒以上は直近 max_samples 件を保持
+    - profile_sample_rate の割合でリクエストをプロファイルし、閾値超過時のみ結果を残す
+      プロファイラはスレッド全体を計測するため同時に1リクエストのみ（cProfileは
+      他リクエストの処理も含む。pyinstrumentはasync対応で対象タスクに絞られる）
+    """
+
+    def __init__(
+        self,
+        slow_threshold: float,
+        max_samples: int,
+        profile_sample_rate: float = 0.0,
+        profiler: str = "cprofile",
+        profile_top: int = 40,
+    ):
+        self.slow_threshold = slow_threshold
+        self.profile_sample_rate = profile_sample_rate
+        self.profiler = profiler
+        self.profile_top = profile_top
+        self._samples: Deque[Dict[str, Any]] = deque(maxlen=max_samples)
+        self._profiling = False
+
+        # メトリクス
+        self.slow_requests = 0
+        self.profiled = 0
+
+    def configure(
+        self,
+        slow_threshold: Optional[float] = None,
+        profile_sample_rate: Optional[float] = None,
+        profiler: Optional[str] = None,
+    ):
+        """
+        実行時の設定変更
+
+        Raises:
+            ValueError: 未知のプロファイラ、または未導入
+        """
+        if profiler is not None:
+            if profiler not in PROFILERS:
+                raise ValueError(f"Unknown profiler: {profiler}")
+            if profiler == "pyinstrument":
+                try:
+                    import pyinstrument  # noqa: F401
+                except ImportError:
+                    raise ValueError("pyinstrument is not installed")
+            self.profiler = profiler
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if profile_sample_rate is not None:
+            self.profile_sample_rate = min(max(profile_sample_rate, 0.0), 1.0)
+        logger.info(
+            "timing_sampler_configured",
+            slow_threshold=self.slow_threshold,
+            profile_sample_rate=self.profile_sample_rate,
+            profiler=self.profiler,
+        )
+
+    def start_profile(self) -> Optional[_Profile]:
+        """抽選に当たり、他にプロファイル中のリクエストがなければ開始"""
+        if self._profiling or self.profile_sample_rate <= 0:
+            return None
+        if random.random() >= self.profile_sample_rate:
+            return None
+        self._profiling = True
+        try:
+            return _Profile(self.profiler, self.profile_top)
+        except Exception as e:
+            self._profiling = False
+            logger.warning("timing_profile_start_failed", profiler=self.profiler, error=str(e))
+            return None
+
+    def finish(
+        self,
+        timing: RequestTiming,
+        method: str,
+        route: str,
+        status: int,
+        profile: Optional[_Profile] = None,
+    ):
+        """
+        リクエスト完了時の記録
+        閾値未満は段階別の内訳を request_timing（info、LOG_EVENT_SAMPLE_RATES 等で間引き可）、
+        閾値超過は slow_request（warning）として出力し標本化する
+        """
+        profile_text = None
+        if profile is not None:
+            try:
+                profile_text = profile.stop()
+            finally:
+                self._profiling = False
+
+        duration = timing.elapsed()
+        fields = timing.stage_fields()
+        if duration < self.slow_threshold:
+            logger.info(
+                "request_timing",
+                method=method,
+                route=route,
+                status=status,
+                duration_ms=round(duration * 1000, 2),
+                **fields,
+            )
+            return
+
+        self.slow_requests += 1
+        spans = [
+            {"stage": name, "offset_ms": round(offset * 1000, 2), "duration_ms": round(d * 1000, 2)}
+            for name, offset, d in timing.spans
+        ]
+        sample: Dict[str, Any] = {
+            "at": time.time(),
+            "method": method,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "stages": fields,
+            "spans": spans,
+            "dropped_spans": timing.dropped_spans,
+        }
+        if profile_text is not None:
+            self.profiled += 1
+            sample["profiler"] = profile.profiler
+            sample["profile"] = profile_text
+        self._samples.append(sample)
+        logger.warning(
+            "slow_request",
+            method=method,
+            route=route,
+            status=status,
+            duration_ms=sample["duration_ms"],
+            profiled=profile_text is not None,
+            **fields,
+        )
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """保持中の標本（新しい順）"""
+        return list(reversed(self._samples))
+
+    def clear(self):
+        self._samples.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slow_threshold": self.slow_threshold,
+            "profile_sample_rate": self.profile_sample_rate,
+            "profiler": self.profiler,
+            "slow_requests": self.slow_requests,
+            "profiled": self.profiled,
+            "samples": len(self._samples),
+        }
+
+
+class TimingMiddleware:
+    """リクエストごとに計測を開始し、Server-Timing ヘッダ付与・完了記録を行うASGIミドルウェア"""
+
+    def __init__(self, app: Any, sampler: "SlowRequestSampler", server_timing: bool = True):
+        self.app = app
+        self.sampler = sampler
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        profile = self.sampler.start_profile()
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timing.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            self.sampler.finish(
+                timing,
+                scope["method"],
+                getattr(route, "path", scope.get("path", "")),
+                status,
+                profile,
+            )
+
+
+# シングルトンインスタンス
+slow_request_sampler = SlowRequestSampler(
+    slow_threshold=settings.TIMING_SLOW_REQUEST_SECONDS,
+    max_samples=settings.TIMING_SLOW_SAMPLES_MAX,
+    profile_sample_rate=settings.TIMING_PROFILE_SAMPLE_RATE,
+    profiler=settings.TIMING_PROFILER,
+)
@@ -2,14 +2,31 @@
 FastAPI 連携サービス - メインエントリポイント
 外部API連携（Webhook-first）、OAuth2 CC認証、リアルタイム最優先
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import structlog
 
+from app.core.circuit_breaker import circuit_breakers
 from app.core.config import get_settings
-from app.core.logging import setup_logging
-from app.api import webhooks, sync
+from app.core.http_client import http_client_pool
+from app.core.idempotency import idempotency_store
+from app.core.logging import logging_stats, setup_logging, shutdown_logging
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.oauth2 import oauth2_client
+from app.core.retry import retry_stats
+from app.core.timing import TimingMiddleware, slow_request_sampler
+from app.api import admin, webhooks, sync
+from app.api.webhooks import WEBHOOK_JOB_TYPES, claim_webhook_jobs, count_webhook_backlog
+from app.services.checkpoint_store import checkpoint_store
+from app.services.customer_api import customer_api_rate_limiter
+from app.services.external_api import external_rate_limiter
+from app.services.job_tracker import job_tracker
+from app.services.keyed_dispatcher import keyed_dispatcher
+from app.services.resolver import customer_id_cache, resolver_rate_limiter
+from app.services.webhook_queue import webhook_worker_pool
 
 # ログ初期化
 setup_logging()
@@ -17,12 +34,121 @@ logger = structlog.get_logger()
 
 settings = get_settings()
 
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _register_metrics():
+    """既存の統計を/metricsへ公開（取得時に読み出し）"""
+    metrics.gauge_callback(
+        "integration_circuit_breaker_state",
+        "Circuit breaker state (0=closed, 1=half_open, 2=open)",
+        ("endpoint",),
+        lambda: (
+            ((endpoint,), _BREAKER_STATES[stats["state"]])
+            for endpoint, stats in circuit_breakers.stats().items()
+        ),
+    )
+    metrics.counter_callback(
+        "integration_circuit_transitions_total",
+        "Circuit breaker state transitions",
+        ("endpoint", "from", "to"),
+        lambda: (
+            ((endpoint, *transition.split("->")), count)
+            for endpoint, stats in circuit_breakers.stats().items()
+            for transition, count in stats["transitions"].items()
+        ),
+    )
+
+    def idempotency_entries():
+        size = idempotency_store.stats().get("size")
+        return [] if size is None else [((), size)]
+
+    metrics.gauge_callback(
+        "integration_idempotency_store_entries",
+        "Entries held by the in-process idempotency store",
+        (),
+        idempotency_entries,
+    )
+    metrics.counter_callback(
+        "integration_resolver_cache_lookups_total",
+        "Customer code cache lookups by result",
+        ("result",),
+        lambda: [
+            (("hit",), customer_id_cache.hits),
+            (("miss",), customer_id_cache.misses),
+            (("coalesced",), customer_id_cache.coalesced),
+        ],
+    )
+    metrics.gauge_callback(
+        "integration_resolver_cache_entries",
+        "Entries held by the customer code cache",
+        (),
+        lambda: [((), len(customer_id_cache))],
+    )
+    metrics.gauge_callback(
+        "integration_webhook_queue_depth",
+        "Accepted webhook jobs not yet claimed by a worker",
+        (),
+        lambda: [((), webhook_worker_pool.backlog)],
+    )
+    metrics.gauge_callback(
+        "integration_job_tracker_buffer_depth",
+        "Job state transitions waiting to be flushed",
+        (),
+        lambda: [((), job_tracker.stats()["buffer_depth"])],
+    )
+    metrics.counter_callback(
+        "integration_job_tracker_flush_failures_total",
+        "Job tracker flushes that failed and were retried",
+        (),
+        lambda: [((), job_tracker.flush_failures)],
+    )
+
+
+_register_metrics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了処理（共有リソースのライフサイクル管理）"""
+    await http_client_pool.start()
+    await metrics.start()
+    # 同期処理モードではリース切れのジョブを取得するワーカーがいないためqueuedに戻さない
+    await job_tracker.start(
+        requeue_job_types=WEBHOOK_JOB_TYPES if settings.WEBHOOK_ASYNC_PROCESSING else []
+    )
+    if settings.WEBHOOK_ASYNC_PROCESSING:
+        await webhook_worker_pool.start(claim_webhook_jobs, count_webhook_backlog)
+    try:
+        yield
+    finally:
+        if settings.WEBHOOK_ASYNC_PROCESSING:
+            await webhook_worker_pool.stop(settings.WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+        await job_tracker.stop()
+        await oauth2_client.close()
+        await http_client_pool.close()
+        await metrics.stop()
+        await idempotency_store.close()
+        checkpoint_store.close()
+        shutdown_logging()
+
+
 app = FastAPI(
     title="Customer Management Integration Service",
     version="0.1.0",
     docs_url="/docs" if settings.DEBUG else None,
+    lifespan=lifespan,
 )
 
+if settings.TIMING_ENABLED:
+    app.add_middleware(
+        TimingMiddleware,
+        sampler=slow_request_sampler,
+        server_timing=settings.TIMING_SERVER_TIMING_HEADER,
+    )
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # CORS（必要に応じて制限）
 app.add_middleware(
     CORSMiddleware,
@@ -36,7 +162,36 @@ app.add_middleware(
 @app.get("/health")
 async def health_check():
     """ヘルスチェック"""
-    return {"status": "healthy", "service": "integration"}
+    return {
+        "status": "healthy",
+        "service": "integration",
+        "resolver_cache": customer_id_cache.stats(),
+        "job_tracker": job_tracker.stats(),
+        "idempotency_store": idempotency_store.stats(),
+        "keyed_dispatcher": keyed_dispatcher.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "retry": retry_stats(),
+        "oauth2": oauth2_client.stats(),
+        "timing": slow_request_sampler.stats(),
+        "logging": logging_stats(),
+        "rate_limits": {
+            "external_api": external_rate_limiter.stats(),
+            "customer_api": customer_api_rate_limiter.stats(),
+            "resolver": resolver_rate_limiter.stats(),
+        },
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheusテキスト形式のメトリクス"""
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    return PlainTextResponse(
+        await metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @app.exception_handler(Exception)
@@ -59,6 +214,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 # ルータ登録
 app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
 app.include_router(sync.router, prefix="/sync", tags=["sync"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"], include_in_schema=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""
+補助Pull同期チェックポイント
+ソース単位のハイウォーターマーク（updated_since）と再開ページをSQLiteに記録
+再実行しても反映できないレコードはデッドレターとして記録し、チェックポイントは先へ進める
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from ..core.config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+_SCHEMA = """
+create table if not exists sync_checkpoints (
+  source text primary key,
+  high_water_mark text,
+  window_since text,
+  next_page integer,
+  window_max_updated_at text,
+  updated_at text not null
+);
+create table if not exists sync_dead_letters (
+  source text not null,
+  item_id text not null,
+  error text,
+  payload text,
+  page integer,
+  window_since text,
+  attempts integer not null default 1,
+  first_failed_at text not null,
+  last_failed_at text not null,
+  primary key (source, item_id)
+)
+"""
+
+
+def _max_iso(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    """ISO8601文字列の大きい方（同一ソースは同一書式の前提）"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+class CheckpointStore:
+    """
+    同期チェックポイントストア
+
+    - high_water_mark: 最後に完走したウィンドウの最大updated_at（次回のupdated_since）
+    - window_since / next_page: 実行中ウィンドウ（クラッシュ時はここから再開）
+    - ページのupsert完了後にのみ next_page を進める
+    - 恒久的な失敗（顧客未登録・4xx）のみのページはデッドレターへ記録して進める
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=full")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(sql, params).fetchone()
+            conn.commit()
+            return dict(row) if row else None
+
+    async def _run(self, sql: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, source: str) -> Optional[Dict[str, Any]]:
+        """チェックポイント取得"""
+        return await self._run(
+            "select * from sync_checkpoints where source = ?", (source,)
+        )
+
+    async def begin_window(self, source: str) -> Dict[str, Any]:
+        """
+        同期ウィンドウ開始（実行中のウィンドウがあれば再開）
+
+        Returns:
+            {"updated_since": ..., "start_page": ..., "resumed": bool}
+        """
+        checkpoint = await self.get(source) or {}
+        if checkpoint.get("next_page"):
+            logger.info(
+                "sync_checkpoint_resumed",
+                source=source,
+                updated_since=checkpoint["window_since"],
+                page=checkpoint["next_page"],
+            )
+            return {
+                "updated_since": checkpoint["window_since"],
+                "start_page": checkpoint["next_page"],
+                "resumed": True,
+            }
+
+        since = checkpoint.get("high_water_mark")
+        await self._run(
+            """
+            insert into sync_checkpoints
+              (source, window_since, next_page, window_max_updated_at, updated_at)
+            values (?, ?, 1, null, ?)
+            on conflict(source) do update set
+              window_since = excluded.window_since,
+              next_page = 1,
+              window_max_updated_at = null,
+              updated_at = excluded.updated_at
+            """,
+            (source, since, datetime.now(timezone.utc).isoformat()),
+        )
+        return {"updated_since": since, "start_page": 1, "resumed": False}
+
+    async def commit_page(
+        self, source: str, page: int, max_updated_at: Optional[str]
+    ):
+        """ページのupsert完了を記録（次回はpage+1から再開）"""
+        checkpoint = await self.get(source) or {}
+        await self._run(
+            """
+            update sync_checkpoints
+               set next_page = ?, window_max_updated_at = ?, updated_at = ?
+             where source = ?
+            """,
+            (
+                page + 1,
+                _max_iso(checkpoint.get("window_max_updated_at"), max_updated_at),
+                datetime.now(timezone.utc).isoformat(),
+                source,
+            ),
+        )
+
+    async def complete_window(self, source: str) -> Optional[str]:
+        """
+        ウィンドウ完走を記録しハイウォーターマークを前進
+
+        Returns:
+            新しいハイウォーターマーク
+        """
+        checkpoint = await self.get(source) or {}
+        high_water_mark = _max_iso(
+            checkpoint.get("high_water_mark"),
+            checkpoint.get("window_max_updated_at"),
+        )
+        await self._run(
+            """
+            update sync_checkpoints
+               set high_water_mark = ?, window_since = null, next_page = null,
+                   window_max_updated_at = null, updated_at = ?
+             where source = ?
+            """,
+            (high_water_mark, datetime.now(timezone.utc).isoformat(), source),
+        )
+        logger.info(
+            "sync_checkpoint_advanced",
+            source=source,
+            high_water_mark=high_water_mark,
+        )
+        return high_water_mark
+
+    def _insert_dead_letters(self, rows: List[tuple]):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                """
+                insert into sync_dead_letters
+                  (source, item_id, error, payload, page, window_since,
+                   first_failed_at, last_failed_at)
+                values (?, ?, ?, ?, ?, ?, ?, ?)
+                on conflict(source, item_id) do update set
+                  error = excluded.error,
+                  payload = excluded.payload,
+                  page = excluded.page,
+                  window_since = excluded.window_since,
+                  attempts = sync_dead_letters.attempts + 1,
+                  last_failed_at = excluded.last_failed_at
+                """,
+                rows,
+            )
+            conn.commit()
+
+    async def record_dead_letters(
+        self, source: str, page: int, failures: List[Dict[str, Any]]
+    ):
+        """
+        恒久的に失敗したレコードを記録（同一レコードは attempts を加算して上書き）
+
+        Args:
+            failures: [{"item_id": ..., "error": ..., "payload": {...}}]
+        """
+        if not failures:
+            return
+        checkpoint = await self.get(source) or {}
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (
+                source,
+                str(failure["item_id"]),
+                failure.get("error"),
+                json.dumps(failure.get("payload"), ensure_ascii=False, default=str),
+                page,
+                checkpoint.get("window_since"),
+                now,
+                now,
+            )
+            for failure in failures
+        ]
+        await asyncio.to_thread(self._insert_dead_letters, rows)
+        logger.warning(
+            "sync_dead_letters_recorded",
+            source=source,
+            page=page,
+            count=len(rows),
+        )
+
+    def _select_dead_letters(self, source: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            if source is None:
+                rows = conn.execute(
+                    "select * from sync_dead_letters order by last_failed_at desc limit ?",
+                    (limit,),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    """
+                    select * from sync_dead_letters where source = ?
+                    order by last_failed_at desc limit ?
+                    """,
+                    (source, limit),
+                ).fetchall()
+        results = []
+        for row in rows:
+            item = dict(row)
+            item["payload"] = json.loads(item["payload"]) if item["payload"] else None
+            results.append(item)
+        return results
+
+    async def dead_letters(
+        self, source: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """デッドレター一覧（最終失敗の新しい順）"""
+        return await asyncio.to_thread(self._select_dead_letters, source, limit)
+
+    def close(self):
+        """接続クローズ"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# シングルトンインスタンス
+checkpoint_store = CheckpointStore(settings.SYNC_CHECKPOINT_DB_PATH)
@@ -2,66 +2,174 @@
 顧客管理APIクライアント
 内部API呼び出し（orders/measurements upsert）
 """
+import asyncio
+from typing import Any, Dict, List, Optional
+
 import httpx
-from typing import Any, Dict
+
+from ..core.circuit_breaker import CircuitBreakerRegistry, circuit_breakers
 from ..core.config import settings
+from ..core.http_client import HTTPClientPool, http_client_pool
 from ..core.oauth2 import oauth2_client
 from ..core.logging import logger
+from ..core.rate_limiter import HostRateLimiter
+from ..core.retry import RetryPolicy, create_retry_policy, is_permanent_failure
+from ..core.timing import stage
+
+# 顧客管理 内部API（upsert）のレート制限
+customer_api_rate_limiter = HostRateLimiter(
+    "customer_api",
+    settings.CUSTOMER_API_RATE_LIMIT_PER_MINUTE,
+    settings.CUSTOMER_API_RATE_LIMIT_BURST,
+)
 
 
 class CustomerAPIClient:
-    def __init__(self):
+    def __init__(
+        self,
+        http_pool: HTTPClientPool = http_client_pool,
+        rate_limiter: HostRateLimiter = customer_api_rate_limiter,
+        breakers: CircuitBreakerRegistry = circuit_breakers,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
         self.base_url = settings.customer_api_base_url
+        self._http_pool = http_pool
+        self._rate_limiter = rate_limiter
+        self._breakers = breakers
+        self._retry = retry_policy or create_retry_policy("customer_api")
 
-    async def upsert_order(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """発注データupsert"""
-        token = await oauth2_client.get_token()
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/internal/orders/upsert",
-                json=order_data,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "Cache-Control": "no-store",
-                },
-                timeout=30.0,
+    async def _post(self, url: str, body: Any, timeout: float) -> httpx.Response:
+        """
+        認証・レート制限・ブレーカ・再試行付きPOST（upsertは冪等なため再試行可）
+
+        Raises:
+            httpx.HTTPStatusError: 4xx、または再試行を打ち切った5xx/429
+            CircuitOpenError: ブレーカopen中（送信しない）
+        """
+        breaker = self._breakers.for_url(url)
+
+        async def attempt() -> httpx.Response:
+            token = await oauth2_client.get_token(settings.oauth2_upsert_scope)
+            await self._rate_limiter.acquire(url)
+            client = self._http_pool.client_for(url)
+            response = await breaker.call(
+                lambda: client.post(
+                    url,
+                    json=body,
+                    headers={
+                        "Authorization": f"Bearer {token}",
+                        "Content-Type": "application/json",
+                        "Cache-Control": "no-store",
+                    },
+                    timeout=timeout,
+                )
             )
+            self._rate_limiter.observe(url, response)
             response.raise_for_status()
-            logger.info(
-                "order_upserted",
-                external_order_id=order_data.get("external_order_id"),
-                status_code=response.status_code,
-            )
-            return response.json()
+            return response
+
+        with stage("customer_api"):
+            return await self._retry.run(attempt, url=url)
+
+    async def upsert_order(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
+        """発注データupsert"""
+        url = f"{self.base_url}/api/internal/orders/upsert"
+        response = await self._post(url, order_data, timeout=30.0)
+        logger.info(
+            "order_upserted",
+            external_order_id=order_data.get("external_order_id"),
+            status_code=response.status_code,
+        )
+        return response.json()
 
     async def upsert_measurement(
         self, measurement_data: Dict[str, Any]
     ) -> Dict[str, Any]:
         """測定データupsert"""
-        token = await oauth2_client.get_token()
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/internal/measurements/upsert",
-                json=measurement_data,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "Cache-Control": "no-store",
-                },
-                timeout=30.0,
-            )
-            response.raise_for_status()
-            logger.info(
-                "measurement_upserted",
-                external_measurement_id=measurement_data.get(
-                    "external_measurement_id"
-                ),
-                status_code=response.status_code,
-            )
-            return response.json()
+        url = f"{self.base_url}/api/internal/measurements/upsert"
+        response = await self._post(url, measurement_data, timeout=30.0)
+        logger.info(
+            "measurement_upserted",
+            external_measurement_id=measurement_data.get(
+                "external_measurement_id"
+            ),
+            status_code=response.status_code,
+        )
+        return response.json()
+
+    async def upsert_orders_bulk(
+        self, records: List[Dict[str, Any]], concurrency: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        発注データ一括upsert
+        
+        Returns:
+            レコード単位の結果（入力順、status: 'upserted' | 'failed'）
+        """
+        return await self._upsert_bulk(
+            "orders", records, "external_order_id", concurrency
+        )
+
+    async def upsert_measurements_bulk(
+        self, records: List[Dict[str, Any]], concurrency: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        測定データ一括upsert
+        
+        Returns:
+            レコード単位の結果（入力順、status: 'upserted' | 'failed'）
+        """
+        return await self._upsert_bulk(
+            "measurements", records, "external_measurement_id", concurrency
+        )
+
+    async def _upsert_bulk(
+        self,
+        entity: str,
+        records: List[Dict[str, Any]],
+        id_field: str,
+        concurrency: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        BULK_UPSERT_BATCH_SIZE件ずつ /api/internal/{entity}/upsert/bulk へ送信
+        リクエスト自体が失敗したバッチ（応答の解析失敗を含む）は全レコードをfailedとして返す
+        （permanent: 再実行しても変わらない失敗か。API側が明示しないレコードは一時的として扱う）
+        """
+        batch_size = settings.BULK_UPSERT_BATCH_SIZE
+        url = f"{self.base_url}/api/internal/{entity}/upsert/bulk"
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(start: int) -> List[Dict[str, Any]]:
+            batch = records[start:start + batch_size]
+            async with semaphore:
+                try:
+                    response = await self._post(url, {"records": batch}, timeout=60.0)
+                    results = response.json()["results"]
+                except Exception as e:
+                    return [
+                        {
+                            "index": start + i,
+                            id_field: record.get(id_field),
+                            "status": "failed",
+                            "error": str(e),
+                            "permanent": is_permanent_failure(e),
+                        }
+                        for i, record in enumerate(batch)
+                    ]
+            return [{**result, "index": start + result["index"]} for result in results]
+
+        batches = await asyncio.gather(
+            *(send(start) for start in range(0, len(records), batch_size))
+        )
+        results = [result for batch in batches for result in batch]
+        failed = sum(1 for r in results if r.get("status") != "upserted")
+        logger.info(
+            f"{entity}_bulk_upserted",
+            total=len(records),
+            failed=failed,
+            requests=len(batches),
+        )
+        return results
 
 
 # シングルトンインスタンス
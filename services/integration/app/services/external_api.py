@@ -3,122 +3,76 @@
 サーキットブレーカ、指数バックオフ、レート制限対応
 """
 import httpx
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import AsyncGenerator, Awaitable, Callable, List, Dict, Any, Optional, Tuple
 import asyncio
 
+from ..core.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, circuit_breakers
 from ..core.config import get_settings
+from ..core.http_client import HTTPClientPool, http_client_pool
 from ..core.logging import logger
+from ..core.rate_limiter import HostRateLimiter
+from ..core.retry import RetryPolicy, create_retry_policy
+from ..core.timing import stage
 
 settings = get_settings()
 
-
-class CircuitBreaker:
-    """簡易サーキットブレーカ"""
-
-    def __init__(self, failure_threshold: int = 5, timeout_seconds: int = 60):
-        self.failure_threshold = failure_threshold
-        self.timeout_seconds = timeout_seconds
-        self.failure_count = 0
-        self.last_failure_time: Optional[datetime] = None
-        self.state = "closed"  # closed, open, half_open
-
-    def call_succeeded(self):
-        """成功時"""
-        self.failure_count = 0
-        self.state = "closed"
-
-    def call_failed(self):
-        """失敗時"""
-        self.failure_count += 1
-        self.last_failure_time = datetime.now()
-
-        if self.failure_count >= self.failure_threshold:
-            self.state = "open"
-            logger.warning(
-                "circuit_breaker_opened",
-                failure_count=self.failure_count,
-            )
-
-    def can_attempt(self) -> bool:
-        """リクエスト可能か"""
-        if self.state == "closed":
-            return True
-
-        if self.state == "open":
-            # タイムアウト経過で半開状態へ
-            if (
-                self.last_failure_time
-                and (datetime.now() - self.last_failure_time).seconds
-                > self.timeout_seconds
-            ):
-                self.state = "half_open"
-                logger.info("circuit_breaker_half_open")
-                return True
-            return False
-
-        # half_open
-        return True
+# 外部API（発注・測定）のホスト単位レート制限
+external_rate_limiter = HostRateLimiter(
+    "external_api", settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST
+)
 
 
 class ExternalAPIClient:
     """外部APIクライアント（発注・測定）"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        http_pool: HTTPClientPool = http_client_pool,
+        rate_limiter: HostRateLimiter = external_rate_limiter,
+        breakers: CircuitBreakerRegistry = circuit_breakers,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
         self.ordering_base_url = settings.external_ordering_api_url
         self.measurement_base_url = settings.external_measurement_api_url
         self.api_key = settings.external_api_key
-        self.circuit_breaker = CircuitBreaker()
+        self._breakers = breakers
+        self._retry = retry_policy or create_retry_policy("external_api")
+        self._http_pool = http_pool
+        self._rate_limiter = rate_limiter
 
     async def _request_with_retry(
         self,
         method: str,
         url: str,
-        max_attempts: int = 3,
+        max_attempts: Optional[int] = None,
         **kwargs,
     ) -> httpx.Response:
-        """指数バックオフ付きリトライ"""
-        for attempt in range(1, max_attempts + 1):
-            try:
-                if not self.circuit_breaker.can_attempt():
-                    raise Exception("Circuit breaker is open")
-
-                async with httpx.AsyncClient() as client:
-                    response = await client.request(method, url, **kwargs)
-
-                    # 429の場合はリトライ
-                    if response.status_code == 429:
-                        retry_after = int(response.headers.get("Retry-After", 5))
-                        logger.warning(
-                            "rate_limited",
-                            url=url,
-                            retry_after=retry_after,
-                            attempt=attempt,
-                        )
-                        await asyncio.sleep(retry_after)
-                        continue
-
-                    response.raise_for_status()
-                    self.circuit_breaker.call_succeeded()
-                    return response
-
-            except Exception as e:
-                self.circuit_breaker.call_failed()
-                logger.error(
-                    "external_api_request_failed",
-                    url=url,
-                    attempt=attempt,
-                    error=str(e),
-                )
-
-                if attempt == max_attempts:
-                    raise
-
-                # 指数バックオフ（ジッター付き）
-                backoff = min(2**attempt + (attempt * 0.1), settings.BACKOFF_MAX_SECONDS)
-                await asyncio.sleep(backoff)
-
-        raise Exception(f"Max retry attempts ({max_attempts}) exceeded")
+        """
+        再試行付きリクエスト（RetryPolicy: jitter・予算・期限）
+        ブレーカopen中は待機・再試行せず CircuitOpenError を送出
+        """
+        breaker = self._breakers.for_url(url)
+
+        async def attempt() -> httpx.Response:
+            await self._rate_limiter.acquire(url)
+            client = self._http_pool.client_for(url)
+            response = await breaker.call(
+                lambda: client.request(method, url, **kwargs)
+            )
+            # 429はRetry-Afterまでレート制限側で待機させてから再試行
+            self._rate_limiter.observe(url, response)
+            response.raise_for_status()
+            return response
+
+        try:
+            with stage("external_api"):
+                return await self._retry.run(attempt, max_attempts=max_attempts, url=url)
+        except CircuitOpenError as e:
+            logger.warning("external_api_circuit_open", url=url, error=str(e))
+            raise
+        except Exception as e:
+            logger.error("external_api_request_failed", url=url, error=str(e))
+            raise
 
     async def fetch_orders(
         self, updated_since: Optional[str] = None, page: int = 1, page_size: int = 100
@@ -188,6 +142,64 @@ class ExternalAPIClient:
         )
         return data.get("items", [])
 
+    def iter_order_pages(
+        self,
+        updated_since: Optional[str] = None,
+        page_size: int = 100,
+        start_page: int = 1,
+    ) -> AsyncGenerator[Tuple[int, List[Dict[str, Any]]], None]:
+        """発注データを最終ページまで順に取得（次ページ先読み）"""
+        return self._iter_pages(self.fetch_orders, updated_since, page_size, start_page)
+
+    def iter_measurement_pages(
+        self,
+        updated_since: Optional[str] = None,
+        page_size: int = 100,
+        start_page: int = 1,
+    ) -> AsyncGenerator[Tuple[int, List[Dict[str, Any]]], None]:
+        """測定データを最終ページまで順に取得（次ページ先読み）"""
+        return self._iter_pages(
+            self.fetch_measurements, updated_since, page_size, start_page
+        )
+
+    async def _iter_pages(
+        self,
+        fetch_page: Callable[..., Awaitable[List[Dict[str, Any]]]],
+        updated_since: Optional[str],
+        page_size: int,
+        start_page: int,
+    ) -> AsyncGenerator[Tuple[int, List[Dict[str, Any]]], None]:
+        """
+        ページネーション（async generator）
+        呼び出し側がページNを処理している間にページN+1を取得しておく
+        page_size未満のページを受け取った時点で終端とみなす
+
+        Yields:
+            (ページ番号, アイテム一覧)
+        """
+
+        def fetch(page: int) -> asyncio.Task:
+            return asyncio.ensure_future(
+                fetch_page(updated_since=updated_since, page=page, page_size=page_size)
+            )
+
+        page = start_page
+        next_task: Optional[asyncio.Task] = fetch(page)
+        try:
+            while next_task is not None:
+                items = await next_task
+                next_task = fetch(page + 1) if len(items) >= page_size else None
+                if items:
+                    yield page, items
+                page += 1
+        finally:
+            # 途中終了時は先読み中のリクエストを破棄（完了済みの例外は回収しておく）
+            if next_task is not None:
+                if not next_task.done():
+                    next_task.cancel()
+                elif not next_task.cancelled():
+                    next_task.exception()
+
 
 # シングルトンインスタンス
 external_api_client = ExternalAPIClient()
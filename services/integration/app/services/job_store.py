@@ -0,0 +1,351 @@
+"""
+Integration Jobs ローカル永続キュー
+integration_jobs テーブル相当をSQLite（WAL）に保持し、リース方式で取得する
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_SCHEMA = """
+create table if not exists integration_jobs (
+  id text primary key,
+  job_type text not null,
+  payload text not null,
+  event_id text,
+  status text not null default 'queued',
+  attempts integer not null default 0,
+  last_error text,
+  lease_owner text,
+  lease_expires_at real,
+  version real,
+  available_at real,
+  created_at text not null,
+  updated_at text not null
+);
+create index if not exists idx_integration_jobs_status
+  on integration_jobs(status, created_at);
+create table if not exists integration_job_events (
+  seq integer primary key autoincrement,
+  job_id text not null,
+  status text not null,
+  last_error text,
+  at text not null
+);
+"""
+
+# 既存DBに後から追加した列（起動時に不足分を追加）
+_ADDED_COLUMNS = {
+    "version": "real",
+    "available_at": "real",
+}
+
+# 合算済みの状態更新（ジョブ単位に1行）
+#   id, status, last_error, lease_owner, lease_expires_at, available_at, at: 最終状態
+#   runner: 期間中にrunningへ遷移させたワーカー（なければNone）
+#   transitions: 期間中の全遷移 [{"status", "last_error", "at"}]（遷移ログへ全件記録）
+JobWrite = Dict[str, Any]
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SQLiteJobStore:
+    """
+    SQLiteジョブストア
+    - integration_jobs: ジョブの現在状態（queued / running / succeeded / failed）
+    - integration_job_events: 状態遷移の追記専用ログ
+    複数プロセスから同一ファイルを共有できる（書き込みはSQLiteのロックで直列化）
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                timeout=30.0,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.executescript(_SCHEMA)
+            columns = {
+                row["name"] for row in conn.execute("pragma table_info(integration_jobs)")
+            }
+            for name, column_type in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"alter table integration_jobs add column {name} {column_type}")
+            self._conn = conn
+        return self._conn
+
+    def insert_jobs(self, jobs: List[Dict[str, Any]]):
+        """
+        ジョブ作成を即時反映（受付応答の前に永続化する）
+
+        Args:
+            jobs: id, job_type, payload（JSON文字列）, event_id, version, status, runner,
+                  lease_owner, lease_expires_at, created_at
+        """
+        if not jobs:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("begin immediate")
+            try:
+                conn.executemany(
+                    """
+                    insert into integration_jobs
+                      (id, job_type, payload, event_id, version, status, attempts, last_error,
+                       lease_owner, lease_expires_at, created_at, updated_at)
+                    values (:id, :job_type, :payload, :event_id, :version, :status,
+                            case when :runner is null then 0 else 1 end, null,
+                            :lease_owner, :lease_expires_at, :created_at, :created_at)
+                    """,
+                    jobs,
+                )
+                conn.executemany(
+                    """
+                    insert into integration_job_events (job_id, status, last_error, at)
+                    values (:id, :status, null, :created_at)
+                    """,
+                    jobs,
+                )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+
+    def write_batch(self, writes: List[JobWrite]):
+        """
+        合算済みの状態更新を1トランザクションで一括反映（遷移ログは全遷移を記録）
+
+        runningへの遷移があった行は attempts+1
+        （ただし同一ワーカーがリース中のジョブはリース延長扱いで増やさない）
+        """
+        if not writes:
+            return
+        transitions = [
+            {"id": w["id"], **transition}
+            for w in writes
+            for transition in w["transitions"]
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.execute("begin immediate")
+            try:
+                conn.executemany(
+                    """
+                    update integration_jobs set
+                      attempts = attempts + case
+                        when :runner is not null
+                         and not (status = 'running' and lease_owner is :runner)
+                        then 1 else 0 end,
+                      status = :status,
+                      last_error = coalesce(:last_error, last_error),
+                      lease_owner = :lease_owner,
+                      lease_expires_at = :lease_expires_at,
+                      available_at = :available_at,
+                      updated_at = :at
+                    where id = :id
+                    """,
+                    writes,
+                )
+                conn.executemany(
+                    """
+                    insert into integration_job_events (job_id, status, last_error, at)
+                    values (:id, :status, :last_error, :at)
+                    """,
+                    transitions,
+                )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+
+    def claim(
+        self,
+        owner: str,
+        lease_seconds: float,
+        limit: int,
+        job_types: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        実行可能時刻を過ぎたqueuedのジョブをリース付きで取得（running、attempts+1）
+
+        Args:
+            owner: ワーカー識別子
+            lease_seconds: リース期間
+            limit: 最大取得件数
+            job_types: 対象ジョブ種別（Noneは全種別）
+        """
+        now = time.time()
+        at = now_iso()
+        type_filter = ""
+        params: List[Any] = [owner, now + lease_seconds, at, now]
+        if job_types:
+            type_filter = f"and job_type in ({','.join('?' * len(job_types))})"
+            params.extend(job_types)
+        params.append(limit)
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute("begin immediate")
+            try:
+                rows = conn.execute(
+                    f"""
+                    update integration_jobs set
+                      status = 'running',
+                      attempts = attempts + 1,
+                      lease_owner = ?,
+                      lease_expires_at = ?,
+                      updated_at = ?
+                    where id in (
+                      select id from integration_jobs
+                       where status = 'queued'
+                         and (available_at is null or available_at <= ?) {type_filter}
+                       order by created_at
+                       limit ?
+                    )
+                    returning *
+                    """,
+                    params,
+                ).fetchall()
+                conn.executemany(
+                    """
+                    insert into integration_job_events (job_id, status, last_error, at)
+                    values (?, 'running', null, ?)
+                    """,
+                    [(row["id"], at) for row in rows],
+                )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job["payload"] = json.loads(job["payload"])
+        return jobs
+
+    def count_queued(self, job_types: Optional[List[str]] = None) -> int:
+        """
+        queuedのジョブ数（未処理のバックログ）
+
+        Args:
+            job_types: 対象ジョブ種別（Noneは全種別）
+        """
+        type_filter = ""
+        if job_types:
+            type_filter = f"and job_type in ({','.join('?' * len(job_types))})"
+        with self._lock:
+            row = self._connect().execute(
+                f"select count(*) from integration_jobs where status = 'queued' {type_filter}",
+                job_types or [],
+            ).fetchone()
+        return row[0]
+
+    def extend_leases(self, owner: str, job_ids: List[str], lease_seconds: float) -> int:
+        """
+        実行中ジョブのリース延長（自分がリース中のrunningのみ、遷移ログには記録しない）
+
+        Args:
+            owner: ワーカー識別子
+            job_ids: 対象ジョブID
+            lease_seconds: 延長後のリース期間（現在時刻から）
+
+        Returns:
+            延長した件数
+        """
+        if not job_ids:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                """
+                update integration_jobs set lease_expires_at = ?
+                where id in (select value from json_each(?))
+                  and status = 'running' and lease_owner = ?
+                """,
+                (time.time() + lease_seconds, json.dumps(job_ids), owner),
+            )
+            return cursor.rowcount
+
+    def requeue_expired_leases(
+        self, requeue_job_types: Optional[List[str]] = None
+    ) -> Tuple[int, int]:
+        """
+        リース切れのrunningジョブを回収（クラッシュ復旧）
+        取得するワーカーがいる種別はqueuedに戻し、それ以外はfailedにする
+
+        Args:
+            requeue_job_types: queuedに戻す種別（Noneは全種別）
+
+        Returns:
+            (queuedに戻した件数, failedにした件数)
+        """
+        at = now_iso()
+        now = time.time()
+        params: List[Any] = []
+        if requeue_job_types is None:
+            requeue_filter = "1"
+        elif requeue_job_types:
+            requeue_filter = f"job_type in ({','.join('?' * len(requeue_job_types))})"
+            params = list(requeue_job_types)
+        else:
+            requeue_filter = "0"
+        with self._lock:
+            conn = self._connect()
+            conn.execute("begin immediate")
+            try:
+                rows = conn.execute(
+                    f"""
+                    update integration_jobs set
+                      status = case when {requeue_filter} then 'queued' else 'failed' end,
+                      last_error = case when {requeue_filter} then last_error
+                                        else 'lease expired' end,
+                      lease_owner = null, lease_expires_at = null,
+                      updated_at = ?
+                    where status = 'running' and lease_expires_at < ?
+                    returning id, status
+                    """,
+                    [*params, *params, at, now],
+                ).fetchall()
+                conn.executemany(
+                    """
+                    insert into integration_job_events (job_id, status, last_error, at)
+                    values (?, ?, 'lease expired', ?)
+                    """,
+                    [(row["id"], row["status"], at) for row in rows],
+                )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+        requeued = sum(1 for row in rows if row["status"] == "queued")
+        return requeued, len(rows) - requeued
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブ取得"""
+        with self._lock:
+            row = self._connect().execute(
+                "select * from integration_jobs where id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def close(self):
+        """接続クローズ"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -2,61 +2,140 @@
 Integration Jobs トラッキング
 Webhook/同期ジョブの実行履歴を記録
 """
-from uuid import UUID
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
 import structlog
 from ..core.config import get_settings
+from ..core.metrics import job_tracker_flush_seconds, webhook_stage_seconds
+from ..core.timing import stage
+from .job_store import JobWrite, SQLiteJobStore, now_iso
 
 logger = structlog.get_logger()
 settings = get_settings()
 
 
 class JobTracker:
-    """Integration jobsの記録管理"""
-    
-    def __init__(self):
-        # TODO: Supabaseクライアント初期化（環境変数から）
-        # from supabase import create_client
-        # self.supabase = create_client(settings.supabase_url, settings.supabase_service_role_key)
-        pass
-    
+    """
+    Integration jobsの記録管理
+    ジョブ作成は即時に永続化し（受付応答の前に記録が残る）、
+    以降の状態遷移はジョブ単位でバッファ上に合算して件数または時間で一括反映する（write-behind）
+    合算するのは現在状態の更新のみで、遷移ログ（integration_job_events）には全遷移を記録する
+    実行中のジョブのリースは定期的に延長する（リース期間より長い処理が回収されて二重実行されない）
+    """
+
+    def __init__(self, store: SQLiteJobStore):
+        self.store = store
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._pending: Dict[str, JobWrite] = {}
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._recoverer: Optional[asyncio.Task] = None
+        self._renewer: Optional[asyncio.Task] = None
+        # このプロセスがリース中（実行中）のジョブ
+        self._leases: Set[str] = set()
+        # リース切れ時にqueuedへ戻す種別（Noneは全種別、それ以外はfailed）
+        self._requeue_job_types: Optional[List[str]] = None
+
+        # メトリクス
+        self.transitions = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
     async def create_job(
         self,
         job_type: str,
         payload: dict,
-        event_id: str | None = None
+        event_id: str | None = None,
+        version: float | None = None,
+        status: str = "queued",
     ) -> str:
         """
         ジョブ作成
-        
+
         Args:
             job_type: 'webhook_order' | 'webhook_measurement' | 'sync_orders' | 'sync_measurements'
             payload: ジョブデータ
             event_id: イベントID（Webhook時）
-        
+            version: 更新バージョン（同一レコードの後勝ち判定）
+            status: 'queued'（ワーカーが取得） | 'running'（呼び出し元がそのまま処理）
+
         Returns:
             job_id: 作成されたジョブID
         """
+        job_ids = await self.create_jobs([(job_type, payload, event_id, version)], status)
+        return job_ids[0]
+
+    async def create_jobs(
+        self,
+        jobs: List[Tuple[str, dict, Optional[str], Optional[float]]],
+        status: str = "queued",
+    ) -> List[str]:
+        """
+        ジョブ一括作成（1トランザクションで永続化してから返す）
+
+        Args:
+            jobs: (job_type, payload, event_id, version) のリスト
+            status: 'queued'（ワーカーが取得） | 'running'（呼び出し元がそのまま処理）
+
+        Returns:
+            job_ids: 作成されたジョブID（入力順）
+        """
         try:
-            job_data = {
-                "job_type": job_type,
-                "payload": payload,
-                "status": "queued",
-                "attempts": 0,
-                "event_id": event_id,
-            }
-            
-            # TODO: Supabaseへの挿入実装
-            # result = self.supabase.table("integration_jobs").insert(job_data).execute()
-            # job_id = result.data[0]["id"]
-            
-            # 現状はログのみ
-            logger.info("job_created", job_type=job_type, event_id=event_id)
-            return "mock-job-id"  # スタブ
-        
+            created_at = now_iso()
+            # runningで作成する場合はリースを取得（ワーカーに取得されない）
+            runner = self.worker_id if status == "running" else None
+            lease_expires_at = (
+                time.time() + settings.JOB_LEASE_SECONDS if runner else None
+            )
+            rows = [
+                {
+                    "id": str(uuid4()),
+                    "job_type": job_type,
+                    "payload": json.dumps(payload, ensure_ascii=False, default=str),
+                    "event_id": event_id,
+                    "version": version,
+                    "status": status,
+                    "lease_owner": runner,
+                    "lease_expires_at": lease_expires_at,
+                    "runner": runner,
+                    "created_at": created_at,
+                }
+                for job_type, payload, event_id, version in jobs
+            ]
+
+            with stage("job_update", webhook_stage_seconds):
+                await asyncio.to_thread(self.store.insert_jobs, rows)
+            if runner:
+                self._leases.update(row["id"] for row in rows)
+
+            for row in rows:
+                logger.info(
+                    "job_created",
+                    job_type=row["job_type"],
+                    event_id=row["event_id"],
+                    job_id=row["id"],
+                    status=status,
+                )
+            return [row["id"] for row in rows]
+
         except Exception as e:
-            logger.error("job_create_failed", error=str(e), job_type=job_type)
+            logger.error(
+                "job_create_failed",
+                error=str(e),
+                job_types=sorted({job[0] for job in jobs}),
+            )
             raise
-    
+
     async def update_job_status(
         self,
         job_id: str,
@@ -65,7 +144,7 @@ class JobTracker:
     ):
         """
         ジョブステータス更新
-        
+
         Args:
             job_id: ジョブID
             status: 'running' | 'succeeded' | 'failed'
@@ -73,27 +152,254 @@ class JobTracker:
         """
         try:
             update_data = {
+                "id": job_id,
                 "status": status,
-                "updated_at": "now()",
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "available_at": None,
+                "at": now_iso(),
             }
-            
-            if status == "running":
-                # attemptsをインクリメント
-                # update_data["attempts"] = "attempts + 1"  # SQL式
-                pass
-            
+
             if last_error:
                 update_data["last_error"] = last_error
-            
-            # TODO: Supabaseへの更新実装
-            # self.supabase.table("integration_jobs").update(update_data).eq("id", job_id).execute()
-            
+
+            if status == "running":
+                # attemptsをインクリメントし、リースを取得
+                update_data["runner"] = self.worker_id
+                update_data["lease_owner"] = self.worker_id
+                update_data["lease_expires_at"] = time.time() + settings.JOB_LEASE_SECONDS
+                self._leases.add(job_id)
+            else:
+                self._leases.discard(job_id)
+
+            with stage("job_update", webhook_stage_seconds):
+                self._record(update_data)
+
             logger.info("job_status_updated", job_id=job_id, status=status)
-        
+
         except Exception as e:
             logger.error("job_update_failed", error=str(e), job_id=job_id, status=status)
             # 更新失敗は致命的ではないため、例外を投げずにログのみ
-    
+
+    async def retry_job(self, job_id: str, attempts: int, last_error: str) -> float:
+        """
+        一時的な失敗のジョブをバックオフ後に再実行するようqueuedへ戻す
+
+        待機は指数バックオフ＋ジッター: uniform(0.5, 1.0) * min(上限, 基準 * 2^(attempts-1))
+
+        Args:
+            job_id: ジョブID
+            attempts: これまでの実行回数
+            last_error: エラーメッセージ
+
+        Returns:
+            再実行までの秒数
+        """
+        delay = min(
+            settings.JOB_RETRY_MAX_DELAY_SECONDS,
+            settings.JOB_RETRY_BASE_DELAY_SECONDS * 2 ** max(attempts - 1, 0),
+        ) * random.uniform(0.5, 1.0)
+        self._leases.discard(job_id)
+        self._record(
+            {
+                "id": job_id,
+                "status": "queued",
+                "last_error": last_error,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "available_at": time.time() + delay,
+                "at": now_iso(),
+            }
+        )
+        logger.info("job_retry_scheduled", job_id=job_id, attempts=attempts, delay=round(delay, 2))
+        return delay
+
+    async def claim_jobs(self, job_types: List[str], limit: int) -> List[Dict[str, Any]]:
+        """
+        queuedジョブをリース付きで取得（複数ワーカー間で重複しない）
+
+        Args:
+            job_types: 対象ジョブ種別
+            limit: 最大取得件数
+        """
+        await self.flush()
+        jobs = await asyncio.to_thread(
+            self.store.claim,
+            self.worker_id,
+            settings.JOB_LEASE_SECONDS,
+            limit,
+            job_types,
+        )
+        self._leases.update(job["id"] for job in jobs)
+        return jobs
+
+    async def count_queued(self, job_types: List[str]) -> int:
+        """queuedジョブ数（未処理のバックログ）"""
+        return await asyncio.to_thread(self.store.count_queued, job_types)
+
+    async def recover(self) -> int:
+        """
+        リース切れのrunningジョブを回収（クラッシュしたワーカーのジョブ）
+        取得するワーカーがいる種別はqueuedに戻し、それ以外はfailedにする
+
+        Returns:
+            回収した件数
+        """
+        requeued, failed = await asyncio.to_thread(
+            self.store.requeue_expired_leases, self._requeue_job_types
+        )
+        if requeued:
+            logger.warning("jobs_requeued_after_lease_expiry", count=requeued)
+        if failed:
+            logger.warning("jobs_failed_after_lease_expiry", count=failed)
+        return requeued + failed
+
+    async def renew_leases(self) -> int:
+        """実行中ジョブのリース延長"""
+        if not self._leases:
+            return 0
+        return await asyncio.to_thread(
+            self.store.extend_leases,
+            self.worker_id,
+            list(self._leases),
+            settings.JOB_LEASE_SECONDS,
+        )
+
+    def _record(self, write: JobWrite):
+        """
+        状態遷移をバッファに合算（同一ジョブの現在状態は最終状態の1行にまとめ、遷移は全件保持）
+        """
+        self.transitions += 1
+        transitions = write.get("transitions") or [
+            {
+                "status": write["status"],
+                "last_error": write.get("last_error"),
+                "at": write["at"],
+            }
+        ]
+        pending = self._pending.get(write["id"])
+        if pending is None:
+            self._pending[write["id"]] = {
+                "last_error": None,
+                "runner": None,
+                **write,
+                "transitions": list(transitions),
+            }
+        else:
+            # runner / last_error は期間中に一度でも設定されたら保持
+            runner = write.get("runner") or pending.get("runner")
+            last_error = write.get("last_error") or pending.get("last_error")
+            pending_transitions = pending["transitions"] + transitions
+            pending.update(
+                write,
+                runner=runner,
+                last_error=last_error,
+                transitions=pending_transitions,
+            )
+
+        if len(self._pending) >= settings.JOB_TRACKER_FLUSH_BATCH_SIZE:
+            self._flush_event.set()
+
+    async def flush(self):
+        """バッファをSQLiteへ一括反映（バッチ間の順序を保つため直列実行）"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.store.write_batch, list(pending.values()))
+            except Exception as e:
+                # 次回フラッシュで再試行（その間の遷移は後勝ちで合算）
+                self.flush_failures += 1
+                for job_id, write in pending.items():
+                    newer = self._pending.pop(job_id, None)
+                    self._pending[job_id] = write
+                    if newer is not None:
+                        self._record(newer)
+                        self.transitions -= 1
+                logger.error("job_flush_failed", error=str(e), pending=len(self._pending))
+                return
+
+            elapsed = time.perf_counter() - started
+            job_tracker_flush_seconds.observe(elapsed)
+            self.flushes += 1
+            self.rows_written += len(pending)
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        """write-behindバッファのメトリクス"""
+        return {
+            "buffer_depth": len(self._pending),
+            "transitions": self.transitions,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "leases": len(self._leases),
+        }
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_event.wait(),
+                    timeout=settings.JOB_TRACKER_FLUSH_INTERVAL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def _recovery_loop(self):
+        """リース切れジョブの定期回収（稼働中に他プロセスがクラッシュした場合も拾う）"""
+        while True:
+            await asyncio.sleep(settings.JOB_RECOVERY_INTERVAL_SECONDS)
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error("job_recovery_failed", error=str(e))
+
+    async def _renewal_loop(self):
+        """実行中ジョブのリースをリース期間の1/3ごとに延長"""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                await self.renew_leases()
+            except Exception as e:
+                logger.error("job_lease_renewal_failed", error=str(e), leases=len(self._leases))
+
+    async def start(self, requeue_job_types: Optional[List[str]] = None):
+        """
+        起動処理（クラッシュ復旧→フラッシュ・定期回収・リース延長タスク開始）
+
+        Args:
+            requeue_job_types: リース切れ時にqueuedへ戻す種別（取得するワーカーがいる種別、Noneは全種別）
+        """
+        self._requeue_job_types = requeue_job_types
+        await self.recover()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._recoverer = asyncio.create_task(self._recovery_loop())
+        self._renewer = asyncio.create_task(self._renewal_loop())
+
+    async def stop(self):
+        """終了処理（残りを反映してクローズ）"""
+        tasks = [
+            task
+            for task in (self._flusher, self._recoverer, self._renewer)
+            if task is not None
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._flusher = None
+        self._recoverer = None
+        self._renewer = None
+        await self.flush()
+        self.store.close()
+
     async def record_job_lifecycle(
         self,
         job_type: str,
@@ -102,7 +408,7 @@ class JobTracker:
     ):
         """
         ジョブのライフサイクル全体を記録するコンテキストマネージャー風ヘルパー
-        
+
         Usage:
             job_id = await job_tracker.create_job(...)
             await job_tracker.update_job_status(job_id, "running")
@@ -116,5 +422,4 @@ class JobTracker:
 
 
 # シングルトンインスタンス
-job_tracker = JobTracker()
-
+job_tracker = JobTracker(SQLiteJobStore(settings.JOB_QUEUE_DB_PATH))
@@ -0,0 +1,245 @@
+"""
+キー単位ディスパッチャ
+同一キー（source_system, external_id）の反映は直列に、異なるキーは並列に実行する
+"""
+import asyncio
+import contextvars
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import structlog
+
+from ..core.config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+# 新しい更新に置き換えられて実行されなかったことを示す戻り値
+SUPERSEDED = object()
+
+_Handler = Callable[[], Awaitable[Any]]
+# 一括反映: 反映対象のキーを受け取り、反映に成功したキーを返す
+_BulkHandler = Callable[[List[Hashable]], Awaitable[Iterable[Hashable]]]
+
+
+# 待機中の更新（version, handler, 結果, 投入元のコンテキスト）
+_Pending = Tuple[Optional[float], _Handler, asyncio.Future, contextvars.Context]
+
+
+class _KeyState:
+    """キーごとの実行状態（実行中1件＋待機中の最新1件）"""
+
+    __slots__ = ("pending", "running_version", "task", "released")
+
+    def __init__(self):
+        self.pending: Optional[_Pending] = None
+        self.running_version: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # キーの実行が全て終わり解放されたら設定（一括反映の待ち合わせ用）
+        self.released = asyncio.Event()
+
+
+class KeyedDispatcher:
+    """
+    キー単位の直列化＋後勝ち（version = 更新時刻）
+
+    - 同一キーで待機中の更新は最新の1件だけ残し、古いものは実行せず SUPERSEDED を返す
+    - 実行中・反映済みより古い version の更新も SUPERSEDED
+    - version が None の更新は到着順で後勝ち（比較しない）
+    - 全キー合計の同時実行数は concurrency まで
+    - 待機中の更新は実行直前にも反映済みversionと比較する（待機中に新しい更新が反映された場合）
+    - 一括反映（submit_bulk）は対象キーをまとめて確保し、同一キーの個別更新と直列化する
+    - handler は投入元のコンテキスト（contextvars: ログの紐付け・期限など）で実行する
+
+    Args:
+        concurrency: 同時実行数
+        version_cache_size: 反映済みversionを保持するキー数（超過分は古い順に忘れる）
+    """
+
+    def __init__(self, concurrency: int, version_cache_size: int):
+        self.concurrency = concurrency
+        self.version_cache_size = version_cache_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._active: Dict[Hashable, _KeyState] = {}
+        self._applied: "OrderedDict[Hashable, float]" = OrderedDict()
+
+        # メトリクス
+        self.executed = 0
+        self.superseded = 0
+
+    def _is_stale(self, key: Hashable, version: Optional[float]) -> bool:
+        if version is None:
+            return False
+        state = self._active.get(key)
+        if state is not None and state.running_version is not None:
+            if version < state.running_version:
+                return True
+        applied = self._applied.get(key)
+        return applied is not None and version < applied
+
+    def _remember(self, key: Hashable, version: float):
+        applied = self._applied.get(key)
+        if applied is None or version >= applied:
+            self._applied[key] = version
+        self._applied.move_to_end(key)
+        while len(self._applied) > self.version_cache_size:
+            self._applied.popitem(last=False)
+
+    def _supersede(self, key: Hashable, future: Optional[asyncio.Future] = None):
+        self.superseded += 1
+        logger.info("keyed_dispatch_superseded", key=str(key))
+        if future is not None and not future.done():
+            future.set_result(SUPERSEDED)
+
+    async def submit(
+        self, key: Hashable, version: Optional[float], handler: _Handler
+    ) -> Any:
+        """
+        キーの更新を投入し、実行結果を待つ
+
+        Returns:
+            handlerの戻り値、または SUPERSEDED（より新しい更新があり実行しなかった）
+
+        Raises:
+            Exception: handlerの例外
+        """
+        if self._is_stale(key, version):
+            self._supersede(key)
+            return SUPERSEDED
+
+        future = asyncio.get_running_loop().create_future()
+        context = contextvars.copy_context()
+        state = self._active.get(key)
+        if state is None:
+            state = _KeyState()
+            state.pending = (version, handler, future, context)
+            self._active[key] = state
+            # 実行ループ自体は最初の投入元のコンテキストを引き継がない
+            state.task = asyncio.create_task(
+                self._drain(key, state), context=contextvars.Context()
+            )
+        else:
+            if state.pending is not None:
+                pending_version, _, pending_future, _ = state.pending
+                if (
+                    version is not None
+                    and pending_version is not None
+                    and version < pending_version
+                ):
+                    self._supersede(key)
+                    return SUPERSEDED
+                self._supersede(key, pending_future)
+            state.pending = (version, handler, future, context)
+
+        return await future
+
+    async def submit_bulk(
+        self, versions: Dict[Hashable, Optional[float]], handler: _BulkHandler
+    ) -> Tuple[Set[Hashable], Set[Hashable]]:
+        """
+        複数キーの更新を1回の処理（一括upsert）でまとめて反映
+        対象キーの実行中・待機中の更新が終わるのを待ってから全キーを同時に確保し
+        （部分的に確保して待つことはしないため一括反映同士でデッドロックしない）、
+        確保中に届いた同一キーの更新は完了後に実行する
+
+        Args:
+            versions: キー → version（1キー1件）
+            handler: 反映対象のキーを受け取り、反映に成功したキーを返す
+
+        Returns:
+            (反映に成功したキー, 実行中・反映済みより古く SUPERSEDED としたキー)
+
+        Raises:
+            Exception: handlerの例外
+        """
+        while True:
+            busy = [self._active[key] for key in versions if key in self._active]
+            if not busy:
+                break
+            await busy[0].released.wait()
+
+        superseded = {key for key, version in versions.items() if self._is_stale(key, version)}
+        for key in superseded:
+            self._supersede(key)
+        keys = [key for key in versions if key not in superseded]
+        for key in keys:
+            state = _KeyState()
+            state.running_version = versions[key]
+            self._active[key] = state
+
+        applied: Set[Hashable] = set()
+        try:
+            async with self._semaphore:
+                try:
+                    applied = set(await handler(keys)) if keys else set()
+                finally:
+                    self.executed += len(keys)
+            for key in applied:
+                version = versions[key]
+                if version is not None:
+                    self._remember(key, version)
+        finally:
+            for key in keys:
+                state = self._active[key]
+                state.running_version = None
+                if state.pending is not None:
+                    # 確保中に届いた個別更新を続けて実行
+                    state.task = asyncio.create_task(
+                        self._drain(key, state), context=contextvars.Context()
+                    )
+                else:
+                    del self._active[key]
+                    state.released.set()
+        return applied, superseded
+
+    async def _drain(self, key: Hashable, state: _KeyState):
+        """キーの待機分がなくなるまで直列に実行"""
+        try:
+            while state.pending is not None:
+                version, handler, future, context = state.pending
+                state.pending = None
+                state.running_version = None
+                if future.done():
+                    # 呼び出し元がキャンセル済み
+                    continue
+                if self._is_stale(key, version):
+                    # 待機中により新しい更新が反映済み
+                    self._supersede(key, future)
+                    continue
+                state.running_version = version
+                async with self._semaphore:
+                    try:
+                        # 投入元のコンテキストで実行
+                        result = await asyncio.create_task(
+                            context.run(handler), context=context
+                        )
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    finally:
+                        self.executed += 1
+                if version is not None:
+                    self._remember(key, version)
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            del self._active[key]
+            state.released.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """ディスパッチャのメトリクス"""
+        return {
+            "active_keys": len(self._active),
+            "pending": sum(1 for s in self._active.values() if s.pending is not None),
+            "executed": self.executed,
+            "superseded": self.superseded,
+            "tracked_versions": len(self._applied),
+        }
+
+
+# シングルトンインスタンス
+keyed_dispatcher = KeyedDispatcher(
+    concurrency=settings.KEYED_DISPATCHER_CONCURRENCY,
+    version_cache_size=settings.KEYED_DISPATCHER_VERSION_CACHE_SIZE,
+)
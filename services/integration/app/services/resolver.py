@@ -2,18 +2,42 @@
 顧客コード解決ヘルパー
 customer_code → customer_id 変換
 """
-import httpx
-from typing import Optional
+import asyncio
+import re
+from typing import Any, Dict, Iterable, List, Optional
+from ..core.cache import AsyncTTLCache
+from ..core.circuit_breaker import circuit_breakers
+from ..core.http_client import http_client_pool
 from ..core.oauth2 import oauth2_client
 from ..core.config import get_settings
 from ..core.logging import logger
+from ..core.rate_limiter import HostRateLimiter
+from ..core.retry import PermanentFailure
+from ..core.timing import stage
 
 settings = get_settings()
 
+_UUID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$",
+    re.IGNORECASE,
+)
+
+# customer_code → customer_id キャッシュ（未検出はネガティブキャッシュ）
+customer_id_cache = AsyncTTLCache(
+    max_entries=settings.RESOLVER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESOLVER_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.RESOLVER_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+# M2M顧客検索のレート制限（サーバ側 100req/分 に合わせる）
+resolver_rate_limiter = HostRateLimiter(
+    "resolver", settings.RESOLVER_RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST
+)
+
 
 async def resolve_customer_id(customer_code: str) -> Optional[str]:
     """
-    顧客コードからIDを解決
+    顧客コードからIDを解決（キャッシュ経由）
     
     Args:
         customer_code: 顧客コード
@@ -21,37 +45,55 @@ async def resolve_customer_id(customer_code: str) -> Optional[str]:
     Returns:
         顧客ID（見つからない場合はNone）
     """
-    token = await oauth2_client.get_token()
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.customer_api_base_url}/api/m2m/customers/search",
-            params={"q": customer_code, "limit": 1},
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Cache-Control": "no-store",
-            },
-            timeout=10.0,
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        if data and len(data) > 0:
-            # codeが完全一致するものを探す
-            for customer in data:
-                if customer.get("code") == customer_code:
-                    logger.info(
-                        "customer_resolved",
-                        customer_code=customer_code,
-                        customer_id=customer["id"],
-                    )
-                    return customer["id"]
+    return await customer_id_cache.get_or_load(
+        customer_code, lambda: _search_customer_id(customer_code)
+    )
+
+
+async def _search(params: Dict[str, Any]) -> Any:
+    """M2M検索API呼び出し（認証・レート制限・ブレーカ付き）"""
+    with stage("customer_search"):
+        token = await oauth2_client.get_token(settings.oauth2_search_scope)
         
-        logger.warning(
-            "customer_not_found",
-            customer_code=customer_code,
+        url = f"{settings.customer_api_base_url}/api/m2m/customers/search"
+        await resolver_rate_limiter.acquire(url)
+        client = http_client_pool.client_for(url)
+        response = await circuit_breakers.for_url(url).call(
+            lambda: client.get(
+                url,
+                params=params,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Cache-Control": "no-store",
+                },
+                timeout=10.0,
+            )
         )
-        return None
+        resolver_rate_limiter.observe(url, response)
+        response.raise_for_status()
+        return response.json()
+
+
+async def _search_customer_id(customer_code: str) -> Optional[str]:
+    """M2M検索APIで顧客コードを照会"""
+    data = await _search({"q": customer_code, "limit": 1})
+    
+    if data and len(data) > 0:
+        # codeが完全一致するものを探す
+        for customer in data:
+            if customer.get("code") == customer_code:
+                logger.info(
+                    "customer_resolved",
+                    customer_code=customer_code,
+                    customer_id=customer["id"],
+                )
+                return customer["id"]
+    
+    logger.warning(
+        "customer_not_found",
+        customer_code=customer_code,
+    )
+    return None
 
 
 async def ensure_customer_id(code_or_id: str) -> str:
@@ -65,21 +107,79 @@ async def ensure_customer_id(code_or_id: str) -> str:
         顧客ID
         
     Raises:
-        ValueError: 顧客が見つからない場合
+        PermanentFailure: 顧客が見つからない場合
     """
     # UUID形式ならそのまま返す
-    import re
-    uuid_pattern = re.compile(
-        r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$",
-        re.IGNORECASE,
-    )
-    if uuid_pattern.match(code_or_id):
+    if _UUID_PATTERN.match(code_or_id):
         return code_or_id
     
     # コードとして解決
     customer_id = await resolve_customer_id(code_or_id)
     if not customer_id:
-        raise ValueError(f"Customer not found with code: {code_or_id}")
+        raise PermanentFailure(f"Customer not found with code: {code_or_id}")
     
     return customer_id
 
+
+async def resolve_customer_ids(codes: Iterable[str]) -> Dict[str, str]:
+    """
+    顧客コード（またはID）を一括解決（補助Pullのページ単位）
+    重複除去→キャッシュ参照（ロード中のコードは相乗り）→未解決分をチャンク分割して並列照会
+    
+    Args:
+        codes: 顧客コードまたはIDの一覧（重複可）
+        
+    Returns:
+        コード→顧客IDのマップ（見つからないコードは含まない）
+    """
+    resolved: Dict[str, str] = {}
+    lookup_codes: List[str] = []
+    for code in dict.fromkeys(c for c in codes if c):
+        if _UUID_PATTERN.match(code):
+            resolved[code] = code
+        else:
+            lookup_codes.append(code)
+    
+    if not lookup_codes:
+        return resolved
+    
+    async def load(missing: List[str]) -> Dict[str, str]:
+        chunk_size = settings.RESOLVER_BULK_CHUNK_SIZE
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        semaphore = asyncio.Semaphore(settings.RESOLVER_BULK_CONCURRENCY)
+        
+        async def fetch_chunk(chunk: List[str]) -> Dict[str, str]:
+            async with semaphore:
+                return await _search_customer_ids(chunk)
+        
+        results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        found: Dict[str, str] = {}
+        for result in results:
+            found.update(result)
+        
+        logger.info(
+            "customers_bulk_resolved",
+            requested=len(lookup_codes),
+            reused=len(lookup_codes) - len(missing),
+            fetched=len(missing),
+            not_found=len(missing) - len(found),
+            requests=len(chunks),
+        )
+        return found
+    
+    # キャッシュ・他の呼び出しがロード中のコードはそれを使い、残りのみ照会（未検出はネガティブキャッシュ）
+    values = await customer_id_cache.get_or_load_many(lookup_codes, load)
+    resolved.update({code: cid for code, cid in values.items() if cid})
+    return resolved
+
+
+async def _search_customer_ids(codes: List[str]) -> Dict[str, str]:
+    """M2M検索APIで顧客コードを一括照会（codesパラメータ、最大100件）"""
+    data = await _search({"codes": ",".join(codes), "limit": len(codes)})
+    
+    wanted = set(codes)
+    return {
+        customer["code"]: customer["id"]
+        for customer in data or []
+        if customer.get("code") in wanted
+    }
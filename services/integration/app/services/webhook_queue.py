@@ -0,0 +1,175 @@
+"""
+Webhook非同期処理キュー
+受信時は検証とジョブ登録のみ行い、反映処理はワーカープールで実行
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from ..core.config import get_settings
+
+logger = structlog.get_logger()
+settings = get_settings()
+
+
+class QueueFullError(Exception):
+    """バックログ上限超過または停止中（呼び出し元は503を返す）"""
+
+
+# ワーカーへ渡す処理（コルーチン関数, ログ用コンテキスト）
+WorkItem = Tuple[Callable[[], Awaitable[Any]], Dict[str, Any]]
+
+
+class WebhookWorkerPool:
+    """
+    インプロセスのasyncioワーカープール
+    受付済みジョブは永続キュー（job_store）に置き、空きワーカー分だけリース付きで取得して実行する
+    （受付時の通知で即時取得、加えて一定間隔でポーリングし他プロセスの受付分・回収分も拾う）
+    バックログ上限で受付にバックプレッシャーをかけ、終了時は取得済みの分を処理してから停止する
+    """
+
+    def __init__(self, concurrency: int, max_queue_size: int):
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        # 未処理ジョブ数（取得時に永続キューから再計算し、受付ごとに加算）
+        self.backlog = 0
+        # 処理中のワーカー数（取得はワーカー数から処理中・取得済みを引いた空き分のみ）
+        self.busy = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._feeder: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._claim: Optional[Callable[[int], Awaitable[List[WorkItem]]]] = None
+        self._count_backlog: Optional[Callable[[], Awaitable[int]]] = None
+        self._accepting = False
+
+    @property
+    def depth(self) -> int:
+        """取得済みでワーカー待ちの件数"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(
+        self,
+        claim: Callable[[int], Awaitable[List[WorkItem]]],
+        count_backlog: Callable[[], Awaitable[int]],
+    ):
+        """
+        ワーカー・取得タスク起動
+
+        Args:
+            claim: 最大件数を受け取り、リース取得したジョブの処理を返す
+            count_backlog: 永続キュー上の未処理ジョブ数を返す
+        """
+        self._claim = claim
+        self._count_backlog = count_backlog
+        # 取得済みの滞留はワーカー数までに抑える（残りは永続キューに置いたまま）
+        self._queue = asyncio.Queue(maxsize=self.concurrency)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self._feeder = asyncio.create_task(self._feed(), name="webhook-feeder")
+        self._accepting = True
+        logger.info(
+            "webhook_worker_pool_started",
+            concurrency=self.concurrency,
+            max_queue_size=self.max_queue_size,
+        )
+
+    def admit(self, context: Optional[Dict[str, Any]] = None):
+        """
+        受付可否の判定（受付する場合はバックログに加算）
+
+        Args:
+            context: ログ用コンテキスト（event_id等）
+
+        Raises:
+            QueueFullError: バックログ上限超過または停止中
+        """
+        if not self._accepting:
+            raise QueueFullError("Worker pool is not accepting events")
+        if self.backlog >= self.max_queue_size:
+            logger.warning("webhook_queue_full", backlog=self.backlog, **(context or {}))
+            raise QueueFullError("Webhook queue is full")
+        self.backlog += 1
+
+    def wakeup(self):
+        """永続キューへの投入を通知（ポーリング間隔を待たずに取得）"""
+        self._wakeup.set()
+
+    async def _feed(self):
+        assert self._queue is not None and self._claim is not None
+        assert self._count_backlog is not None
+        while True:
+            self._wakeup.clear()
+            try:
+                # 取得時点でリースが始まるため、すぐに実行できる分だけ取得する
+                free = self.concurrency - self.busy - self._queue.qsize()
+                if free > 0:
+                    for item in await self._claim(free):
+                        self._queue.put_nowait(item)
+                    self.backlog = await self._count_backlog()
+            except Exception as e:
+                logger.error("webhook_feed_failed", error=str(e))
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=settings.WEBHOOK_QUEUE_POLL_INTERVAL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, worker_id: int):
+        assert self._queue is not None
+        while True:
+            handler, context = await self._queue.get()
+            self.busy += 1
+            try:
+                await handler()
+            except Exception as e:
+                # 失敗の記録はhandler側（job_tracker）で行う
+                logger.error(
+                    "webhook_worker_failed",
+                    worker_id=worker_id,
+                    error=str(e),
+                    **context,
+                )
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+                # 空きができたので未処理が残っていれば続けて取得
+                if self.backlog > 0:
+                    self._wakeup.set()
+
+    async def stop(self, timeout: float):
+        """
+        新規受付・取得を止め、取得済みの分を処理してから停止
+        （時間内に終わらなかったジョブはリース切れ後に回収される）
+
+        Args:
+            timeout: 取得済みの分の処理を待つ最大秒数
+        """
+        self._accepting = False
+        if self._feeder is not None:
+            self._feeder.cancel()
+            await asyncio.gather(self._feeder, return_exceptions=True)
+            self._feeder = None
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("webhook_queue_drain_timeout", remaining=self.depth)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("webhook_worker_pool_stopped", remaining=self.depth)
+
+
+# シングルトンインスタンス
+webhook_worker_pool = WebhookWorkerPool(
+    concurrency=settings.WEBHOOK_WORKER_CONCURRENCY,
+    max_queue_size=settings.WEBHOOK_QUEUE_MAX_SIZE,
+)
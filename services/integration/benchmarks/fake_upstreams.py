@@ -0,0 +1,195 @@
+"""
+ベンチマーク用の上流スタンドイン
+OAuth2トークン、M2M顧客検索、内部upsert（単体・一括）、外部発注/測定APIを1プロセスで提供する
+経路グループ（oauth / search / upsert / external）ごとに遅延・エラー率・429注入を設定できる
+
+Usage:
+    python -m benchmarks.fake_upstreams --port 9100 --latency-ms 20 --error-rate 0.01 \\
+        --faults '{"upsert": {"throttle_rate": 0.02, "retry_after": 1}}'
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+GROUPS = ("oauth", "search", "upsert", "external")
+
+
+@dataclass
+class FaultConfig:
+    """経路グループの障害注入設定"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0  # 503を返す割合
+    throttle_rate: float = 0.0  # 429を返す割合
+    retry_after: float = 1.0  # 429のRetry-After秒
+
+
+@dataclass
+class GroupStats:
+    requests: int = 0
+    errors_injected: int = 0
+    throttled: int = 0
+
+
+@dataclass
+class FakeUpstreamConfig:
+    customers: int = 10000  # 顧客コード C000000 〜
+    external_items: int = 1000  # 外部APIの総件数（ページング）
+    faults: Dict[str, FaultConfig] = field(default_factory=dict)
+    stats: Dict[str, GroupStats] = field(default_factory=dict)
+
+    def fault(self, group: str) -> FaultConfig:
+        return self.faults.get(group) or FaultConfig()
+
+
+def customer_code(index: int) -> str:
+    return f"C{index:06d}"
+
+
+def customer_id(code: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, code))
+
+
+def create_app(config: FakeUpstreamConfig) -> FastAPI:
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    for group in GROUPS:
+        config.stats.setdefault(group, GroupStats())
+
+    async def inject(group: str) -> Optional[JSONResponse]:
+        """遅延を入れ、注入対象なら 503 / 429 を返す"""
+        fault = config.fault(group)
+        stats = config.stats[group]
+        stats.requests += 1
+        delay = fault.latency_ms + random.uniform(-fault.jitter_ms, fault.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        roll = random.random()
+        if roll < fault.throttle_rate:
+            stats.throttled += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": "rate limited"},
+                headers={"Retry-After": str(fault.retry_after)},
+            )
+        if roll < fault.throttle_rate + fault.error_rate:
+            stats.errors_injected += 1
+            return JSONResponse(status_code=503, content={"error": "injected failure"})
+        return None
+
+    @app.post("/oauth/token")
+    async def token():
+        return await inject("oauth") or {"access_token": uuid.uuid4().hex, "expires_in": 3600}
+
+    @app.get("/api/m2m/customers/search")
+    async def search(q: Optional[str] = None, codes: Optional[str] = None):
+        failure = await inject("search")
+        if failure:
+            return failure
+        wanted = codes.split(",") if codes else [q] if q else []
+        return [
+            {"id": customer_id(code), "code": code}
+            for code in wanted
+            if code.startswith("C") and code[1:].isdigit() and int(code[1:]) < config.customers
+        ]
+
+    @app.post("/api/internal/{entity}/upsert")
+    async def upsert(entity: str, request: Request):
+        failure = await inject("upsert")
+        if failure:
+            return failure
+        record = await request.json()
+        return JSONResponse(status_code=201, content=[{"id": str(uuid.uuid4()), **record}])
+
+    @app.post("/api/internal/{entity}/upsert/bulk")
+    async def upsert_bulk(entity: str, request: Request):
+        failure = await inject("upsert")
+        if failure:
+            return failure
+        body = await request.json()
+        return {
+            "results": [
+                {"index": index, "status": "upserted", "id": str(uuid.uuid4())}
+                for index in range(len(body["records"]))
+            ]
+        }
+
+    @app.get("/external/{kind}/{entity}")
+    async def external(kind: str, entity: str, page: int = 1, page_size: int = 100):
+        failure = await inject("external")
+        if failure:
+            return failure
+        start = (page - 1) * page_size
+        items: List[Dict[str, Any]] = []
+        for i in range(start, min(start + page_size, config.external_items)):
+            items.append({
+                "external_order_id": f"ext-o{i}",
+                "external_measurement_id": f"ext-m{i}",
+                "customer_code": customer_code(i % config.customers),
+                "title": f"order {i}",
+                "status": "ordered",
+                "summary": {"value": i},
+                "updated_at": "2026-01-01T00:00:00+00:00",
+            })
+        return {"items": items}
+
+    @app.get("/__stats")
+    async def stats():
+        return {group: asdict(s) for group, s in config.stats.items()}
+
+    return app
+
+
+def parse_faults(default: FaultConfig, overrides: str) -> Dict[str, FaultConfig]:
+    """全グループ共通の設定に、グループ別の上書き（JSON）を適用"""
+    data = json.loads(overrides) if overrides else {}
+    unknown = set(data) - set(GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown fault groups: {sorted(unknown)}")
+    faults = {}
+    for group in GROUPS:
+        values = asdict(default)
+        values.update(data.get(group, {}))
+        faults[group] = FaultConfig(**values)
+    return faults
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    defaults = FaultConfig()
+    for f in fields(FaultConfig):
+        parser.add_argument(
+            f"--{f.name.replace('_', '-')}", type=float, default=getattr(defaults, f.name)
+        )
+    parser.add_argument(
+        "--faults", default="", help='グループ別の上書き（JSON）例: {"upsert": {"error_rate": 0.05}}'
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--external-items", type=int, default=1000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    default = FaultConfig(**{f.name: getattr(args, f.name) for f in fields(FaultConfig)})
+    config = FakeUpstreamConfig(
+        customers=args.customers,
+        external_items=args.external_items,
+        faults=parse_faults(default, args.faults),
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
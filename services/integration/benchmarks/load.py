@@ -0,0 +1,200 @@
+"""
+負荷生成と集計
+目標RPSで一定間隔に送信し（応答を待たずに次を送る open-loop）、
+レイテンシは予定送信時刻から計測する（サーバ滞留による送信遅れも含める）
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .fake_upstreams import customer_code
+
+# (path, body, headers)
+RequestSpec = Tuple[str, bytes, Dict[str, str]]
+
+
+def sign(secret: str, body: bytes) -> Dict[str, str]:
+    """Webhook署名ヘッダ（X-Timestamp / X-Signature）"""
+    timestamp = str(int(time.time()))
+    signature = hmac.new(
+        secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256
+    ).hexdigest()
+    return {"X-Timestamp": timestamp, "X-Signature": signature}
+
+
+def _order(customers: int, updates: int) -> Dict[str, Any]:
+    return {
+        "customer_code": customer_code(random.randrange(customers)),
+        "external_order_id": f"bench-o{random.randrange(updates)}",
+        "title": "benchmark order",
+        "status": "ordered",
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()),
+    }
+
+
+def _measurement(customers: int, updates: int) -> Dict[str, Any]:
+    return {
+        "customer_code": customer_code(random.randrange(customers)),
+        "external_measurement_id": f"bench-m{random.randrange(updates)}",
+        "summary": {"value": random.random()},
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()),
+    }
+
+
+def webhook_request(
+    scenario: str, secret: str, customers: int, updates: int, batch_size: int
+) -> RequestSpec:
+    """シナリオの1リクエスト分（イベントIDは毎回新規、署名は送信直前に生成）"""
+    if scenario == "orders":
+        path, data = "/webhooks/orders.updated", _order(customers, updates)
+    elif scenario == "measurements":
+        path, data = "/webhooks/measurements.updated", _measurement(customers, updates)
+    elif scenario == "batch":
+        events = []
+        for _ in range(batch_size):
+            if random.random() < 0.5:
+                event_type, payload = "orders.updated", _order(customers, updates)
+            else:
+                event_type, payload = "measurements.updated", _measurement(customers, updates)
+            events.append({"event_id": uuid.uuid4().hex, "event_type": event_type, "data": payload})
+        body = json.dumps(events).encode()
+        return "/webhooks/batch", body, {"Content-Type": "application/json", **sign(secret, body)}
+    else:
+        raise ValueError(f"Unknown webhook scenario: {scenario}")
+
+    body = json.dumps(data).encode()
+    headers = {"Content-Type": "application/json", "X-Event-Id": uuid.uuid4().hex}
+    return path, body, {**headers, **sign(secret, body)}
+
+
+def parse_server_timing(value: Optional[str]) -> Dict[str, float]:
+    """Server-Timing ヘッダ → 段階名: ミリ秒"""
+    stages: Dict[str, float] = {}
+    if not value:
+        return stages
+    for entry in value.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    stages[name] = float(number)
+                except ValueError:
+                    pass
+    return stages
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50 / p95 / p99 / max / mean（最近順位法、ミリ秒）"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[max(int(p * len(ordered) + 0.999999) - 1, 0)], 3)
+
+    return {
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": round(ordered[-1], 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+@dataclass
+class Sample:
+    scheduled: float
+    latency_ms: float
+    status: Optional[int]
+    stages: Dict[str, float]
+    error: Optional[str] = None
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    make_request: Callable[[], RequestSpec],
+    rps: float,
+    duration: float,
+    warmup: float = 0.0,
+    max_in_flight: int = 2000,
+    method: str = "POST",
+) -> Dict[str, Any]:
+    """
+    目標RPSで duration 秒送信して集計（warmup 秒分は集計から除外）
+
+    max_in_flight を超える同時実行が必要になった場合は送信を見送り、dropped として数える
+    """
+    samples: List[Sample] = []
+    in_flight: set = set()
+    dropped = 0
+    interval = 1.0 / rps
+    started = time.perf_counter()
+    total = int((warmup + duration) * rps)
+
+    async def send(scheduled: float, measured: bool):
+        path, body, headers = make_request()
+        try:
+            response = await client.request(method, path, content=body, headers=headers)
+            sample = Sample(
+                scheduled,
+                (time.perf_counter() - scheduled) * 1000,
+                response.status_code,
+                parse_server_timing(response.headers.get("server-timing")),
+            )
+        except Exception as e:
+            sample = Sample(scheduled, (time.perf_counter() - scheduled) * 1000, None, {}, type(e).__name__)
+        if measured:
+            samples.append(sample)
+
+    for i in range(total):
+        scheduled = started + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.create_task(send(scheduled, i >= warmup * rps))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    send_finished = time.perf_counter()
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    elapsed = time.perf_counter() - started - warmup
+
+    status_counts: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    stage_values: Dict[str, List[float]] = {}
+    for sample in samples:
+        if sample.status is None:
+            errors[sample.error or "error"] = errors.get(sample.error or "error", 0) + 1
+        else:
+            status_counts[str(sample.status)] = status_counts.get(str(sample.status), 0) + 1
+        for name, value in sample.stages.items():
+            stage_values.setdefault(name, []).append(value)
+
+    succeeded = [s.latency_ms for s in samples if s.status is not None and s.status < 400]
+    return {
+        "target_rps": rps,
+        "duration_seconds": duration,
+        "sent": len(samples),
+        "dropped": dropped,
+        "succeeded": len(succeeded),
+        "status_counts": status_counts,
+        "errors": errors,
+        "throughput_rps": round(len(succeeded) / elapsed, 2) if elapsed > 0 else None,
+        "send_lag_seconds": round(send_finished - (started + total * interval), 3),
+        "latency_ms": percentiles([s.latency_ms for s in samples]),
+        "success_latency_ms": percentiles(succeeded),
+        "stages_ms": {name: percentiles(values) for name, values in sorted(stage_values.items())},
+    }
@@ -0,0 +1,284 @@
+"""
+連携サービスのベンチマーク
+上流スタンドイン（benchmarks.fake_upstreams）とアプリ（uvicorn）を別プロセスで起動し、
+署名付きWebhook / 補助Pull同期を目標RPSで送信して結果をJSONで出力する
+
+Usage（services/integration で実行）:
+    python -m benchmarks.run --scenario orders --rps 200 --duration 30 --output var/bench/orders.json
+    python -m benchmarks.run --scenario batch --batch-size 100 --rps 5 --faults '{"upsert": {"latency_ms": 30}}'
+    python -m benchmarks.run --scenario orders --rps 200 --baseline var/bench/orders.json
+
+シナリオ: orders / measurements / batch（署名付きWebhook）、sync-orders / sync-measurements（全ページ同期）
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import fields
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .fake_upstreams import FaultConfig, add_fault_arguments, parse_faults
+from .load import run_load, webhook_request
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBHOOK_SECRET = "benchmark-secret"
+
+# サービス自体の処理能力を測るため、送信側のレート制限は十分大きくする（--production-limits で既定値のまま）
+_UNLIMITED = {
+    "RATE_LIMIT_PER_MINUTE": "6000000",
+    "RATE_LIMIT_BURST": "10000",
+    "CUSTOMER_API_RATE_LIMIT_PER_MINUTE": "6000000",
+    "CUSTOMER_API_RATE_LIMIT_BURST": "10000",
+    "RESOLVER_RATE_LIMIT_PER_MINUTE": "6000000",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SERVICE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Process exited before ready: {url} (code {process.returncode})")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def _app_env(args: argparse.Namespace, upstream: str, workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_SERVICE_ROLE_KEY": "benchmark",
+        "webhook_secret": WEBHOOK_SECRET,
+        "oauth2_token_url": f"{upstream}/oauth/token",
+        "oauth2_client_id": "benchmark",
+        "oauth2_client_secret": "benchmark",
+        "customer_api_base_url": upstream,
+        "external_ordering_api_url": f"{upstream}/external/ordering",
+        "external_measurement_api_url": f"{upstream}/external/measurement",
+        "external_api_key": "benchmark",
+        "IDEMPOTENCY_SQLITE_PATH": os.path.join(workdir, "idempotency.db"),
+        "JOB_QUEUE_DB_PATH": os.path.join(workdir, "integration_jobs.db"),
+        "SYNC_CHECKPOINT_DB_PATH": os.path.join(workdir, "sync_checkpoints.db"),
+    })
+    if args.workers > 1:
+        env["METRICS_MULTIPROC_DIR"] = os.path.join(workdir, "metrics")
+    if not args.production_limits:
+        env.update(_UNLIMITED)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def _compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """基準結果との差分（%、正は増加）"""
+
+    def delta(current: Optional[float], previous: Optional[float]) -> Optional[float]:
+        if current is None or not previous:
+            return None
+        return round((current - previous) / previous * 100, 1)
+
+    result = report["result"]
+    base = baseline["result"]
+    return {
+        "baseline_commit": baseline.get("commit"),
+        "throughput_rps_pct": delta(result["throughput_rps"], base["throughput_rps"]),
+        "latency_ms_pct": {
+            key: delta(result["latency_ms"][key], base["latency_ms"][key])
+            for key in ("p50", "p95", "p99")
+        },
+        "stages_p95_pct": {
+            name: delta(stats["p95"], base["stages_ms"].get(name, {}).get("p95"))
+            for name, stats in result["stages_ms"].items()
+        },
+    }
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    upstream_port = args.upstream_port or _free_port()
+    app_port = args.app_port or _free_port()
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    workdir = tempfile.mkdtemp(prefix="integration-bench-")
+    app_log = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+
+    fault_args: List[str] = []
+    for f in fields(FaultConfig):
+        fault_args += [f"--{f.name.replace('_', '-')}", str(getattr(args, f.name))]
+    upstream_process = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_upstreams",
+            "--port", str(upstream_port),
+            "--customers", str(args.customers),
+            "--external-items", str(args.sync_items),
+            "--faults", args.faults,
+            *fault_args,
+        ],
+        cwd=SERVICE_DIR,
+    )
+    app_process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1",
+            "--port", str(app_port),
+            "--workers", str(args.workers),
+            "--no-access-log",
+        ],
+        cwd=SERVICE_DIR,
+        env=_app_env(args, upstream, workdir),
+        stdout=app_log,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        await _wait_ready(f"{upstream}/__stats", upstream_process)
+        await _wait_ready(f"{app_url}/health", app_process)
+
+        if args.scenario.startswith("sync-"):
+            entity = args.scenario.split("-", 1)[1]
+            path = (
+                f"/sync/{entity}?all_pages=true&page_size={args.sync_page_size}"
+                f"&bulk={str(args.sync_bulk).lower()}&updated_since=2000-01-01T00:00:00Z"
+            )
+
+            def make_request():
+                return path, b"", {}
+        else:
+            def make_request():
+                return webhook_request(
+                    args.scenario, WEBHOOK_SECRET, args.customers, args.updates, args.batch_size
+                )
+
+        limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+            result = await run_load(
+                client,
+                make_request,
+                rps=args.rps,
+                duration=args.duration,
+                warmup=args.warmup,
+                max_in_flight=args.max_in_flight,
+            )
+            upstream_stats = (await client.get(f"{upstream}/__stats")).json()
+            health = (await client.get("/health")).json()
+    finally:
+        for process in (app_process, upstream_process):
+            process.terminate()
+        for process in (app_process, upstream_process):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if app_log is not subprocess.DEVNULL:
+            app_log.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "commit": _git_commit(),
+        "scenario": args.scenario,
+        "config": {
+            "rps": args.rps,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "workers": args.workers,
+            "batch_size": args.batch_size if args.scenario == "batch" else None,
+            "customers": args.customers,
+            "updates": args.updates,
+            "production_limits": args.production_limits,
+            "faults": {
+                group: vars(fault)
+                for group, fault in parse_faults(
+                    FaultConfig(**{f.name: getattr(args, f.name) for f in fields(FaultConfig)}),
+                    args.faults,
+                ).items()
+            },
+            "env": args.env,
+        },
+        "result": result,
+        "upstream": upstream_stats,
+        "service": {
+            key: health.get(key)
+            for key in ("circuit_breakers", "retry", "rate_limits", "resolver_cache", "logging")
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        "--scenario",
+        choices=["orders", "measurements", "batch", "sync-orders", "sync-measurements"],
+        default="orders",
+    )
+    parser.add_argument("--rps", type=float, default=50.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-in-flight", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=10000, help="顧客コードの種類数")
+    parser.add_argument("--updates", type=int, default=100000, help="発注・測定IDの種類数")
+    parser.add_argument("--sync-items", type=int, default=1000)
+    parser.add_argument("--sync-page-size", type=int, default=100)
+    parser.add_argument("--sync-bulk", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=0)
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--app-log", default="", help="アプリのログ出力先（未指定は破棄）")
+    parser.add_argument(
+        "--production-limits", action="store_true", help="送信レート制限を設定値のまま使う"
+    )
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE", help="アプリの設定上書き"
+    )
+    parser.add_argument("--output", default="", help="結果JSONの出力先")
+    parser.add_argument("--baseline", default="", help="比較する過去の結果JSON")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(_run(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = _compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()